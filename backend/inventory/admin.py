@@ -1,37 +1,112 @@
+from decimal import Decimal
+
 from django.contrib import admin
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce
+from .bulk import finish_batches, reset_alert_thresholds
+from .cache import bump_data_version
 from .models import Product, StockBatch, PartialDepletion, LowStockAlert
 
 # Register  models
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'current_stock', 'default_sell_price', 'is_active', 'created_at']
+    list_display = ['name', 'user', 'category', 'current_stock', 'stock_value', 'open_batches',
+                    'default_sell_price', 'is_active', 'created_at']
     list_filter = ['is_active', 'category', 'created_at']
+    list_select_related = ['user']
     search_fields = ['name', 'category']
     readonly_fields = ['total_value', 'created_at']
+    raw_id_fields = ['user']
+
+    def get_queryset(self, request):
+        decimal_field = DecimalField(max_digits=20, decimal_places=2)
+        # Same names as with_stock_summary(), so Product.current_stock and total_value use them
+        return super().get_queryset(request).annotate(
+            stock_total=Coalesce('stock_summary__on_hand_quantity', Value(Decimal('0')), output_field=decimal_field),
+            stock_value=Coalesce('stock_summary__on_hand_value', Value(Decimal('0')), output_field=decimal_field),
+            open_batch_count=Coalesce('stock_summary__active_batches', Value(0)),
+        )
+
+    @admin.display(description='Current stock', ordering='stock_total')
+    def current_stock(self, obj):
+        return obj.stock_total
+
+    @admin.display(description='Stock value', ordering='stock_value')
+    def stock_value(self, obj):
+        return obj.stock_value
+
+    @admin.display(description='Open batches', ordering='open_batch_count')
+    def open_batches(self, obj):
+        return obj.open_batch_count
 
 
 
 @admin.register(StockBatch)
 class StockBatchAdmin(admin.ModelAdmin):
-    list_display = ['product', 'quantity', 'remaining_quantity', 'buy_price_per_unit', 
+    list_display = ['product', 'quantity', 'remaining_quantity', 'remaining_value', 'buy_price_per_unit',
     'sell_price_per_unit', 'is_depleted', 'added_at', 'depleted_at']
     list_filter = ['is_depleted', 'depleted_at', 'added_at']
+    list_select_related = ['product']
     search_fields = ['product__name', 'notes']
     readonly_fields = ['estimated_profit', 'profit_margin', 'days_in_stock', 'velocity']
+    raw_id_fields = ['product']
     date_hierarchy = 'added_at'
+    show_full_result_count = False
+    actions = ['finish_selected']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(remaining_value_total=ExpressionWrapper(
+            F('remaining_quantity') * F('buy_price_per_unit'),
+            output_field=DecimalField(max_digits=20, decimal_places=2)
+        ))
+
+    @admin.display(description='Remaining value', ordering='remaining_value_total')
+    def remaining_value(self, obj):
+        return obj.remaining_value_total
+
+    @admin.action(description='Mark selected batches as finished')
+    def finish_selected(self, request, queryset):
+        finished = finish_batches(queryset)
+        self.message_user(request, f'Marked {finished} batches as finished.')
 
 @admin.register(PartialDepletion)
 class PartialDepletionAdmin(admin.ModelAdmin):
     list_display = ['batch', 'quantity_used', 'recorded_at']
     list_filter = ['recorded_at']
+    list_select_related = ['batch__product']
     search_fields = ['batch__product__name', 'notes']
+    raw_id_fields = ['batch']
     date_hierarchy = 'recorded_at'
+    show_full_result_count = False
 
 
 @admin.register(LowStockAlert)
 class LowStockAlertAdmin(admin.ModelAdmin):
-    list_display = ['product', 'threshold_quantity', 'is_active', 'is_triggered', 'created_at']
-    list_filter = ['is_active', 'created_at']
+    list_display = ['product', 'threshold_quantity', 'last_evaluated_stock', 'is_active', 'is_triggered',
+                    'evaluated_at', 'created_at']
+    list_filter = ['is_active', 'is_triggered', 'created_at']
+    list_select_related = ['product']
     search_fields = ['product__name']
-    readonly_fields = ['is_triggered']
+    readonly_fields = ['is_triggered', 'last_evaluated_stock', 'evaluated_at']
+    raw_id_fields = ['product']
+    actions = ['reset_thresholds', 'activate', 'deactivate']
+
+    @admin.action(description='Reset thresholds to a fifth of current stock')
+    def reset_thresholds(self, request, queryset):
+        reset = reset_alert_thresholds(queryset)
+        self.message_user(request, f'Reset {reset} alert thresholds.')
+
+    @admin.action(description='Activate selected alerts')
+    def activate(self, request, queryset):
+        self._set_active(request, queryset, True)
+
+    @admin.action(description='Deactivate selected alerts')
+    def deactivate(self, request, queryset):
+        self._set_active(request, queryset, False)
 
+    def _set_active(self, request, queryset, active):
+        user_ids = set(queryset.values_list('product__user_id', flat=True).distinct())
+        updated = queryset.update(is_active=active)
+        for user_id in user_ids:
+            bump_data_version(user_id)
+        self.message_user(request, f"{'Activated' if active else 'Deactivated'} {updated} alerts.")
@@ -0,0 +1,130 @@
+import numpy as np
+from django.db.models import FloatField, Value
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .expressions import EpochSeconds
+from .models import StockBatch
+
+SECONDS_PER_DAY = 86400
+
+BATCH_DTYPE = np.dtype([
+    ('product_id', np.int64),
+    ('quantity', float),
+    ('remaining_quantity', float),
+    ('buy_price_per_unit', float),
+    ('added_at', float),
+    ('depleted_at', float),
+    ('is_depleted', bool),
+])
+
+# Epoch seconds standing in for a missing depleted_at, so rows parse straight into BATCH_DTYPE
+NOT_DEPLETED = -1.0
+
+
+def load_batches(queryset):
+    """Read the batch columns analytics needs with one values_list query.
+
+    The database casts decimals to floats and timestamps to epoch seconds, so
+    rows arrive as plain numbers and no per-row conversion runs in Python.
+    """
+    rows = queryset.order_by().values_list(
+        'product_id',
+        Cast('quantity', FloatField()),
+        Cast('remaining_quantity', FloatField()),
+        Cast('buy_price_per_unit', FloatField()),
+        EpochSeconds('added_at'),
+        Coalesce(EpochSeconds('depleted_at'), Value(NOT_DEPLETED)),
+        'is_depleted',
+    )
+    return batch_arrays(list(rows))
+
+
+def user_batches(user):
+    return load_batches(StockBatch.objects.filter(product__user=user))
+
+
+def batch_arrays(rows):
+    """Column arrays from BATCH_DTYPE-shaped tuples; a missing depleted_at becomes NaN"""
+    table = np.fromiter(rows, dtype=BATCH_DTYPE, count=len(rows))
+    arrays = {name: np.ascontiguousarray(table[name]) for name in BATCH_DTYPE.names}
+    arrays['depleted_at'][arrays['depleted_at'] == NOT_DEPLETED] = np.nan
+    return arrays
+
+
+def percentile_rank(values, mask=None):
+    """Share of the (masked) values at or below each value, 0-100; NaN outside the mask"""
+    if mask is None:
+        mask = np.ones(len(values), dtype=bool)
+    ranks = np.full(len(values), np.nan)
+    population = np.sort(values[mask])
+    if len(population):
+        ranks[mask] = np.searchsorted(population, values[mask], side='right') * 100.0 / len(population)
+    return ranks
+
+
+def product_stats(batches, now=None):
+    """Per-product velocity, turnover and stock figures, grouped with bincount.
+
+    Matches the StockBatch.days_in_stock and velocity properties: whole days in
+    stock, at least one, measured to depletion or to now for open batches.
+    Depleted figures (velocity, turnover) cover finished batches; the active
+    ones (velocity, on hand, days until empty) cover open batches, as
+    Product.average_velocity and the stock ledger do. All arrays are aligned
+    with the sorted 'product_id' array.
+    """
+    now_ts = (now or timezone.now()).timestamp()
+    ids, group = np.unique(batches['product_id'], return_inverse=True)
+    size = len(ids)
+
+    finished = batches['is_depleted'] & ~np.isnan(batches['depleted_at'])
+    active = ~batches['is_depleted']
+    end = np.where(finished, batches['depleted_at'], now_ts)
+    days = np.maximum(np.floor((end - batches['added_at']) / SECONDS_PER_DAY), 1)
+    velocity = (batches['quantity'] - batches['remaining_quantity']) / days
+
+    def grouped_sum(values, mask):
+        return np.bincount(group, weights=np.where(mask, values, 0.0), minlength=size)
+
+    def grouped_mean(values, mask):
+        count = np.bincount(group, weights=mask.astype(float), minlength=size)
+        mean = np.divide(grouped_sum(values, mask), count, out=np.zeros(size), where=count > 0)
+        return mean, count.astype(np.int64)
+
+    depleted_velocity, depleted_count = grouped_mean(velocity, finished)
+    turnover_days, _ = grouped_mean(days, finished)
+    active_velocity, active_count = grouped_mean(velocity, active)
+    on_hand = grouped_sum(batches['remaining_quantity'], active)
+    on_hand_value = grouped_sum(batches['remaining_quantity'] * batches['buy_price_per_unit'], active)
+
+    days_until_empty = np.full(size, np.nan)
+    moving = active_velocity > 0
+    days_until_empty[moving] = on_hand[moving] / active_velocity[moving]
+
+    return {
+        'product_id': ids,
+        'depleted_velocity': depleted_velocity,
+        'depleted_count': depleted_count,
+        'turnover_days': turnover_days,
+        'depleted_velocity_percentile': percentile_rank(depleted_velocity, depleted_count > 0),
+        'active_velocity': active_velocity,
+        'active_count': active_count,
+        'active_velocity_percentile': percentile_rank(active_velocity, active_count > 0),
+        'on_hand': on_hand,
+        'on_hand_value': on_hand_value,
+        'days_until_empty': days_until_empty,
+    }
+
+
+def ranked_movers(stats, names):
+    """Products with finished batches, fastest first, as plain rows for the views"""
+    rows = [{
+        'product_id': int(pid),
+        'product_name': names.get(int(pid), ''),
+        'velocity': float(stats['depleted_velocity'][i]),
+        'turnover': float(stats['turnover_days'][i]),
+        'batches': int(stats['depleted_count'][i]),
+        'percentile': float(stats['depleted_velocity_percentile'][i]),
+    } for i, pid in enumerate(stats['product_id']) if stats['depleted_count'][i] > 0]
+    rows.sort(key=lambda r: (-r['velocity'], r['product_name']))
+    return rows
@@ -0,0 +1,102 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+from .cache import (
+    get_cache, record_cache_outcome, set_validators, shared_cache, tenant_cache_key, tenant_validators,
+)
+from .sse import authenticate
+from .views import (
+    dashboard_parts, dashboard_payload, report_parts, report_payload, insight_parts, insight_payload
+)
+
+
+def _on_own_connection(query):
+    def run():
+        # Worker threads outlive requests, so release their connection like a request would
+        close_old_connections()
+        try:
+            return query()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_parts(parts):
+    """Run a view's independent queries concurrently.
+
+    Django's async ORM still sends every query through the one thread-sensitive
+    executor, one at a time, so each part runs in a worker thread on its own
+    connection instead. INVENTORY_ASYNC_PARALLEL_QUERIES=False keeps them on the
+    shared thread, e.g. inside a test transaction other connections cannot see.
+    """
+    parallel = getattr(settings, 'INVENTORY_ASYNC_PARALLEL_QUERIES', True)
+    names = list(parts)
+    results = await asyncio.gather(*(
+        sync_to_async(_on_own_connection(parts[name]) if parallel else parts[name],
+                      thread_sensitive=not parallel)()
+        for name in names
+    ))
+    return dict(zip(names, results))
+
+
+def tenant_view(name):
+    """Async GET endpoint authenticated by JWT, sharing the tenant cache of the matching DRF view"""
+    def decorator(build):
+        @wraps(build)
+        async def view(request):
+            if request.method != 'GET':
+                return JsonResponse({'error': 'Method not allowed'}, status=405)
+            header = request.headers.get('Authorization', '')
+            user, _ = await authenticate(header[7:]) if header.startswith('Bearer ') else (None, None)
+            if user is None:
+                return JsonResponse(
+                    {'error': 'Authentication credentials were not provided or are invalid'}, status=401
+                )
+
+            etag, modified = await sync_to_async(tenant_validators)(user.pk, 'json')
+            not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+            if not_modified is not None:
+                return set_validators(not_modified, etag, modified)
+
+            if not shared_cache():
+                data = await build(user)
+                response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+                return set_validators(response, etag, modified)
+
+            cache = get_cache()
+            key = await sync_to_async(tenant_cache_key)(name, user.pk)
+            data = await cache.aget(key)
+            outcome = 'HIT'
+            if data is None:
+                outcome = 'MISS'
+                data = await build(user)
+                await cache.aset(key, data, getattr(settings, 'INVENTORY_CACHE_TIMEOUT', 300))
+            record_cache_outcome(name, 'hits' if outcome == 'HIT' else 'misses')
+
+            response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+            response['X-Cache'] = outcome
+            return set_validators(response, etag, modified)
+        return view
+    return decorator
+
+
+@tenant_view('dashboard')
+async def dashboard(user):
+    return dashboard_payload(user, await gather_parts(dashboard_parts(user)))
+
+
+@tenant_view('reports')
+async def reports(user):
+    return report_payload(await gather_parts(report_parts(user)))
+
+
+@tenant_view('insights')
+async def insights(user):
+    return insight_payload(await gather_parts(insight_parts(user)))
@@ -0,0 +1,147 @@
+import platform
+import subprocess
+import time
+from contextlib import contextmanager
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .metrics import QueryRecorder
+
+# Route name and query parameters of every endpoint the benchmark times
+ENDPOINTS = {
+    'product-list': {},
+    'batch-list': {},
+    'batch-active': {},
+    'dashboard-list': {},
+    'report-list': {},
+    'report-by-product': {},
+    'report-monthly': {},
+    'report-history': {},
+    'report-export': {'format': 'csv'},
+    'report-valuation': {},
+    'insight-list': {},
+    'insight-velocity': {},
+    'insight-forecast': {},
+    'alert-list': {},
+    'alert-triggered': {},
+}
+
+
+@contextmanager
+def in_process_requests(cached=False):
+    """Settings for driving the API through the test client outside the test runner.
+
+    Unless cached, the tenant cache is swapped for a dummy one so every request
+    computes its response.
+    """
+    overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+    if not cached:
+        overrides['CACHES'] = {
+            **settings.CACHES, 'uncached': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        }
+        overrides['INVENTORY_CACHE_ALIAS'] = 'uncached'
+    with override_settings(**overrides):
+        yield
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_requests(client, path, params, repeat):
+    """Wall times of repeat requests and the query counts of the last one"""
+    timings = []
+    for _ in range(repeat):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = client.get(path, params)
+            size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+        timings.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} answered {response.status_code}')
+    return timings, recorder.sample(timings[-1]), size
+
+
+def run_benchmark(users, endpoints=tuple(ENDPOINTS), repeat=5, warmup=1, cached=False):
+    """Time every endpoint for every tenant; the result is plain JSON data.
+
+    Latencies pool all tenants' timed requests. Query counts are the largest
+    any tenant needed, so a change in them is exact rather than noise.
+    """
+    results = {}
+    with in_process_requests(cached):
+        clients = [Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}') for user in users]
+        for name in endpoints:
+            path = reverse(name)
+            params = ENDPOINTS[name]
+            timings, queries, duplicates, similar, size = [], 0, 0, 0, 0
+            for client in clients:
+                if warmup:
+                    time_requests(client, path, params, warmup)
+                taken, sample, size = time_requests(client, path, params, repeat)
+                timings.extend(taken)
+                queries = max(queries, sample['queries'])
+                duplicates = max(duplicates, sample['duplicates'])
+                similar = max(similar, sample['similar'])
+
+            ms = np.array(timings) * 1000
+            results[name] = {
+                'path': path,
+                'requests': len(timings),
+                'p50_ms': round(float(np.percentile(ms, 50)), 2),
+                'p95_ms': round(float(np.percentile(ms, 95)), 2),
+                'mean_ms': round(float(ms.mean()), 2),
+                'min_ms': round(float(ms.min()), 2),
+                'queries': queries,
+                'duplicates': duplicates,
+                'similar': similar,
+                'bytes': size,
+            }
+    return results
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'database': connection.vendor,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def regressions(baseline, current, max_slowdown=1.5, min_delta_ms=2.0):
+    """Endpoints that got slower than the baseline allows or started running more queries.
+
+    Only a slowdown of both the median and the fastest request counts, and one
+    under min_delta_ms is ignored, as timer noise on fast endpoints.
+    """
+    found = []
+    for name, now in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        if now['queries'] > before['queries']:
+            found.append(f"{name}: {before['queries']} -> {now['queries']} queries")
+        slower = all(
+            now[key] > before[key] * max_slowdown and now[key] - before[key] > min_delta_ms
+            for key in ('p50_ms', 'min_ms')
+        )
+        if slower:
+            found.append(f"{name}: p50 {before['p50_ms']} -> {now['p50_ms']} ms")
+    return found
@@ -0,0 +1,321 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Lower, Trim
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .events import publish_event, batch_added
+from .models import Product, StockBatch, PartialDepletion, LowStockAlert, ProductStock, DailyProfitRollup, StockMovement
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortfalls):
+        super().__init__('Insufficient stock')
+        self.shortfalls = shortfalls
+
+
+class ProductNameConflict(Exception):
+    def __init__(self, conflicts):
+        super().__init__('Ambiguous product names')
+        self.conflicts = conflicts
+
+
+def product_key(name):
+    # Compared like ProductSerializer.validate_name does: trimmed, ignoring case
+    return name.strip().lower()
+
+
+def match_products(user, names):
+    """{product_key(name): id} of the tenant's active products these names refer to.
+
+    Names matching no product are left out. Raises ProductNameConflict with
+    {key: reason} for names matching several active products, or only
+    deactivated ones.
+    """
+    keys = {product_key(name) for name in names}
+    if not keys:
+        return {}
+    active = {}
+    inactive = set()
+    for pk, key, is_active in Product.objects.filter(user=user).annotate(
+        key=Lower(Trim('name'))
+    ).filter(key__in=list(keys)).values_list('pk', 'key', 'is_active'):
+        if is_active:
+            active.setdefault(key, []).append(pk)
+        else:
+            inactive.add(key)
+
+    conflicts = {key: 'matches several products' for key, pks in active.items() if len(pks) > 1}
+    conflicts.update({key: 'matches only a deactivated product' for key in inactive - set(active)})
+    if conflicts:
+        raise ProductNameConflict(conflicts)
+    return {key: pks[0] for key, pks in active.items()}
+
+
+def bulk_intake(user, lines):
+    """Create the batches of a delivery in one transaction, creating missing products by name.
+
+    Mirrors what StockBatch.save does per row (stock ledger, default alert) once per
+    affected product instead of once per line.
+    """
+    with transaction.atomic():
+        product_ids = _resolve_products(user, lines)
+
+        batches = StockBatch.objects.bulk_create([
+            StockBatch(
+                product_id=product_id,
+                quantity=line['quantity'],
+                remaining_quantity=line['quantity'],
+                buy_price_per_unit=line['buy_price_per_unit'],
+                sell_price_per_unit=line['sell_price_per_unit'],
+                notes=line.get('notes', ''),
+            ) for line, product_id in zip(lines, product_ids)
+        ], batch_size=500)
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                user=user, product_id=batch.product_id, batch=batch, kind=StockMovement.INTAKE,
+                quantity=batch.quantity, unit_cost=batch.buy_price_per_unit, recorded_at=batch.added_at,
+            ) for batch in batches
+        ], batch_size=500)
+
+        first_quantity = {}
+        for line, product_id in zip(lines, product_ids):
+            first_quantity.setdefault(product_id, line['quantity'])
+        create_default_alerts(first_quantity)
+
+        ProductStock.rebuild(list(first_quantity))
+
+        names = dict(Product.objects.filter(pk__in=list(first_quantity)).values_list('pk', 'name'))
+        for batch in batches:
+            publish_event(user.pk, 'batch.added', batch_added(batch, names[batch.product_id]))
+
+    bump_data_version(user.pk)
+    return batches
+
+
+def create_default_alerts(first_quantity):
+    """Give products without an alert the same default StockBatch.save would: a fifth of the first batch"""
+    existing = set(LowStockAlert.objects.filter(
+        product_id__in=list(first_quantity)
+    ).values_list('product_id', flat=True))
+    LowStockAlert.objects.bulk_create([
+        LowStockAlert(product_id=product_id, threshold_quantity=quantity / Decimal('5'))
+        for product_id, quantity in first_quantity.items()
+        if product_id not in existing
+    ], ignore_conflicts=True)
+    LowStockAlert.evaluate(list(first_quantity))
+
+
+def _resolve_products(user, lines):
+    """Product id for every line, creating products referenced only by name"""
+    names = {
+        product_key(line['product_name']): line
+        for line in reversed(lines)
+        if not line.get('product')
+    }
+    by_name = match_products(user, [line['product_name'] for line in names.values()])
+
+    missing = [key for key in names if key not in by_name]
+    created = Product.objects.bulk_create([
+        Product(
+            user=user,
+            name=names[key]['product_name'].strip(),
+            category=names[key].get('category', 'other'),
+            default_sell_price=names[key]['sell_price_per_unit'],
+        ) for key in missing
+    ])
+    by_name.update({key: product.pk for key, product in zip(missing, created)})
+
+    return [
+        line['product'] if line.get('product') else by_name[product_key(line['product_name'])]
+        for line in lines
+    ]
+
+
+def bulk_deplete(user, lines):
+    """Allocate depletions FIFO across each product's open batches in one transaction.
+
+    Every touched batch gets a PartialDepletion row; batches used up are marked
+    depleted, as PartialDepletion.save does. Raises InsufficientStock, writing
+    nothing, when a product does not hold enough stock.
+    """
+    requested = {}
+    notes = {}
+    for line in lines:
+        requested[line['product']] = requested.get(line['product'], Decimal('0')) + line['quantity']
+        notes.setdefault(line['product'], line.get('notes', ''))
+
+    now = timezone.now()
+    with transaction.atomic():
+        open_batches = {}
+        for batch in StockBatch.objects.select_for_update().filter(
+            product_id__in=list(requested),
+            is_depleted=False,
+            remaining_quantity__gt=0
+        ).order_by('product_id', 'added_at', 'id'):
+            open_batches.setdefault(batch.product_id, []).append(batch)
+
+        shortfalls = {}
+        for product_id, quantity in requested.items():
+            available = sum((b.remaining_quantity for b in open_batches.get(product_id, [])), Decimal('0'))
+            if available < quantity:
+                shortfalls[product_id] = quantity - available
+        if shortfalls:
+            raise InsufficientStock(shortfalls)
+
+        touched = []
+        depletions = []
+        summary = {}
+        for product_id, quantity in requested.items():
+            need = quantity
+            used = used_up = 0
+            for batch in open_batches.get(product_id, []):
+                if need <= 0:
+                    break
+                take = min(batch.remaining_quantity, need)
+                need -= take
+                batch.remaining_quantity -= take
+                if batch.remaining_quantity <= 0:
+                    batch.remaining_quantity = Decimal('0')
+                    batch.is_depleted = True
+                    batch.depleted_at = now
+                    used_up += 1
+                used += 1
+                touched.append(batch)
+                depletions.append(PartialDepletion(
+                    batch=batch, quantity_used=take, recorded_at=now, notes=notes[product_id]
+                ))
+            summary[product_id] = {
+                'quantity': quantity,
+                'batches_used': used,
+                'batches_depleted': used_up,
+            }
+
+        StockBatch.objects.bulk_update(
+            touched, ['remaining_quantity', 'is_depleted', 'depleted_at'], batch_size=500
+        )
+        PartialDepletion.objects.bulk_create(depletions, batch_size=500)
+        movements = [
+            StockMovement(
+                user=user, product_id=d.batch.product_id, batch=d.batch, kind=StockMovement.USE,
+                quantity=-d.quantity_used, unit_cost=d.batch.buy_price_per_unit, recorded_at=now,
+            ) for d in depletions
+        ]
+        movements.extend(
+            StockMovement(
+                user=user, product_id=b.product_id, batch=b, kind=StockMovement.FINISH,
+                quantity=Decimal('0'), unit_cost=b.buy_price_per_unit, recorded_at=now,
+            ) for b in touched if b.is_depleted
+        )
+        StockMovement.objects.bulk_create(movements, batch_size=500)
+        DailyProfitRollup.record([b.rollup_values() for b in touched if b.is_depleted])
+        for batch in touched:
+            if batch.is_depleted:
+                publish_event(user.pk, 'batch.depleted', {'batch_id': batch.pk, 'product_id': batch.product_id})
+            else:
+                publish_event(user.pk, 'batch.updated', {
+                    'batch_id': batch.pk, 'remaining_quantity': batch.remaining_quantity
+                })
+
+        ProductStock.rebuild(list(requested))
+        update_alert_thresholds(list(requested))
+
+    bump_data_version(user.pk)
+    return summary
+
+
+def update_alert_thresholds(product_ids):
+    """Reset thresholds to a fifth of on-hand stock, as PartialDepletion.update_alert_threshold does"""
+    stock = dict(ProductStock.objects.filter(
+        product_id__in=product_ids, on_hand_quantity__gt=0
+    ).values_list('product_id', 'on_hand_quantity'))
+
+    alerts = list(LowStockAlert.objects.filter(product_id__in=list(stock)))
+    for alert in alerts:
+        alert.threshold_quantity = stock[alert.product_id] / Decimal('5')
+    LowStockAlert.objects.bulk_update(alerts, ['threshold_quantity'])
+
+    with_alert = {alert.product_id for alert in alerts}
+    LowStockAlert.objects.bulk_create([
+        LowStockAlert(product_id=product_id, threshold_quantity=quantity / Decimal('5'))
+        for product_id, quantity in stock.items()
+        if product_id not in with_alert
+    ], ignore_conflicts=True)
+    LowStockAlert.evaluate(product_ids)
+
+
+def finish_batches(batches):
+    """Mark every open batch of a queryset finished in one UPDATE, as mark_depleted('finished') does.
+
+    Stock summaries, profit rollups and alerts of the touched products follow
+    from grouped queries instead of per-batch saves. Returns how many batches
+    were finished.
+    """
+    now = timezone.now()
+    decimal_field = DecimalField(max_digits=20, decimal_places=2)
+    with transaction.atomic():
+        # What each batch still held leaves the ledger with its finish
+        open_batches = list(batches.filter(is_depleted=False).select_for_update(of=('self',)).values_list(
+            'pk', 'product_id', 'product__user_id', 'remaining_quantity', 'buy_price_per_unit'
+        ))
+        # Everything after the UPDATE goes by these pks: re-running the caller's queryset
+        # would miss the batches it selected by is_depleted=False
+        pks = [row[0] for row in open_batches]
+        finished = StockBatch.objects.filter(
+            pk__in=pks, is_depleted=False
+        ).update(remaining_quantity=Decimal('0'), is_depleted=True, depleted_at=now)
+        if not finished:
+            return 0
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                user_id=user_id, product_id=product_id, batch_id=pk, kind=StockMovement.FINISH,
+                quantity=-remaining, unit_cost=buy_price, recorded_at=now,
+            ) for pk, product_id, user_id, remaining, buy_price in open_batches
+        ], batch_size=1000)
+        # This UPDATE's rows: finished batches carry its timestamp
+        done = StockBatch.objects.filter(pk__in=pks, is_depleted=True, depleted_at=now)
+
+        totals = {}
+        for row in done.order_by().values('product__user_id', 'product__category').annotate(
+            revenue=Sum(F('quantity') * F('sell_price_per_unit'), output_field=decimal_field),
+            cost=Sum(F('quantity') * F('buy_price_per_unit'), output_field=decimal_field),
+            units=Sum('quantity'),
+            count=Count('id'),
+        ):
+            key = (row['product__user_id'], timezone.localdate(now), row['product__category'])
+            totals[key] = [row['revenue'], row['cost'], row['units'], row['count']]
+        DailyProfitRollup.add_totals(totals)
+
+        for pk, product_id, user_id in done.values_list('pk', 'product_id', 'product__user_id').iterator():
+            publish_event(user_id, 'batch.depleted', {'batch_id': pk, 'product_id': product_id})
+        ProductStock.rebuild(list({row[1] for row in open_batches}))
+
+    for user_id in {row[2] for row in open_batches}:
+        bump_data_version(user_id)
+    return finished
+
+
+def reset_alert_thresholds(alerts):
+    """Set the thresholds of a queryset of alerts to a fifth of on-hand stock in one UPDATE.
+
+    Alerts of products without stock keep their threshold. Returns how many
+    alerts were reset.
+    """
+    stock = Subquery(ProductStock.objects.filter(
+        product_id=OuterRef('product_id')
+    ).values('on_hand_quantity')[:1])
+    with transaction.atomic():
+        stocked = alerts.filter(product__stock_summary__on_hand_quantity__gt=0)
+        user_ids = set(stocked.values_list('product__user_id', flat=True).distinct())
+        updated = LowStockAlert.objects.filter(pk__in=stocked.values('pk')).update(
+            threshold_quantity=ExpressionWrapper(
+                stock / Value(Decimal('5')), output_field=DecimalField(max_digits=10, decimal_places=2)
+            )
+        )
+        LowStockAlert.evaluate(alerts.values('product_id'))
+
+    for user_id in user_ids:
+        bump_data_version(user_id)
+    return updated
@@ -0,0 +1,183 @@
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+# Backends each process keeps to itself: a write in one worker or command cannot move the others' versions
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'INVENTORY_CACHE_ALIAS', 'default')]
+
+
+def shared_cache():
+    """Whether every process sees the same cache, so a write anywhere moves the tenant's data version"""
+    alias = getattr(settings, 'INVENTORY_CACHE_ALIAS', 'default')
+    return settings.CACHES[alias]['BACKEND'] not in PER_PROCESS_CACHES
+
+
+def _version_key(user_id):
+    return f'inventory:version:{user_id}'
+
+
+def _modified_key(user_id):
+    return f'inventory:modified:{user_id}'
+
+
+def data_version(user_id):
+    """Current data version for a tenant; every inventory write moves it forward"""
+    cache = get_cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never repeats an old one
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def last_modified(user_id):
+    """Unix time of a tenant's last inventory write, or of the first time this cache saw the tenant"""
+    cache = get_cache()
+    key = _modified_key(user_id)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), timeout=None)
+        modified = cache.get(key)
+    return modified if modified is not None else time.time()
+
+
+def bump_data_version(user_id):
+    """Invalidate every cached entry of a tenant, now and again once the transaction commits"""
+    def bump():
+        cache = get_cache()
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+        cache.set(_modified_key(user_id), time.time(), timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def record_cache_outcome(name, outcome):
+    with _stats_lock:
+        counters = _stats.setdefault(name, {'hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+
+def cache_stats():
+    """Hit/miss counters per cached endpoint for this process"""
+    with _stats_lock:
+        per_endpoint = {name: dict(counters) for name, counters in _stats.items()}
+    return {
+        'hits': sum(c['hits'] for c in per_endpoint.values()),
+        'misses': sum(c['misses'] for c in per_endpoint.values()),
+        'endpoints': per_endpoint,
+    }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def tenant_cache_key(name, user_id):
+    return f'inventory:{name}:{user_id}:{data_version(user_id)}'
+
+
+def tenant_cached(name):
+    """Cache a view's response data per user and data version.
+
+    Like the validators, this needs a shared cache: with a per-process one,
+    writes made by other workers or commands leave the cached data current.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(viewset, request, *args, **kwargs):
+            if not shared_cache():
+                return view(viewset, request, *args, **kwargs)
+            cache = get_cache()
+            key = tenant_cache_key(name, request.user.pk)
+
+            data = cache.get(key)
+            if data is not None:
+                record_cache_outcome(name, 'hits')
+                return Response(data, headers={'X-Cache': 'HIT'})
+
+            response = view(viewset, request, *args, **kwargs)
+            record_cache_outcome(name, 'misses')
+            if response.status_code == 200:
+                cache.set(key, response.data, getattr(settings, 'INVENTORY_CACHE_TIMEOUT', 300))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def tenant_validators(user_id, variant=''):
+    """ETag and Last-Modified (Unix seconds or None) of a tenant's responses at the current data version.
+
+    Responses also depend on the day (today's profit, days in stock), so the
+    tag carries the date and Last-Modified is never before midnight. A write
+    less than a second old has no Last-Modified yet, since the header cannot
+    tell it apart from an earlier write in the same second. Without a shared
+    cache there are no validators at all: the version never expires, and
+    writes in other processes would not move it.
+    """
+    if not shared_cache():
+        return None, None
+    today = timezone.localdate()
+    etag = f'W/"{user_id}-{data_version(user_id)}-{today:%Y%m%d}-{variant}"'
+
+    midnight = timezone.make_aware(datetime.combine(today, datetime.min.time())).timestamp()
+    modified = max(last_modified(user_id), midnight)
+    if time.time() - modified < 1:
+        return etag, None
+    return etag, int(modified)
+
+
+def set_validators(response, etag, modified):
+    if etag is not None:
+        response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def tenant_conditional(view):
+    """Answer If-None-Match / If-Modified-Since with 304 before the view runs any query.
+
+    Successful responses get the tenant's ETag and Last-Modified and must be
+    revalidated by the browser before reuse.
+    """
+    @wraps(view)
+    def wrapper(viewset, request, *args, **kwargs):
+        etag, modified = tenant_validators(request.user.pk, request.accepted_renderer.format)
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = view(viewset, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            set_validators(response, etag, modified)
+        return response
+    return wrapper
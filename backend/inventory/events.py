@@ -0,0 +1,127 @@
+import asyncio
+import itertools
+import threading
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def channel_name(user_id):
+    return f'inventory:{user_id}'
+
+
+class EventBroker(ABC):
+    """Fan out a tenant's change events to the streams subscribed to it.
+
+    Subclasses deliver through whatever transport they like: publish is called
+    from request threads, subscribe from the event loop serving the stream.
+    """
+
+    @abstractmethod
+    def publish(self, channel, event):
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel):
+        """Return a Subscription whose get() waits for the next event"""
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        ...
+
+
+class Subscription:
+    def __init__(self, broker, channel, queue, loop=None):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue
+        self.loop = loop
+
+    async def get(self, timeout=None):
+        """Next event, or None when the timeout passes first"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(EventBroker):
+    """In-process broker: every stream served by this process sees every event published in it.
+
+    Good for a single ASGI worker. Several workers need a shared backend with
+    the same interface (set INVENTORY_EVENT_BROKER to its dotted path).
+    """
+    max_queue = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(
+            self, channel, asyncio.Queue(self.max_queue), loop=asyncio.get_running_loop()
+        )
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(self._deliver, subscription, event)
+
+    def _deliver(self, subscription, event):
+        # A stream that stopped reading loses events rather than memory
+        if not subscription.queue.full():
+            subscription.queue.put_nowait(event)
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, 'INVENTORY_EVENT_BROKER', 'inventory.events.LocalBroker')
+            _broker = import_string(path)()
+        return _broker
+
+
+_event_ids = itertools.count(1)
+
+
+def publish_event(user_id, kind, data):
+    """Send a change event to the tenant's streams once the surrounding transaction commits"""
+    if user_id is None:
+        return
+    event = {'id': next(_event_ids), 'type': kind, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(channel_name(user_id), event))
+
+
+def batch_added(batch, product_name):
+    return {
+        'batch_id': batch.pk,
+        'product_id': batch.product_id,
+        'product': product_name,
+        'remaining_quantity': batch.remaining_quantity,
+    }
@@ -0,0 +1,14 @@
+from django.db.models import Func, FloatField
+
+
+class EpochSeconds(Func):
+    """Seconds since the Unix epoch of a datetime expression, as a float"""
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)::double precision'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='(julianday(%(expressions)s) - 2440587.5) * 86400.0',
+            **extra_context
+        )
@@ -0,0 +1,193 @@
+import math
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import PartialDepletion, ProductStock, StockBatch
+
+SEASON = 7
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7])
+GAMMAS = np.array([0.05, 0.1, 0.2, 0.4])
+SERVICE_LEVEL_Z = 1.65  # about 95% of lead-time demand covered
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def demand_matrix(user, product_ids, start, end):
+    """Units sold per product and day in [start, end), shape (products, days).
+
+    Partial depletions count on the day they were recorded. Whatever a batch
+    lost beyond its partial depletions (mark_depleted, imports) counts on the
+    day it was depleted.
+    """
+    days = (end - start).days
+    matrix = np.zeros((len(product_ids), days))
+    row = {pid: i for i, pid in enumerate(product_ids)}
+
+    since, until = _start_of_day(start), _start_of_day(end)
+    partial = PartialDepletion.objects.filter(
+        batch__product__user=user,
+        recorded_at__gte=since,
+        recorded_at__lt=until,
+    ).annotate(day=TruncDate('recorded_at')).order_by().values('batch__product_id', 'day').annotate(
+        used=Sum('quantity_used')
+    ).values_list('batch__product_id', 'day', 'used')
+
+    decimal_field = DecimalField(max_digits=20, decimal_places=2)
+    recorded = PartialDepletion.objects.filter(batch=OuterRef('pk')).order_by().values('batch').annotate(
+        total=Sum('quantity_used')
+    ).values('total')
+    unrecorded = StockBatch.objects.filter(
+        product__user=user,
+        is_depleted=True,
+        depleted_at__gte=since,
+        depleted_at__lt=until,
+    ).annotate(
+        day=TruncDate('depleted_at'),
+        used=ExpressionWrapper(
+            F('quantity') - F('remaining_quantity')
+            - Coalesce(Subquery(recorded), Value(Decimal('0')), output_field=decimal_field),
+            output_field=decimal_field
+        )
+    ).filter(used__gt=0).values_list('product_id', 'day', 'used')
+
+    for rows in (partial, unrecorded):
+        entries = [(row[pid], (day - start).days, float(used)) for pid, day, used in rows if pid in row]
+        if entries:
+            r, d, q = np.array(entries).T
+            np.add.at(matrix, (r.astype(int), d.astype(int)), q)
+    return matrix
+
+
+def _smooth(series, alphas, gammas):
+    """Run additive seasonal exponential smoothing for every (parameter, product) pair at once.
+
+    series has shape (products, days); alphas and gammas broadcast against
+    (candidates, products). Returns the final level and seasonal indices and
+    the sum of squared one-step errors.
+    """
+    days = series.shape[1]
+    shape = np.broadcast(alphas, gammas).shape
+    first_week = series[:, :SEASON]
+    level = np.broadcast_to(first_week.mean(axis=1), shape).copy()
+    season = np.broadcast_to(
+        first_week - first_week.mean(axis=1, keepdims=True), shape + (SEASON,)
+    ).copy()
+    sse = np.zeros(level.shape)
+
+    for t in range(SEASON, days):
+        y = series[:, t]
+        s = season[..., t % SEASON]
+        error = y - (level + s)
+        sse += error * error
+        new_level = alphas * (y - s) + (1 - alphas) * level
+        season[..., t % SEASON] = gammas * (y - new_level) + (1 - gammas) * s
+        level = new_level
+    return level, season, sse
+
+
+def fit(series):
+    """Pick the best smoothing parameters per product by one-step error over the series"""
+    products, days = series.shape
+    alphas = np.repeat(ALPHAS, len(GAMMAS))[:, None] * np.ones((1, products))
+    gammas = np.tile(GAMMAS, len(ALPHAS))[:, None] * np.ones((1, products))
+    _, _, sse = _smooth(series, alphas, gammas)
+    best = sse.argmin(axis=0)
+    columns = np.arange(products)
+    return alphas[best, columns], gammas[best, columns]
+
+
+def project(series, alphas, gammas, horizon):
+    """Daily demand forecast (products, horizon) and one-step error spread from fitted parameters"""
+    level, season, sse = _smooth(series, alphas, gammas)
+    steps = max(series.shape[1] - SEASON, 1)
+    sigma = np.sqrt(sse / steps)
+    days = series.shape[1] + np.arange(horizon)
+    forecast = np.maximum(level[:, None] + season[:, days % SEASON], 0)
+    return forecast, sigma
+
+
+def _parameters(user, product_ids, series):
+    """Fitted parameters per product, refit at most once a day per tenant"""
+    cache = get_cache()
+    key = f'inventory:forecast-params:{user.pk}:{timezone.localdate().isoformat()}'
+    cached = cache.get(key)
+    if cached is not None and cached['product_ids'] == product_ids:
+        return np.array(cached['alphas']), np.array(cached['gammas']), True
+
+    alphas, gammas = fit(series)
+    cache.set(key, {
+        'product_ids': product_ids,
+        'alphas': alphas.tolist(),
+        'gammas': gammas.tolist(),
+    }, getattr(settings, 'INVENTORY_FORECAST_TIMEOUT', 60 * 60 * 24))
+    return alphas, gammas, False
+
+
+def forecast_products(user, products, history_days=56, horizon=28, lead_time=7, review_days=14):
+    """Stockout dates and reorder quantities for a tenant's products.
+
+    products is a list of dicts with id and name. Lead time is the days an order
+    takes to arrive and review_days how long it should last once it does.
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=history_days)
+    product_ids = [p['id'] for p in products]
+
+    if not product_ids:
+        return [], False
+
+    series = demand_matrix(user, product_ids, start, today + timedelta(days=1))
+    stock = dict(ProductStock.objects.filter(product_id__in=product_ids).values_list(
+        'product_id', 'on_hand_quantity'
+    ))
+
+    # The current day is still filling up, so fit on complete days only
+    history = series[:, :-1]
+    alphas, gammas, cached = _parameters(user, product_ids, history)
+    forecast, sigma = project(history, alphas, gammas, max(horizon, lead_time + review_days))
+
+    on_hand = np.array([float(stock.get(pid, 0)) for pid in product_ids])
+    cumulative = np.cumsum(forecast[:, :horizon], axis=1)
+    runs_out = cumulative >= on_hand[:, None]
+    first_empty = np.where(runs_out.any(axis=1), runs_out.argmax(axis=1), -1)
+    daily = forecast[:, :horizon].mean(axis=1)
+
+    cover = lead_time + review_days
+    safety = SERVICE_LEVEL_Z * sigma * math.sqrt(cover)
+    lead_demand = forecast[:, :lead_time].sum(axis=1)
+    reorder_point = lead_demand + SERVICE_LEVEL_Z * sigma * math.sqrt(lead_time)
+    order = np.maximum(forecast[:, :cover].sum(axis=1) + safety - on_hand, 0)
+
+    result = []
+    for i, product in enumerate(products):
+        if on_hand[i] <= 0:
+            days_left = 0
+        elif first_empty[i] >= 0:
+            days_left = int(first_empty[i]) + 1
+        elif daily[i] > 0:
+            days_left = int(on_hand[i] // daily[i])
+        else:
+            days_left = None
+        result.append({
+            'product_id': product['id'],
+            'product': product['name'],
+            'current_stock': round(float(on_hand[i]), 2),
+            'daily_demand': round(float(daily[i]), 2),
+            'forecast': [round(float(q), 2) for q in forecast[i, :7]],
+            'days_until_stockout': days_left,
+            'stockout_date': (today + timedelta(days=days_left)).isoformat() if days_left is not None else None,
+            'reorder_point': round(float(reorder_point[i]), 2),
+            'needs_reorder': bool(on_hand[i] <= reorder_point[i]),
+            'reorder_quantity': math.ceil(order[i]),
+            'model': {'alpha': float(alphas[i]), 'gamma': float(gammas[i])},
+        })
+    return result, cached
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+ENDPOINTS = {
+    'dashboard': ('/api/dashboard/', '/api/async/dashboard/'),
+    'reports': ('/api/reports/', '/api/async/reports/'),
+    'insights': ('/api/insights/', '/api/async/insights/'),
+}
+
+
+@contextmanager
+def simulated_latency(seconds):
+    """Delay every query by a network round trip, so a local SQLite database behaves like a remote one"""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        # A thread reconnecting keeps its wrapper object, and with it the delay
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    if not seconds:
+        yield
+        return
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for conn in connections.all(initialized_only=True):
+            conn.close()
+
+
+def summarize(latencies, elapsed, errors):
+    """p50/p99 latency in milliseconds and requests per second"""
+    ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        'p99_ms': round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0,
+    }
+
+
+def run_wsgi(path, token, requests, concurrency):
+    """Serve the requests through the WSGI handler from a pool of worker threads, like a threaded server"""
+    barrier = threading.Barrier(concurrency)
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+    remaining = iter(range(requests))
+
+    def worker():
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        try:
+            barrier.wait()
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                started = time.perf_counter()
+                response = client.get(path)
+                took = time.perf_counter() - started
+                with lock:
+                    if response.status_code == 200:
+                        latencies.append(took)
+                    else:
+                        errors.append(response.status_code)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return summarize(latencies, time.perf_counter() - started, len(errors))
+
+
+def run_asgi(path, token, requests, concurrency):
+    """Serve the requests through the ASGI handler, at most concurrency of them in flight on one event loop"""
+    async def main():
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {token}'}
+        limit = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = []
+
+        async def one():
+            async with limit:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                took = time.perf_counter() - started
+            if response.status_code == 200:
+                latencies.append(took)
+            else:
+                errors.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return summarize(latencies, time.perf_counter() - started, len(errors))
+
+    return asyncio.run(main())
+
+
+def compare(user, endpoints=tuple(ENDPOINTS), requests=200, concurrency=16, latency=0):
+    """Latency and throughput of each endpoint under WSGI and ASGI at the same concurrency.
+
+    latency adds that many seconds to every query, standing in for the round
+    trip to a database on another host.
+    """
+    token = str(AccessToken.for_user(user))
+    results = {}
+    with simulated_latency(latency):
+        for name in endpoints:
+            sync_path, async_path = ENDPOINTS[name]
+            results[name] = {
+                'wsgi': run_wsgi(sync_path, token, requests, concurrency),
+                'asgi': run_asgi(async_path, token, requests, concurrency),
+            }
+    return results
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from inventory.models import StockBatch
+from inventory.partitions import PARTITIONED, add_months, detach_partition, is_partitioned, partitions
+
+
+class Command(BaseCommand):
+    help = '''Detach the monthly history partitions before a month, e.g. to dump and drop them.
+
+    Postgres only. Detached partitions are left as plain tables unless --drop is
+    given. Only history of batches that were finished before that month should
+    go: the batches keep their state, but replay_movements and valuations
+    before the month can no longer see it. The command refuses when batches
+    added earlier were still open at the cutoff, unless --force is given.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='First month to keep, as YYYY-MM')
+        parser.add_argument('--drop', action='store_true', help='Drop the partitions instead of keeping them')
+        parser.add_argument('--force', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(f'Partitioned history needs PostgreSQL; on {connection.vendor} nothing is partitioned')
+        try:
+            cutoff = datetime.strptime(options['before'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('--before must be a month as YYYY-MM')
+        if cutoff > add_months(timezone.now().date().replace(day=1), -1):
+            raise CommandError('Only months before the previous one can be archived')
+
+        cutoff_at = datetime(cutoff.year, cutoff.month, 1, tzinfo=dt_timezone.utc)
+        still_open = StockBatch.objects.filter(added_at__lt=cutoff_at).filter(
+            Q(is_depleted=False) | Q(depleted_at__isnull=True) | Q(depleted_at__gte=cutoff_at)
+        ).count()
+        if still_open and not options['force']:
+            raise CommandError(
+                f'{still_open} batches added before {cutoff:%Y-%m} were still open then, so their history '
+                'would be cut in two; pass --force to archive anyway'
+            )
+
+        detached = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table in PARTITIONED:
+                if not is_partitioned(cursor, table):
+                    raise CommandError(f'{table} is not partitioned; see create_partitions --convert')
+                for month, name in sorted(partitions(cursor, table).items()):
+                    if month < cutoff:
+                        detach_partition(cursor, table, name, drop=options['drop'])
+                        detached.append(name)
+                        self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} {name}")
+        self.stdout.write(self.style.SUCCESS(f'Archived {len(detached)} partitions before {cutoff:%Y-%m}'))
@@ -0,0 +1,113 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.analytics import NOT_DEPLETED, batch_arrays, product_stats
+
+
+def synthetic_rows(size, products, now, seed=0):
+    """Batch rows shaped like a tenant's history, values drawn from small shared pools"""
+    rng = random.Random(seed)
+    quantities = [Decimal(q) for q in range(5, 105, 5)]
+    prices = [Decimal(p) for p in range(10, 510, 10)]
+    moments = [now - timedelta(hours=h) for h in range(0, 24 * 365, 7)]
+    rows = []
+    for _ in range(size):
+        quantity = rng.choice(quantities)
+        depleted = rng.random() < 0.7
+        added = rng.choice(moments)
+        rows.append((
+            rng.randrange(1, products + 1),
+            quantity,
+            Decimal('0') if depleted else quantity / 2,
+            rng.choice(prices),
+            added,
+            added + timedelta(days=rng.randrange(1, 30)) if depleted else None,
+            depleted,
+        ))
+    return rows
+
+
+def numeric_rows(rows):
+    """The same rows as load_batches() receives them: floats and epoch seconds"""
+    return [(
+        product_id, float(quantity), float(remaining), float(buy_price), added_at.timestamp(),
+        depleted_at.timestamp() if depleted_at else NOT_DEPLETED, is_depleted,
+    ) for product_id, quantity, remaining, buy_price, added_at, depleted_at, is_depleted in rows]
+
+
+def loop_stats(rows, now):
+    """The per-row Decimal loops the insight and velocity views used before analytics"""
+    velocity, turnover, active, stock = {}, {}, {}, {}
+    for product_id, quantity, remaining, buy_price, added_at, depleted_at, is_depleted in rows:
+        if is_depleted and depleted_at:
+            days = max((depleted_at - added_at).days, 1)
+            velocity.setdefault(product_id, []).append((quantity - remaining) / days)
+            turnover.setdefault(product_id, []).append(days)
+        elif not is_depleted:
+            days = max((now - added_at).days, 1)
+            active.setdefault(product_id, []).append(float(quantity - remaining) / days)
+            stock[product_id] = stock.get(product_id, Decimal('0')) + remaining
+
+    result = {}
+    for product_id in set(velocity) | set(active):
+        vels = velocity.get(product_id, [])
+        active_vels = active.get(product_id, [])
+        avg_active = sum(active_vels) / len(active_vels) if active_vels else 0
+        on_hand = stock.get(product_id, Decimal('0'))
+        result[product_id] = {
+            'avg_velocity': sum(vels) / len(vels) if vels else 0,
+            'avg_turnover': sum(turnover[product_id]) / len(vels) if vels else 0,
+            'days_until_empty': round(on_hand / Decimal(avg_active), 1) if avg_active > 0 else None,
+        }
+    return result
+
+
+class Command(BaseCommand):
+    help = '''Time the vectorised product analytics against the previous per-row loops.
+
+    Both sides start from rows already fetched: model values for the loops,
+    the numeric columns load_batches() selects for the arrays.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for size in options['sizes']:
+            rows = synthetic_rows(size, options['products'], now)
+            numbers = numeric_rows(rows)
+
+            loop_time, expected = self.best_of(options['repeat'], lambda: loop_stats(rows, now))
+            numpy_time, stats = self.best_of(
+                options['repeat'], lambda: product_stats(batch_arrays(numbers), now)
+            )
+
+            index = {int(pid): i for i, pid in enumerate(stats['product_id'])}
+            drift = max((
+                abs(float(values['avg_velocity']) - stats['depleted_velocity'][index[pid]])
+                for pid, values in expected.items()
+            ), default=0.0)
+
+            self.stdout.write(
+                f'{size:>9} batches  loops {loop_time * 1000:9.1f} ms  '
+                f'numpy {numpy_time * 1000:9.1f} ms  '
+                f'speedup {loop_time / numpy_time if numpy_time else float("inf"):5.1f}x  '
+                f'max velocity drift {drift:.2e}'
+            )
+
+    def best_of(self, repeat, run):
+        best, result = None, None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,80 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from inventory.benchmark import ENDPOINTS, environment, regressions, run_benchmark
+from inventory.synthetic import generate_tenants, tenant_names
+
+
+class Command(BaseCommand):
+    help = '''Generate seeded synthetic tenants and time every API endpoint against them.
+
+    Runs against the configured database (SQLite locally, Postgres when DB_ENGINE
+    points at it) and writes JSON that can be diffed or passed back as --baseline
+    on a later commit. The tenants are removed afterwards unless --keep is given.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3)
+        parser.add_argument('--products', type=int, default=50, help='Products per user')
+        parser.add_argument('--batches', type=int, default=20, help='Batches per product')
+        parser.add_argument('--days', type=int, default=180, help='Days of history')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed requests per endpoint and user')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), dest='endpoints')
+        parser.add_argument('--warm', action='store_true', help='Keep the tenant cache on')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+        parser.add_argument('--baseline', help='Earlier results to compare with; regressions fail the command')
+        parser.add_argument('--max-slowdown', type=float, default=1.5, help='Allowed p50 ratio against the baseline')
+        parser.add_argument('--keep', action='store_true', help='Leave the synthetic tenants in the database')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'products', 'batches', 'days', 'repeat'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be positive')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+
+        started = time.perf_counter()
+        users = generate_tenants(
+            users=options['users'], products=options['products'], batches=options['batches'],
+            seed=options['seed'], days=options['days'],
+        )
+        self.stderr.write(
+            f"Generated {options['users']} x {options['products']} x {options['batches']} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        try:
+            endpoints = run_benchmark(
+                users, endpoints=options['endpoints'] or tuple(ENDPOINTS),
+                repeat=options['repeat'], cached=options['warm'],
+            )
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__in=tenant_names(options['users'], options['seed'])).delete()
+
+        results = {
+            'environment': environment(),
+            'dataset': {name: options[name] for name in ('users', 'products', 'batches', 'days', 'seed')},
+            'repeat': options['repeat'],
+            'cached': options['warm'],
+            'endpoints': endpoints,
+        }
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        for name, r in endpoints.items():
+            self.stderr.write(f"{name:<18} p50 {r['p50_ms']:>8} ms  p95 {r['p95_ms']:>8} ms  {r['queries']:>3} queries")
+
+        if baseline is not None:
+            found = regressions(baseline, results, options['max_slowdown'])
+            if found:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(found))
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
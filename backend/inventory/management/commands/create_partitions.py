@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from inventory.partitions import PARTITIONED, add_months, convert, ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = '''Create the monthly partitions of the depletion and movement history ahead of time.
+
+    Postgres only. Run it monthly from cron: rows for a month without a partition
+    land in the default partition, and are moved out when the month's partition
+    is created. --convert partitions tables migrated before
+    INVENTORY_PARTITION_HISTORY was turned on.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help='Months ahead of the current one')
+        parser.add_argument('--convert', action='store_true', help='Partition tables that are not yet')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(f'Partitioned history needs PostgreSQL; on {connection.vendor} it stays in one table')
+        if options['months'] < 0:
+            raise CommandError('--months must not be negative')
+
+        this_month = timezone.now().date().replace(day=1)
+        last = add_months(this_month, options['months'])
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table, column in PARTITIONED.items():
+                if not is_partitioned(cursor, table):
+                    if not options['convert']:
+                        raise CommandError(f'{table} is not partitioned; pass --convert to partition it')
+                    convert(cursor, table, column, months_ahead=options['months'])
+                    self.stdout.write(f'Partitioned {table}')
+                created = ensure_partitions(cursor, table, column, this_month, last)
+                for name in created:
+                    self.stdout.write(f'Created {name}')
+        self.stdout.write(self.style.SUCCESS(f'History is partitioned through {last:%Y-%m}'))
@@ -0,0 +1,215 @@
+import csv
+import time
+from datetime import datetime, time as dt_time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from inventory.bulk import (
+    ProductNameConflict, create_default_alerts, match_products, product_key, update_alert_thresholds
+)
+from inventory.cache import bump_data_version
+from inventory.models import (
+    Product, StockBatch, PartialDepletion, ProductStock, DailyProfitRollup, StockMovement, ValuationCheckpoint
+)
+
+
+class Command(BaseCommand):
+    help = '''Import historical batches and depletions from a CSV file.
+
+    Columns: record (batch or depletion), batch_ref, product, category, quantity,
+    buy_price, sell_price, added_at, depleted_at, recorded_at, notes.
+
+    Batch rows use product, category, quantity, prices, added_at and an optional
+    depleted_at (the batch finished then). Depletion rows reference an earlier
+    batch row's batch_ref and give quantity and recorded_at. Remaining stock of
+    open batches is derived from their depletions once the file is loaded.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username that owns the imported stock')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        self.chunk_size = options['chunk_size']
+        self.verbosity = options['verbosity']
+        # product_key(name): id, matched the way the bulk intake endpoint matches names
+        self.products = {}
+        self.batch_ids = {}
+        self.first_quantity = {}
+        # Only the batches this import created: the web app may add others for the tenant meanwhile
+        self.imported_ids = []
+        self.first_added_at = None
+        self.counts = {'batches': 0, 'depletions': 0}
+
+        started = time.perf_counter()
+        rows = 0
+        with open(options['path'], newline='') as handle, transaction.atomic():
+            chunk = []
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                chunk.append((line, row))
+                if len(chunk) >= self.chunk_size:
+                    self.flush(chunk)
+                    rows += len(chunk)
+                    chunk = []
+                    self.progress(rows, started)
+            self.flush(chunk)
+            rows += len(chunk)
+
+            self.finish()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.counts['batches']} batches and {self.counts['depletions']} depletions "
+            f"from {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else rows:.0f} rows/s)"
+        ))
+
+    def progress(self, rows, started):
+        if self.verbosity < 2:
+            return
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{rows} rows ({rows / elapsed:.0f} rows/s)')
+
+    def flush(self, chunk):
+        batch_rows = [(line, row) for line, row in chunk if row.get('record', 'batch') == 'batch']
+        depletion_rows = [(line, row) for line, row in chunk if row.get('record') == 'depletion']
+        unknown = [line for line, row in chunk if row.get('record', 'batch') not in ('batch', 'depletion')]
+        if unknown:
+            raise CommandError(f'Line {unknown[0]}: record must be "batch" or "depletion"')
+
+        self.create_products(batch_rows)
+
+        batches = []
+        for line, row in batch_rows:
+            quantity = self.decimal(row, 'quantity', line)
+            depleted_at = self.moment(row.get('depleted_at'), line)
+            batches.append(StockBatch(
+                product_id=self.products[product_key(row['product'])],
+                quantity=quantity,
+                remaining_quantity=Decimal('0') if depleted_at else quantity,
+                buy_price_per_unit=self.decimal(row, 'buy_price', line),
+                sell_price_per_unit=self.decimal(row, 'sell_price', line),
+                added_at=self.moment(row.get('added_at'), line) or timezone.now(),
+                depleted_at=depleted_at,
+                is_depleted=depleted_at is not None,
+                notes=row.get('notes', ''),
+            ))
+        StockBatch.objects.bulk_create(batches, batch_size=1000)
+
+        for (line, row), batch in zip(batch_rows, batches):
+            self.imported_ids.append(batch.pk)
+            if self.first_added_at is None or batch.added_at < self.first_added_at:
+                self.first_added_at = batch.added_at
+            if row.get('batch_ref'):
+                self.batch_ids[row['batch_ref']] = batch.pk
+            self.first_quantity.setdefault(batch.product_id, batch.quantity)
+
+        depletions = []
+        for line, row in depletion_rows:
+            batch_id = self.batch_ids.get(row.get('batch_ref'))
+            if batch_id is None:
+                raise CommandError(f"Line {line}: unknown batch_ref {row.get('batch_ref')!r}")
+            depletions.append(PartialDepletion(
+                batch_id=batch_id,
+                quantity_used=self.decimal(row, 'quantity', line),
+                recorded_at=self.moment(row.get('recorded_at'), line) or timezone.now(),
+                notes=row.get('notes', ''),
+            ))
+        PartialDepletion.objects.bulk_create(depletions, batch_size=1000)
+
+        self.counts['batches'] += len(batches)
+        self.counts['depletions'] += len(depletions)
+
+    def create_products(self, batch_rows):
+        unknown = {}
+        for line, row in batch_rows:
+            name = (row.get('product') or '').strip()
+            if not name:
+                raise CommandError(f'Line {line}: product is required')
+            if product_key(name) not in self.products:
+                unknown.setdefault(product_key(name), (line, row, name))
+
+        try:
+            self.products.update(match_products(self.user, [name for _, _, name in unknown.values()]))
+        except ProductNameConflict as exc:
+            key, reason = next(iter(exc.conflicts.items()))
+            raise CommandError(f'Line {unknown[key][0]}: product {unknown[key][2]!r} {reason}')
+
+        new = {}
+        for key, (line, row, name) in unknown.items():
+            if key not in self.products:
+                new[key] = Product(
+                    user=self.user,
+                    name=name,
+                    category=row.get('category') or 'other',
+                    default_sell_price=self.decimal(row, 'sell_price', line),
+                )
+        for key, product in zip(new, Product.objects.bulk_create(list(new.values()))):
+            self.products[key] = product.pk
+
+    def finish(self):
+        """Derive remaining stock and movements from the imported depletions, then refresh ledger and alerts once"""
+        if not self.imported_ids:
+            return
+        used = PartialDepletion.objects.filter(batch=OuterRef('pk')).order_by().values('batch').annotate(
+            total=Sum('quantity_used')
+        ).values('total')
+        last_used = PartialDepletion.objects.filter(batch=OuterRef('pk')).order_by().values('batch').annotate(
+            last=Max('recorded_at')
+        ).values('last')
+
+        for start in range(0, len(self.imported_ids), self.chunk_size):
+            imported = StockBatch.objects.filter(pk__in=self.imported_ids[start:start + self.chunk_size])
+            imported.filter(is_depleted=False).update(
+                remaining_quantity=F('quantity') - Coalesce(
+                    Subquery(used), Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=20, decimal_places=2)
+                )
+            )
+            imported.filter(is_depleted=False, remaining_quantity__lte=0).update(
+                remaining_quantity=Decimal('0'),
+                is_depleted=True,
+                depleted_at=Subquery(last_used)
+            )
+            StockMovement.backfill(imported)
+
+        # Valuation checkpoints from the first imported batch on did not see this history
+        ValuationCheckpoint.invalidate(self.user.pk, self.first_added_at)
+
+        product_ids = list(self.first_quantity)
+        ProductStock.rebuild(product_ids)
+        DailyProfitRollup.rebuild([self.user.pk])
+        create_default_alerts(self.first_quantity)
+        update_alert_thresholds(product_ids)
+        bump_data_version(self.user.pk)
+
+    def decimal(self, row, column, line):
+        try:
+            return Decimal(row[column])
+        except (KeyError, TypeError, InvalidOperation):
+            raise CommandError(f'Line {line}: {column} must be a number')
+
+    def moment(self, value, line):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'Line {line}: cannot read date {value!r}')
+            parsed = datetime.combine(day, dt_time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
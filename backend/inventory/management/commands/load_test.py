@@ -0,0 +1,53 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from inventory.benchmark import in_process_requests
+from inventory.loadtest import ENDPOINTS, compare
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 latency and throughput of the WSGI and async (ASGI) dashboard, report and insight views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='Tenant whose data the requests read')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and path')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), dest='endpoints')
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Keep the tenant cache on; by default every request computes its response'
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help='Milliseconds added to every query, to mimic a database on another host'
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']}")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        with in_process_requests(cached=options['warm']):
+            results = compare(
+                user,
+                endpoints=options['endpoints'] or tuple(ENDPOINTS),
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                latency=options['db_latency'] / 1000,
+            )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{options['requests']} requests per path at concurrency {options['concurrency']}")
+        for name, paths in results.items():
+            for path, r in paths.items():
+                self.stdout.write(
+                    f"{name:<10} {path:<5} p50 {str(r['p50_ms']):>8} ms  p99 {str(r['p99_ms']):>8} ms  "
+                    f"{r['throughput']:>7}/s  {r['errors']} errors"
+                )
@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from inventory.cache import shared_cache
+from inventory.precompute import precompute
+from inventory.snapshots import outdated_tenants
+
+
+class Command(BaseCommand):
+    help = '''Precompute the by-product, monthly and insight reports of every tenant into snapshots.
+
+    Tenants are sharded by user id over a pool of worker processes. Only tenants
+    whose data version moved on since their snapshots (or whose snapshots are
+    from an earlier day) are recomputed. With --interval the command keeps
+    polling; the worker and the web processes must then share a cache backend,
+    since the data version lives there.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Seconds between passes; by default a single pass is made'
+        )
+        parser.add_argument('--user', action='append', dest='usernames', help='Only this tenant')
+        parser.add_argument('--force', action='store_true', help='Recompute current snapshots too')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+        if options['interval'] < 0:
+            raise CommandError('--interval must not be negative')
+        if not shared_cache():
+            raise CommandError(
+                'Snapshots need a cache shared with the web processes (CACHE_BACKEND); '
+                'a per-process cache never sees their writes'
+            )
+
+        while True:
+            self.run_pass(options)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def run_pass(self, options):
+        tenants = User.objects.filter(product__isnull=False).distinct()
+        if options['usernames']:
+            tenants = tenants.filter(username__in=options['usernames'])
+        user_ids = list(tenants.order_by('pk').values_list('pk', flat=True))
+        if not options['force']:
+            user_ids = outdated_tenants(user_ids)
+
+        started = time.perf_counter()
+        results = precompute(user_ids, workers=options['workers'], force=options['force'])
+        refreshed = sum(len(names) for names in results.values())
+        if options['verbosity'] >= 2:
+            for user_id, names in sorted(results.items()):
+                self.stdout.write(f"user {user_id}: {', '.join(names) or 'current'}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {refreshed} snapshots of {len(results)} tenants '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from inventory.cache import bump_data_version
+from inventory.models import DailyProfitRollup, Product
+
+
+class Command(BaseCommand):
+    help = 'Backfill the daily profit rollups from the depleted stock batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='users',
+            help='Limit to a username (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['users']:
+            found = dict(User.objects.filter(
+                username__in=options['users']
+            ).values_list('username', 'pk'))
+            missing = set(options['users']) - set(found)
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+            user_ids = list(found.values())
+
+        touched = user_ids
+        if touched is None:
+            # Tenants with sales now, and those whose stale rollups the rebuild drops
+            touched = set(Product.objects.values_list('user_id', flat=True)) | set(
+                DailyProfitRollup.objects.values_list('user_id', flat=True)
+            )
+        count = DailyProfitRollup.rebuild(user_ids)
+        for user_id in touched:
+            bump_data_version(user_id)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} daily rollup rows'))
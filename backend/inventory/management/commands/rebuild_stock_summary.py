@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from inventory.cache import bump_data_version
+from inventory.models import Product, ProductStock
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the per-product stock summary from the stock batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare stored summaries with the batches and report drift'
+        )
+        parser.add_argument(
+            '--product', type=int, action='append', dest='products',
+            help='Limit to a product id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        product_ids = options['products']
+
+        if not options['verify']:
+            count = ProductStock.rebuild(product_ids)
+            products = Product.objects.all()
+            if product_ids is not None:
+                products = products.filter(pk__in=product_ids)
+            for user_id in products.order_by().values_list('user_id', flat=True).distinct():
+                bump_data_version(user_id)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stock summary for {count} products'))
+            return
+
+        expected = ProductStock.compute(product_ids)
+        stored = ProductStock.objects.in_bulk(list(expected.keys()))
+        fields = ['on_hand_quantity', 'on_hand_value', 'active_batches', 'last_depleted_at']
+
+        drifted = 0
+        for product_id, summary in expected.items():
+            # Products that never had a batch have no summary row yet
+            current = stored.get(product_id) or ProductStock(product_id=product_id)
+            for field in fields:
+                want = getattr(summary, field)
+                have = getattr(current, field)
+                if have != want:
+                    drifted += 1
+                    self.stdout.write(
+                        f'product {product_id}: {field} is {have}, expected {want}'
+                    )
+                    break
+
+        if drifted:
+            raise CommandError(f'{drifted} of {len(expected)} stock summaries are out of date')
+        self.stdout.write(self.style.SUCCESS(f'All {len(expected)} stock summaries match'))
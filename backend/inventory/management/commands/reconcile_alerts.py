@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from inventory.cache import bump_data_version
+from inventory.models import LowStockAlert
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored triggered state of every low stock alert from the stock batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report alerts whose stored state is out of date'
+        )
+
+    def handle(self, *args, **options):
+        # On-hand stock summed straight from the batches, one grouped query for all alerts
+        rows = LowStockAlert.objects.annotate(
+            stock=Coalesce(
+                Sum('product__batches__remaining_quantity', filter=Q(product__batches__is_depleted=False)),
+                Value(Decimal('0')),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )
+        ).values_list('pk', 'product__user_id', 'threshold_quantity', 'stock', 'is_triggered', 'last_evaluated_stock')
+
+        now = timezone.now()
+        stale = []
+        tenants = set()
+        total = 0
+        for pk, user_id, threshold, stock, is_triggered, last_stock in rows:
+            total += 1
+            triggered = stock <= threshold
+            if triggered != is_triggered or last_stock != stock:
+                stale.append(LowStockAlert(
+                    pk=pk, is_triggered=triggered, last_evaluated_stock=stock, evaluated_at=now
+                ))
+                tenants.add(user_id)
+                if options['verbosity'] >= 2 or options['verify']:
+                    self.stdout.write(
+                        f'alert {pk}: stored {is_triggered} at {last_stock}, expected {triggered} at {stock}'
+                    )
+
+        if options['verify']:
+            if stale:
+                raise CommandError(f'{len(stale)} of {total} alerts are out of date')
+            self.stdout.write(self.style.SUCCESS(f'All {total} alerts match'))
+            return
+
+        with transaction.atomic():
+            LowStockAlert.objects.bulk_update(
+                stale, ['is_triggered', 'last_evaluated_stock', 'evaluated_at'], batch_size=1000
+            )
+        for user_id in tenants:
+            bump_data_version(user_id)
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {len(stale)} of {total} alerts'))
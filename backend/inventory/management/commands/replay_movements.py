@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from inventory.cache import bump_data_version
+from inventory.models import DailyProfitRollup, ProductStock, StockBatch, StockMovement
+
+
+class Command(BaseCommand):
+    help = '''Rebuild every batch's quantity, remaining quantity and depletion from the stock movement ledger.
+
+    A batch's quantity is the sum of its intakes, its remaining quantity the sum
+    of all its movements, and it is depleted as of its finish. Stock summaries,
+    profit rollups and alerts are rebuilt afterwards.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only this username')
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report batches whose stored state differs from the ledger'
+        )
+
+    def handle(self, *args, **options):
+        batches = StockBatch.objects.all()
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']}")
+            batches = batches.filter(product__user=user)
+
+        # One grouped query over the ledger for every batch
+        rows = batches.order_by().annotate(
+            ledger_quantity=Coalesce(
+                Sum('movements__quantity', filter=Q(movements__kind=StockMovement.INTAKE)), Value(Decimal('0'))
+            ),
+            ledger_remaining=Coalesce(Sum('movements__quantity'), Value(Decimal('0'))),
+            finished_at=Max('movements__recorded_at', filter=Q(movements__kind=StockMovement.FINISH)),
+            movement_count=Count('movements'),
+        ).values_list(
+            'pk', 'product_id', 'product__user_id', 'quantity', 'remaining_quantity', 'is_depleted', 'depleted_at',
+            'ledger_quantity', 'ledger_remaining', 'finished_at', 'movement_count',
+        )
+
+        stale = []
+        missing = total = 0
+        for (pk, product_id, user_id, quantity, remaining, is_depleted, depleted_at,
+             ledger_quantity, ledger_remaining, finished_at, movement_count) in rows.iterator():
+            total += 1
+            if not movement_count:
+                missing += 1
+                continue
+            state = (ledger_quantity, ledger_remaining, finished_at is not None, finished_at)
+            if state != (quantity, remaining, is_depleted, depleted_at):
+                stale.append((pk, product_id, user_id, state))
+                if options['verbosity'] >= 2 or options['verify']:
+                    self.stdout.write(
+                        f'batch {pk}: stored {quantity}/{remaining} depleted {depleted_at}, '
+                        f'ledger {ledger_quantity}/{ledger_remaining} depleted {finished_at}'
+                    )
+
+        if missing:
+            self.stderr.write(self.style.WARNING(f'{missing} batches have no movements and were left alone'))
+        if options['verify']:
+            if stale:
+                raise CommandError(f'{len(stale)} of {total} batches differ from the ledger')
+            self.stdout.write(self.style.SUCCESS(f'All {total - missing} batches match the ledger'))
+            return
+
+        with transaction.atomic():
+            # Written with update(), as save() would append the changes to the ledger again
+            for pk, _, _, (quantity, remaining, is_depleted, depleted_at) in stale:
+                StockBatch.objects.filter(pk=pk).update(
+                    quantity=quantity, remaining_quantity=remaining,
+                    is_depleted=is_depleted, depleted_at=depleted_at,
+                )
+            if stale:
+                ProductStock.rebuild(list({product_id for _, product_id, _, _ in stale}))
+                DailyProfitRollup.rebuild(list({user_id for _, _, user_id, _ in stale}))
+        for user_id in {user_id for _, _, user_id, _ in stale}:
+            bump_data_version(user_id)
+        self.stdout.write(self.style.SUCCESS(f'Replayed {len(stale)} of {total} batches from the ledger'))
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import Product, StockBatch
+from inventory.stress import run_concurrent_depletions
+
+
+class Command(BaseCommand):
+    help = 'Deplete one batch from many threads and check that no update is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--per-thread', type=int, default=50)
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        per_thread = options['per_thread']
+        expected = threads * per_thread
+
+        user = User.objects.create_user(username='stress-depletion', password=None)
+        try:
+            product = Product.objects.create(
+                user=user, name='Stress product', category='other', default_sell_price=Decimal('1')
+            )
+            batch = StockBatch.objects.create(
+                product=product,
+                quantity=Decimal(expected + 10),
+                remaining_quantity=Decimal(expected + 10),
+                buy_price_per_unit=Decimal('1'),
+                sell_price_per_unit=Decimal('2'),
+            )
+
+            result = run_concurrent_depletions(batch.id, threads=threads, per_thread=per_thread)
+            batch.refresh_from_db()
+
+            self.stdout.write(
+                f"{result['recorded']} depletions from {threads} threads in {result['elapsed']:.2f}s "
+                f"({result['throughput']:.0f}/s, {result['retries']} retries)"
+            )
+            if result['errors']:
+                raise CommandError(f"{len(result['errors'])} threads failed: {result['errors'][0]}")
+
+            lost = batch.remaining_quantity - (Decimal(expected + 10) - result['recorded'])
+            if lost or product.current_stock() != batch.remaining_quantity:
+                raise CommandError(
+                    f'Lost updates: remaining {batch.remaining_quantity}, '
+                    f'ledger {product.current_stock()}, recorded {result["recorded"]}'
+                )
+            self.stdout.write(self.style.SUCCESS('No lost updates'))
+        finally:
+            user.delete()
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import ValuationCheckpoint
+from inventory.valuation import build_checkpoints
+
+
+class Command(BaseCommand):
+    help = '''Write month-start stock valuation checkpoints, so /api/reports/valuation/ replays
+    at most a month of movements. Run it daily or monthly; writes to past stock drop
+    the checkpoints they affect, and the next run writes them again.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only this username')
+        parser.add_argument('--rebuild', action='store_true', help='Drop existing checkpoints first')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(product__isnull=False).distinct().order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"No user named {options['user']} with products")
+
+        written = 0
+        for user in users:
+            if options['rebuild']:
+                ValuationCheckpoint.objects.filter(user=user).delete()
+            months = build_checkpoints(user)
+            written += months
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{user.username}: {months} month starts')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} month starts of checkpoints'))
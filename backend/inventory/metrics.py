@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+MS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_metrics_lock = threading.Lock()
+_metrics = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (the max for the overflow bucket)"""
+        count = sum(self.counts)
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        count = sum(self.counts)
+        return {
+            'mean': round(self.total / count, 2) if count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 2),
+            'buckets': {
+                **{f'le_{bound}': n for bound, n in zip(self.bounds, self.counts)},
+                'inf': self.counts[-1],
+            },
+        }
+
+
+class QueryRecorder:
+    """Database execute wrapper counting a request's queries and the time spent in them.
+
+    A statement run again with the same parameters is a duplicate; one run again
+    with other parameters (the N+1 shape) counts as similar.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    def duplicates(self):
+        return sum(n - 1 for n in self.statements.values())
+
+    def similar(self):
+        shapes = Counter()
+        for (sql, _), n in self.statements.items():
+            shapes[sql] += n
+        return sum(n - 1 for n in shapes.values()) - self.duplicates(), shapes
+
+    def sample(self, wall):
+        similar, shapes = self.similar()
+        sql, repeats = shapes.most_common(1)[0] if shapes else (None, 0)
+        return {
+            'queries': self.count,
+            'duplicates': self.duplicates(),
+            'similar': similar,
+            'db_ms': round(self.duration * 1000, 2),
+            'wall_ms': round(wall * 1000, 2),
+            'most_repeated': sql if repeats > 1 else None,
+        }
+
+
+def endpoint_tag(request):
+    """Route name of the request, e.g. report-by-product for ReportViewSet.by_product"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name or match._func_path
+
+
+def record_request(tag, sample):
+    with _metrics_lock:
+        entry = _metrics.get(tag)
+        if entry is None:
+            entry = _metrics[tag] = {
+                'requests': 0,
+                'duplicates': 0,
+                'similar': 0,
+                'wall_ms': Histogram(MS_BUCKETS),
+                'db_ms': Histogram(MS_BUCKETS),
+                'queries': Histogram(QUERY_BUCKETS),
+                'most_repeated': None,
+            }
+        entry['requests'] += 1
+        entry['duplicates'] += sample['duplicates']
+        entry['similar'] += sample['similar']
+        for name in ('wall_ms', 'db_ms', 'queries'):
+            entry[name].observe(sample[name])
+        if sample['most_repeated']:
+            entry['most_repeated'] = sample['most_repeated']
+
+
+def request_metrics():
+    """Aggregated query and latency histograms per endpoint for this process"""
+    with _metrics_lock:
+        return {
+            tag: {
+                name: value.as_dict() if isinstance(value, Histogram) else value
+                for name, value in entry.items()
+            }
+            for tag, entry in sorted(_metrics.items())
+        }
+
+
+def reset_request_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def check_budget(tag, sample):
+    """Compare a request with INVENTORY_QUERY_BUDGETS[tag]; raise in strict mode, log otherwise"""
+    budget = getattr(settings, 'INVENTORY_QUERY_BUDGETS', {}).get(tag)
+    if not budget:
+        return
+    over = [f'{name} {sample[name]} > {limit}' for name, limit in budget.items() if sample[name] > limit]
+    if not over:
+        return
+    message = f"{tag} over budget: {', '.join(over)}"
+    if sample['most_repeated'] and (sample['duplicates'] or sample['similar']):
+        message += f"; most repeated: {sample['most_repeated']}"
+    if getattr(settings, 'INVENTORY_QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryMetricsMiddleware:
+    """Record query count, DB time, duplicate queries and wall time of every request.
+
+    Opt in with INVENTORY_REQUEST_METRICS. The figures go to /api/_metrics/
+    and the X-Query-Count, X-Duplicate-Queries and Server-Timing headers.
+    Only queries on the request's own thread are seen, so the async views'
+    parallel parts and streamed bodies are left out.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+        sample = recorder.sample(time.perf_counter() - started)
+
+        tag = endpoint_tag(request)
+        record_request(tag, sample)
+        response['X-Query-Count'] = str(sample['queries'])
+        response['X-Duplicate-Queries'] = str(sample['duplicates'])
+        response['Server-Timing'] = f"db;dur={sample['db_ms']}, total;dur={sample['wall_ms']}"
+        check_budget(tag, sample)
+        return response
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:19
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_stock_summary(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    ProductStock = apps.get_model('inventory', 'ProductStock')
+    active = models.Q(batches__is_depleted=False)
+    rows = Product.objects.order_by().values('pk').annotate(
+        quantity=models.Sum('batches__remaining_quantity', filter=active),
+        value=models.Sum(
+            models.F('batches__remaining_quantity') * models.F('batches__buy_price_per_unit'),
+            filter=active
+        ),
+        batch_count=models.Count('batches', filter=active),
+        last_depleted=models.Max('batches__depleted_at'),
+    )
+    ProductStock.objects.bulk_create([
+        ProductStock(
+            product_id=r['pk'],
+            on_hand_quantity=r['quantity'] or Decimal('0'),
+            on_hand_value=r['value'] or Decimal('0'),
+            active_batches=r['batch_count'],
+            last_depleted_at=r['last_depleted'],
+        ) for r in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_summary', serialize=False, to='inventory.product')),
+                ('on_hand_quantity', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('on_hand_value', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=20)),
+                ('active_batches', models.IntegerField(default=0)),
+                ('last_depleted_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_stock_summary, migrations.RunPython.noop),
+    ]
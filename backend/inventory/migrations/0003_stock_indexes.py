@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_productstock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='partialdepletion',
+            index=models.Index(fields=['batch', 'recorded_at'], name='depletion_batch_recorded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='partialdepletion',
+            index=models.Index(fields=['recorded_at'], name='depletion_recorded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockbatch',
+            index=models.Index(condition=models.Q(('is_depleted', False)), fields=['product', 'added_at'], name='batch_active_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockbatch',
+            index=models.Index(condition=models.Q(('is_depleted', True)), fields=['product', 'depleted_at'], name='batch_depleted_at_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    StockBatch = apps.get_model('inventory', 'StockBatch')
+    DailyProfitRollup = apps.get_model('inventory', 'DailyProfitRollup')
+    decimal_field = models.DecimalField(max_digits=20, decimal_places=2)
+    sold = models.ExpressionWrapper(
+        models.F('quantity') - models.F('remaining_quantity'), output_field=decimal_field
+    )
+    rows = StockBatch.objects.filter(
+        is_depleted=True, depleted_at__isnull=False
+    ).annotate(day=TruncDate('depleted_at')).order_by().values(
+        'product__user_id', 'day', 'product__category'
+    ).annotate(
+        revenue=models.Sum(sold * models.F('sell_price_per_unit'), output_field=decimal_field),
+        cost=models.Sum(sold * models.F('buy_price_per_unit'), output_field=decimal_field),
+        units=models.Sum(sold),
+        count=models.Count('id'),
+    )
+    DailyProfitRollup.objects.bulk_create([
+        DailyProfitRollup(
+            user_id=r['product__user_id'],
+            day=r['day'],
+            category=r['product__category'],
+            revenue=r['revenue'] or Decimal('0'),
+            cost=r['cost'] or Decimal('0'),
+            profit=(r['revenue'] or Decimal('0')) - (r['cost'] or Decimal('0')),
+            units=r['units'] or Decimal('0'),
+            batches_depleted=r['count'],
+        ) for r in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stock_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProfitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(max_length=50)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=20)),
+                ('cost', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=20)),
+                ('profit', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=20)),
+                ('units', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=20)),
+                ('batches_depleted', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profit_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['day'],
+                'unique_together': {('user', 'day', 'category')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
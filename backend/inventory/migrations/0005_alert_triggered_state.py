@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:20
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+
+
+def evaluate_alerts(apps, schema_editor):
+    LowStockAlert = apps.get_model('inventory', 'LowStockAlert')
+    ProductStock = apps.get_model('inventory', 'ProductStock')
+    stock = Coalesce(
+        models.Subquery(ProductStock.objects.filter(
+            product_id=models.OuterRef('product_id')
+        ).values('on_hand_quantity')[:1]),
+        models.Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2)
+    )
+    LowStockAlert.objects.update(
+        last_evaluated_stock=stock,
+        is_triggered=LessThanOrEqual(stock, models.F('threshold_quantity')),
+        evaluated_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_daily_profit_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='evaluated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='is_triggered',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='lowstockalert',
+            name='last_evaluated_stock',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lowstockalert',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_triggered', True)), fields=['product'], name='alert_triggered_idx'),
+        ),
+        migrations.RunPython(evaluate_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_report_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValuationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('average_cost', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('layers', models.JSONField(default=list)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuation_checkpoints', to='inventory.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuation_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['as_of'],
+                'indexes': [models.Index(fields=['user', 'as_of'], name='valuation_user_as_of_idx')],
+                'unique_together': {('product', 'as_of')},
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_movements(apps, schema_editor):
+    """Derive each batch's movements from its state and partial depletions, as StockMovement.history does"""
+    StockBatch = apps.get_model('inventory', 'StockBatch')
+    PartialDepletion = apps.get_model('inventory', 'PartialDepletion')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+
+    depletions = {}
+    for batch_id, quantity_used, recorded_at in PartialDepletion.objects.order_by(
+        'batch_id', 'recorded_at', 'id'
+    ).values_list('batch_id', 'quantity_used', 'recorded_at').iterator():
+        depletions.setdefault(batch_id, []).append((quantity_used, recorded_at))
+
+    movements = []
+    for batch in StockBatch.objects.order_by().values(
+        'id', 'product_id', 'product__user_id', 'quantity', 'remaining_quantity',
+        'buy_price_per_unit', 'added_at', 'depleted_at', 'is_depleted'
+    ).iterator():
+        def movement(kind, quantity, recorded_at):
+            movements.append(StockMovement(
+                user_id=batch['product__user_id'], product_id=batch['product_id'], batch_id=batch['id'],
+                kind=kind, quantity=quantity, unit_cost=batch['buy_price_per_unit'], recorded_at=recorded_at,
+            ))
+
+        balance = batch['quantity']
+        moment = batch['added_at']
+        movement('intake', balance, moment)
+        for quantity_used, recorded_at in depletions.get(batch['id'], []):
+            used = min(quantity_used, max(balance, Decimal('0')))
+            moment = recorded_at
+            if used:
+                movement('use', -used, recorded_at)
+                balance -= used
+
+        finished_at = batch['depleted_at'] or moment
+        if batch['is_depleted'] and batch['remaining_quantity'] == 0:
+            movement('finish', -balance, finished_at)
+        else:
+            if batch['remaining_quantity'] != balance:
+                movement('adjustment', batch['remaining_quantity'] - balance, moment)
+            if batch['is_depleted']:
+                movement('finish', Decimal('0'), finished_at)
+
+        if len(movements) >= 5000:
+            StockMovement.objects.bulk_create(movements)
+            movements = []
+    StockMovement.objects.bulk_create(movements)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_valuation_checkpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('intake', 'Intake'), ('use', 'Partial use'), ('finish', 'Finish'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.stockbatch')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['recorded_at', 'id'],
+                'indexes': [models.Index(fields=['user', 'recorded_at'], name='movement_user_recorded_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_movements, migrations.RunPython.noop),
+    ]
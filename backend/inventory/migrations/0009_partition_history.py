@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations
+
+from inventory.partitions import PARTITIONED, convert, is_partitioned
+
+
+def partition_history(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or not getattr(settings, 'INVENTORY_PARTITION_HISTORY', False):
+        return
+    with connection.cursor() as cursor:
+        for table, column in PARTITIONED.items():
+            if not is_partitioned(cursor, table):
+                convert(cursor, table, column)
+
+
+def unpartition_history(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for table, column in PARTITIONED.items():
+            if is_partitioned(cursor, table):
+                convert(cursor, table, column, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_stock_movement'),
+    ]
+
+    operations = [
+        # Postgres with INVENTORY_PARTITION_HISTORY only; elsewhere the tables stay as they are
+        migrations.RunPython(partition_history, unpartition_history),
+    ]
@@ -1,7 +1,35 @@
 from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.db.models.lookups import LessThanOrEqual
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
+from .events import publish_event
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_stock_summary(self):
+        """Annotate stock totals from the stock ledger and prefetch the active batches used for velocity"""
+        decimal_field = models.DecimalField(max_digits=20, decimal_places=2)
+        return self.select_related('alert').annotate(
+            stock_total=Coalesce(
+                'stock_summary__on_hand_quantity',
+                models.Value(Decimal('0')),
+                output_field=decimal_field
+            ),
+            stock_value=Coalesce(
+                'stock_summary__on_hand_value',
+                models.Value(Decimal('0')),
+                output_field=decimal_field
+            )
+        ).prefetch_related(models.Prefetch(
+            'batches',
+            queryset=StockBatch.objects.filter(is_depleted=False).only(
+                'id', 'product_id', 'quantity', 'remaining_quantity',
+                'added_at', 'depleted_at', 'is_depleted'
+            ),
+            to_attr='active_batches'
+        ))
 
 # Product model
 class Product(models.Model):
@@ -19,6 +47,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'name']
@@ -28,23 +58,51 @@ class Product(models.Model):
 
 
     def current_stock(self):
-        total = self.batches.filter(is_depleted=False).aggregate(
-            total=models.Sum('remaining_quantity')
-        )['total']
-        return total or Decimal('0')
+        # Use the with_stock_summary() annotation when present
+        if hasattr(self, 'stock_total'):
+            return self.stock_total
+        return self._ledger_value('on_hand_quantity')
 
     @property
     def total_value(self):
-        batches = self.batches.filter(is_depleted = False)
-        return sum(batch.remaining_quantity * batch.buy_price_per_unit for batch in batches)
+        if hasattr(self, 'stock_value'):
+            return self.stock_value
+        return self._ledger_value('on_hand_value')
+
+    def _ledger_value(self, field):
+        # Reuse a select_related('stock_summary') row, otherwise read it by key
+        if Product.stock_summary.is_cached(self):
+            try:
+                return getattr(self.stock_summary, field)
+            except ProductStock.DoesNotExist:
+                return Decimal('0')
+        value = ProductStock.objects.filter(product_id=self.pk).values_list(
+            field, flat=True
+        ).first()
+        return value or Decimal('0')
     
     @property
     def average_velocity(self):
-        batches = self.batches.filter(is_depleted = False)
-        if not batches.exists():
+        if hasattr(self, 'active_batches'):
+            batches = self.active_batches
+        else:
+            batches = list(self.batches.filter(is_depleted = False))
+        if not batches:
             return 0
         velocities = [b.velocity for b in batches]
-        return sum(velocities) / len(velocities) if velocities else 0
+        return sum(velocities) / len(velocities)
+
+def _stock_contribution(is_depleted, remaining_quantity, buy_price_per_unit):
+    if is_depleted or remaining_quantity is None:
+        return Decimal('0'), Decimal('0'), 0
+    remaining = Decimal(str(remaining_quantity))
+    return remaining, remaining * Decimal(str(buy_price_per_unit)), 1
+
+# Batch fields a depleted batch's daily rollup contribution depends on
+ROLLUP_FIELDS = [
+    'product_id', 'quantity', 'remaining_quantity', 'buy_price_per_unit',
+    'sell_price_per_unit', 'depleted_at'
+]
 
 # Stockbatch model  
 class StockBatch(models.Model):
@@ -61,6 +119,20 @@ class StockBatch(models.Model):
     class Meta:
         ordering = ['-added_at']
         verbose_name_plural = 'Stock Batches'
+        indexes = [
+            # FIFO depletion and on-hand listings: open batches per product, oldest first
+            models.Index(
+                fields=['product', 'added_at'],
+                condition=models.Q(is_depleted=False),
+                name='batch_active_fifo_idx'
+            ),
+            # Dashboard, reports and history: depleted batches per product by depletion time
+            models.Index(
+                fields=['product', 'depleted_at'],
+                condition=models.Q(is_depleted=True),
+                name='batch_depleted_at_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name}- {self.quantity} units"
@@ -102,23 +174,116 @@ class StockBatch(models.Model):
         sold = self.quantity - self.remaining_quantity
         return float(sold) / self.days_in_stock
 
+    def stock_contribution(self):
+        """(quantity, value, batches) this batch adds to its product's on-hand stock"""
+        return _stock_contribution(
+            self.is_depleted, self.remaining_quantity, self.buy_price_per_unit
+        )
+
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        if is_new:
-            threshold = self.quantity / Decimal('5')
-            LowStockAlert.objects.get_or_create(
-                product=self.product,
-                defaults = {'threshold_quantity': threshold}
-            )
+        with transaction.atomic():
+            previous = None
+            if not is_new:
+                previous = StockBatch.objects.select_for_update().filter(pk=self.pk).values(
+                    *ROLLUP_FIELDS, 'is_depleted', 'added_at'
+                ).first()
+            super().save(*args, **kwargs)
+            self._sync_stock_summary(previous)
+            self._sync_rollups(previous)
+            self._record_movements(previous)
+            self._invalidate_checkpoints(previous)
+            if is_new:
+                threshold = self.quantity / Decimal('5')
+                LowStockAlert.objects.get_or_create(
+                    product=self.product,
+                    defaults = {'threshold_quantity': threshold}
+                )
+
+    def rollup_values(self):
+        return {field: getattr(self, field) for field in ROLLUP_FIELDS}
+
+    def _sync_rollups(self, previous):
+        old = previous if previous and previous['is_depleted'] else None
+        new = self.rollup_values() if self.is_depleted else None
+        if old and new and all(old[field] == new[field] for field in ROLLUP_FIELDS):
+            return
+        if old:
+            DailyProfitRollup.record([old], sign=-1)
+        if new:
+            DailyProfitRollup.record([new])
+            if not old:
+                publish_event(self.product.user_id, 'batch.depleted', {
+                    'batch_id': self.pk, 'product_id': self.product_id
+                })
+
+    def _sync_stock_summary(self, previous):
+        current = self.stock_contribution()
+        newly_depleted = self.is_depleted and not (previous and previous['is_depleted'])
+        depleted_at = self.depleted_at if newly_depleted else None
+
+        if previous is None:
+            ProductStock.apply_delta(self.product_id, *current, depleted_at=depleted_at)
+            return
+
+        old = _stock_contribution(
+            previous['is_depleted'], previous['remaining_quantity'], previous['buy_price_per_unit']
+        )
+        if previous['product_id'] != self.product_id:
+            ProductStock.apply_delta(previous['product_id'], *(-o for o in old))
+            ProductStock.apply_delta(self.product_id, *current, depleted_at=depleted_at)
+        else:
+            delta = [c - o for c, o in zip(current, old)]
+            ProductStock.apply_delta(self.product_id, *delta, depleted_at=depleted_at)
     
 
+    def movement(self, kind, quantity, recorded_at):
+        return StockMovement(
+            user_id=self.product.user_id,
+            product_id=self.product_id,
+            batch=self,
+            kind=kind,
+            quantity=quantity,
+            unit_cost=self.buy_price_per_unit,
+            recorded_at=recorded_at,
+        )
+
+    def _record_movements(self, previous):
+        # Append the ledger rows taking the batch from its previous state to this one
+        when = timezone.now() if previous else self.added_at
+        balance = previous['remaining_quantity'] if previous else Decimal('0')
+        added = self.quantity - (previous['quantity'] if previous else Decimal('0'))
+        finishing = self.is_depleted and not (previous and previous['is_depleted'])
+
+        movements = []
+        if added:
+            movements.append(self.movement(StockMovement.INTAKE, added, when))
+            balance += added
+        if finishing and self.remaining_quantity == 0:
+            movements.append(self.movement(StockMovement.FINISH, -balance, self.depleted_at or when))
+        else:
+            if self.remaining_quantity != balance:
+                movements.append(self.movement(StockMovement.ADJUSTMENT, self.remaining_quantity - balance, when))
+            if finishing:
+                movements.append(self.movement(StockMovement.FINISH, Decimal('0'), self.depleted_at or when))
+        StockMovement.objects.bulk_create(movements)
+
+    def _invalidate_checkpoints(self, previous):
+        # Valuations from the earliest moment this save changed onwards must be replayed
+        times = [self.added_at, self.depleted_at]
+        if previous:
+            times += [previous['added_at'], previous['depleted_at']]
+        ValuationCheckpoint.invalidate(self.product.user_id, min(t for t in times if t is not None))
+
     def mark_depleted(self, status = 'finished'):
         self.is_depleted = True
         self.depleted_at = timezone.now()
+        update_fields = ['is_depleted', 'depleted_at']
         if status == 'finished':
             self.remaining_quantity = 0
-        self.save()
+            update_fields.append('remaining_quantity')
+        # Leave other columns alone so a concurrent partial depletion is not overwritten
+        self.save(update_fields=update_fields)
 
 
 class PartialDepletion(models.Model):
@@ -129,6 +294,10 @@ class PartialDepletion(models.Model):
 
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['batch', 'recorded_at'], name='depletion_batch_recorded_idx'),
+            models.Index(fields=['recorded_at'], name='depletion_recorded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.batch.product.name} - {self.quantity_used} used"
@@ -137,14 +306,53 @@ class PartialDepletion(models.Model):
         with transaction.atomic():
             if isinstance(self.quantity_used, str):
                 self.quantity_used = Decimal(self.quantity_used)
-            self.batch.remaining_quantity -= self.quantity_used
-            if self.batch.remaining_quantity <= 0:
-                self.batch.remaining_quantity = Decimal('0')
-                self.batch.mark_depleted()
+            batch = self.batch
+
+            # Decrement in the database rather than in Python: the UPDATE takes the
+            # row lock (the write lock on SQLite) first, so concurrent depletions of
+            # the same batch queue up instead of overwriting each other
+            updated = StockBatch.objects.filter(pk=batch.pk, is_depleted=False).update(
+                remaining_quantity=models.F('remaining_quantity') - self.quantity_used
+            )
+            if not updated:
+                raise ValueError('Batch is already depleted')
+            batch.refresh_from_db(fields=['remaining_quantity'])
+
+            used = self.quantity_used
+            if batch.remaining_quantity <= 0:
+                # Only what was left can be used; the batch is now finished
+                used += batch.remaining_quantity
+                batch.remaining_quantity = Decimal('0')
+                batch.is_depleted = True
+                batch.depleted_at = timezone.now()
+                StockBatch.objects.filter(pk=batch.pk).update(
+                    remaining_quantity=batch.remaining_quantity,
+                    is_depleted=True,
+                    depleted_at=batch.depleted_at
+                )
+                StockMovement.objects.bulk_create([
+                    batch.movement(StockMovement.USE, -used, self.recorded_at),
+                    batch.movement(StockMovement.FINISH, Decimal('0'), batch.depleted_at),
+                ])
+                ProductStock.apply_delta(
+                    batch.product_id, -used, -used * batch.buy_price_per_unit, -1,
+                    depleted_at=max(batch.depleted_at, self.recorded_at)
+                )
+                DailyProfitRollup.record([batch.rollup_values()])
+                publish_event(batch.product.user_id, 'batch.depleted', {
+                    'batch_id': batch.pk, 'product_id': batch.product_id
+                })
             else:
-                self.batch.save()
+                ProductStock.apply_delta(
+                    batch.product_id, -used, -used * batch.buy_price_per_unit, depleted_at=self.recorded_at
+                )
+                batch.movement(StockMovement.USE, -used, self.recorded_at).save()
                 self.update_alert_threshold()
+                publish_event(batch.product.user_id, 'batch.updated', {
+                    'batch_id': batch.pk, 'remaining_quantity': batch.remaining_quantity
+                })
             super().save(*args, **kwargs)
+            ValuationCheckpoint.invalidate(batch.product.user_id, self.recorded_at)
 
     def update_alert_threshold(self):
         total_stock = self.batch.product.current_stock()
@@ -154,16 +362,424 @@ class PartialDepletion(models.Model):
                 product = self.batch.product,
                 defaults={'threshold_quantity': new_threshold}
             )
-    
+
+
+class StockMovement(models.Model):
+    """Append-only ledger of every change to a batch's stock; a batch's movements sum to its remaining quantity.
+
+    An intake brings a batch's quantity in, a use is a partial depletion, a
+    finish takes out what was left when a batch is marked finished (nothing
+    for other depletion statuses, which keep their remainder) and an
+    adjustment records any other change to the remaining quantity.
+    """
+    INTAKE = 'intake'
+    USE = 'use'
+    FINISH = 'finish'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (INTAKE, 'Intake'),
+        (USE, 'Partial use'),
+        (FINISH, 'Finish'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_movements')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements')
+    batch = models.ForeignKey(StockBatch, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['recorded_at', 'id']
+        indexes = [
+            # Tenant analytics scan time windows
+            models.Index(fields=['user', 'recorded_at'], name='movement_user_recorded_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity} of batch {self.batch_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Stock movements are append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Stock movements are append-only')
+
+    @staticmethod
+    def history(batch, depletions):
+        """(kind, quantity, recorded_at) that lead to a batch's current state, from its partial depletions"""
+        balance = batch['quantity']
+        moment = batch['added_at']
+        rows = [(StockMovement.INTAKE, batch['quantity'], moment)]
+        for quantity_used, recorded_at in depletions:
+            used = min(quantity_used, max(balance, Decimal('0')))
+            moment = recorded_at
+            if used:
+                rows.append((StockMovement.USE, -used, recorded_at))
+                balance -= used
+
+        finished_at = batch['depleted_at'] or moment
+        if batch['is_depleted'] and batch['remaining_quantity'] == 0:
+            rows.append((StockMovement.FINISH, -balance, finished_at))
+            return rows
+        if batch['remaining_quantity'] != balance:
+            rows.append((StockMovement.ADJUSTMENT, batch['remaining_quantity'] - balance, moment))
+        if batch['is_depleted']:
+            rows.append((StockMovement.FINISH, Decimal('0'), finished_at))
+        return rows
+
+    @classmethod
+    def backfill(cls, batches):
+        """Write the movements of a queryset of batches loaded in bulk, which have none yet"""
+        depletions = {}
+        for batch_id, quantity_used, recorded_at in PartialDepletion.objects.filter(
+            batch__in=batches.values('pk')
+        ).order_by('batch_id', 'recorded_at', 'id').values_list('batch_id', 'quantity_used', 'recorded_at').iterator():
+            depletions.setdefault(batch_id, []).append((quantity_used, recorded_at))
+
+        movements = []
+        written = 0
+        for batch in batches.order_by().values(
+            'id', 'product_id', 'product__user_id', 'quantity', 'remaining_quantity',
+            'buy_price_per_unit', 'added_at', 'depleted_at', 'is_depleted'
+        ).iterator():
+            for kind, quantity, recorded_at in cls.history(batch, depletions.get(batch['id'], [])):
+                movements.append(cls(
+                    user_id=batch['product__user_id'],
+                    product_id=batch['product_id'],
+                    batch_id=batch['id'],
+                    kind=kind,
+                    quantity=quantity,
+                    unit_cost=batch['buy_price_per_unit'],
+                    recorded_at=recorded_at,
+                ))
+            if len(movements) >= 5000:
+                written += len(cls.objects.bulk_create(movements))
+                movements = []
+        written += len(cls.objects.bulk_create(movements))
+        return written
+
+
 class LowStockAlert(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='alert')
     threshold_quantity = models.DecimalField(max_digits=10,  decimal_places=2)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Stored state, re-evaluated whenever the product's stock or the threshold changes
+    is_triggered = models.BooleanField(default=False)
+    last_evaluated_stock = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    evaluated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['product'],
+                condition=models.Q(is_triggered=True, is_active=True),
+                name='alert_triggered_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} < {self.threshold_quantity}"
-    
-    @property
-    def is_triggered(self):
-        return self.product.current_stock() <= self.threshold_quantity
+
+    def save(self, *args, **kwargs):
+        stock = ProductStock.objects.filter(product_id=self.product_id).values_list(
+            'on_hand_quantity', flat=True
+        ).first() or Decimal('0')
+        was_triggered = self.is_triggered if self.pk else False
+        self.last_evaluated_stock = stock
+        self.is_triggered = stock <= Decimal(str(self.threshold_quantity))
+        self.evaluated_at = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'last_evaluated_stock', 'is_triggered', 'evaluated_at'
+            }
+        super().save(*args, **kwargs)
+        if self.is_triggered != was_triggered:
+            self._publish_state(self.product.user_id, self.product.name, stock)
+
+    def _publish_state(self, user_id, product_name, stock):
+        publish_event(user_id, 'alert.triggered' if self.is_triggered else 'alert.cleared', {
+            'product_id': self.product_id,
+            'product': product_name,
+            'remaining': stock,
+            'threshold': self.threshold_quantity,
+        })
+
+    @classmethod
+    def evaluate(cls, product_ids=None):
+        """Re-evaluate the alerts of these products against the stock ledger in one UPDATE"""
+        alerts = cls.objects.all()
+        if product_ids is not None:
+            alerts = alerts.filter(product_id__in=product_ids)
+        stock = Coalesce(
+            models.Subquery(ProductStock.objects.filter(
+                product_id=models.OuterRef('product_id')
+            ).values('on_hand_quantity')[:1]),
+            models.Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2)
+        )
+        # Alerts about to change state, so their streams can be told
+        below = models.Q(stock__lte=models.F('threshold_quantity'))
+        flipping = list(alerts.annotate(stock=stock).filter(
+            (models.Q(is_triggered=False) & below) | (models.Q(is_triggered=True) & ~below)
+        ).values_list('pk', 'product_id', 'product__user_id', 'product__name', 'stock', 'threshold_quantity'))
+
+        updated = alerts.update(
+            last_evaluated_stock=stock,
+            is_triggered=LessThanOrEqual(stock, models.F('threshold_quantity')),
+            evaluated_at=timezone.now()
+        )
+        for pk, product_id, user_id, name, current, threshold in flipping:
+            alert = cls(
+                pk=pk, product_id=product_id, threshold_quantity=threshold,
+                is_triggered=current <= threshold
+            )
+            alert._publish_state(user_id, name, current)
+        return updated
+
+
+
+# Materialized stock ledger
+class ProductStock(models.Model):
+    """Denormalized on-hand stock per product, kept in step by StockBatch and PartialDepletion writes"""
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name='stock_summary', primary_key=True
+    )
+    on_hand_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    on_hand_value = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0'))
+    active_batches = models.IntegerField(default=0)
+    last_depleted_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product.name}: {self.on_hand_quantity} on hand"
+
+    @classmethod
+    def apply_delta(cls, product_id, quantity=0, value=0, batches=0, depleted_at=None):
+        if not (quantity or value or batches or depleted_at):
+            return
+        cls.objects.get_or_create(product_id=product_id)
+        updates = {
+            'on_hand_quantity': models.F('on_hand_quantity') + quantity,
+            'on_hand_value': models.F('on_hand_value') + value,
+            'active_batches': models.F('active_batches') + batches,
+            'updated_at': timezone.now(),
+        }
+        if depleted_at is not None:
+            updates['last_depleted_at'] = Greatest(
+                Coalesce('last_depleted_at', models.Value(depleted_at)),
+                models.Value(depleted_at)
+            )
+        cls.objects.filter(product_id=product_id).update(**updates)
+        if quantity:
+            LowStockAlert.evaluate([product_id])
+
+    @classmethod
+    def compute(cls, product_ids=None):
+        """Recompute summaries from the batch tables, keyed by product id"""
+        products = Product.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        active = models.Q(batches__is_depleted=False)
+        decimal_field = models.DecimalField(max_digits=20, decimal_places=2)
+        rows = products.order_by().values('pk').annotate(
+            quantity=Coalesce(
+                models.Sum('batches__remaining_quantity', filter=active),
+                models.Value(Decimal('0')), output_field=decimal_field
+            ),
+            value=Coalesce(
+                models.Sum(
+                    models.F('batches__remaining_quantity') * models.F('batches__buy_price_per_unit'),
+                    filter=active
+                ),
+                models.Value(Decimal('0')), output_field=decimal_field
+            ),
+            batch_count=models.Count('batches', filter=active),
+            last_depleted=models.Max('batches__depleted_at'),
+        )
+
+        partial_rows = PartialDepletion.objects.order_by().values('batch__product_id').annotate(
+            last_recorded=models.Max('recorded_at')
+        )
+        if product_ids is not None:
+            partial_rows = partial_rows.filter(batch__product_id__in=product_ids)
+        last_partial = {r['batch__product_id']: r['last_recorded'] for r in partial_rows}
+
+        summaries = {}
+        for r in rows:
+            moments = [m for m in (r['last_depleted'], last_partial.get(r['pk'])) if m]
+            summaries[r['pk']] = cls(
+                product_id=r['pk'],
+                on_hand_quantity=r['quantity'],
+                on_hand_value=r['value'],
+                active_batches=r['batch_count'],
+                last_depleted_at=max(moments) if moments else None,
+            )
+        return summaries
+
+    @classmethod
+    def rebuild(cls, product_ids=None):
+        summaries = list(cls.compute(product_ids).values())
+        for summary in summaries:
+            summary.updated_at = timezone.now()
+        cls.objects.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['on_hand_quantity', 'on_hand_value', 'active_batches',
+                           'last_depleted_at', 'updated_at'],
+            batch_size=1000
+        )
+        LowStockAlert.evaluate(product_ids)
+        return len(summaries)
+
+
+
+# Daily profit rollups
+class DailyProfitRollup(models.Model):
+    """Per-user, per-day, per-category totals of depleted batches, kept current on depletion"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='profit_rollups')
+    day = models.DateField()
+    category = models.CharField(max_length=50)
+    revenue = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0'))
+    cost = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0'))
+    profit = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0'))
+    units = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0'))
+    batches_depleted = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        unique_together = ['user', 'day', 'category']
+
+    def __str__(self):
+        return f"{self.user} {self.day} {self.category}: {self.profit}"
+
+    @classmethod
+    def record(cls, batches, sign=1):
+        """Add depleted batches (dicts of ROLLUP_FIELDS values) to their days, or remove them with sign=-1"""
+        batches = [b for b in batches if b['depleted_at'] is not None]
+        if not batches:
+            return
+        owners = {
+            pk: (user_id, category)
+            for pk, user_id, category in Product.objects.filter(
+                pk__in={b['product_id'] for b in batches}
+            ).values_list('pk', 'user_id', 'category')
+        }
+
+        totals = {}
+        for b in batches:
+            user_id, category = owners[b['product_id']]
+            key = (user_id, timezone.localdate(b['depleted_at']), category)
+            sold = Decimal(str(b['quantity'])) - Decimal(str(b['remaining_quantity']))
+            row = totals.setdefault(key, [Decimal('0'), Decimal('0'), Decimal('0'), 0])
+            row[0] += sold * Decimal(str(b['sell_price_per_unit']))
+            row[1] += sold * Decimal(str(b['buy_price_per_unit']))
+            row[2] += sold
+            row[3] += 1
+        cls.add_totals(totals, sign)
+
+    @classmethod
+    def add_totals(cls, totals, sign=1):
+        """Add {(user_id, day, category): [revenue, cost, units, batches]} to the rollups"""
+        for (user_id, day, category), (revenue, cost, units, count) in totals.items():
+            cls.objects.get_or_create(user_id=user_id, day=day, category=category)
+            cls.objects.filter(user_id=user_id, day=day, category=category).update(
+                revenue=models.F('revenue') + sign * revenue,
+                cost=models.F('cost') + sign * cost,
+                profit=models.F('profit') + sign * (revenue - cost),
+                units=models.F('units') + sign * units,
+                batches_depleted=models.F('batches_depleted') + sign * count,
+            )
+            publish_event(user_id, 'profit.updated', {
+                'day': day.isoformat(),
+                'revenue': sign * revenue,
+                'profit': sign * (revenue - cost),
+                'batches': sign * count,
+            })
+
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        """Recompute rollups from the depleted batches with one grouped query"""
+        batches = StockBatch.objects.filter(is_depleted=True, depleted_at__isnull=False)
+        existing = cls.objects.all()
+        if user_ids is not None:
+            batches = batches.filter(product__user_id__in=user_ids)
+            existing = existing.filter(user_id__in=user_ids)
+
+        decimal_field = models.DecimalField(max_digits=20, decimal_places=2)
+        sold = models.ExpressionWrapper(
+            models.F('quantity') - models.F('remaining_quantity'), output_field=decimal_field
+        )
+        rows = batches.annotate(day=TruncDate('depleted_at')).order_by().values(
+            'product__user_id', 'day', 'product__category'
+        ).annotate(
+            revenue=models.Sum(sold * models.F('sell_price_per_unit'), output_field=decimal_field),
+            cost=models.Sum(sold * models.F('buy_price_per_unit'), output_field=decimal_field),
+            units=models.Sum(sold),
+            count=models.Count('id'),
+        )
+
+        with transaction.atomic():
+            existing.delete()
+            rollups = cls.objects.bulk_create([
+                cls(
+                    user_id=r['product__user_id'],
+                    day=r['day'],
+                    category=r['product__category'],
+                    revenue=r['revenue'] or Decimal('0'),
+                    cost=r['cost'] or Decimal('0'),
+                    profit=(r['revenue'] or Decimal('0')) - (r['cost'] or Decimal('0')),
+                    units=r['units'] or Decimal('0'),
+                    batches_depleted=r['count'],
+                ) for r in rows
+            ], batch_size=1000)
+        return len(rollups)
+
+
+class ReportSnapshot(models.Model):
+    """A tenant's report payload precomputed by the precompute_reports worker"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_snapshots')
+    name = models.CharField(max_length=50)
+    data = models.JSONField()
+    # Tenant data version the payload was computed at; blank when the cache had none
+    data_version = models.CharField(max_length=40, blank=True)
+    computed_at = models.DateTimeField()
+    duration_ms = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'name']
+
+    def __str__(self):
+        return f"{self.user} {self.name} at {self.computed_at}"
+
+
+class ValuationCheckpoint(models.Model):
+    """A product's on-hand quantity and cost layers at a month start, so valuations replay from there"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='valuation_checkpoints')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='valuation_checkpoints')
+    as_of = models.DateTimeField()
+    quantity = models.DecimalField(max_digits=14, decimal_places=2)
+    average_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    # [[quantity, unit cost], ...] oldest first: the newest intakes covering the quantity
+    layers = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['as_of']
+        unique_together = ['product', 'as_of']
+        indexes = [
+            models.Index(fields=['user', 'as_of'], name='valuation_user_as_of_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} at {self.as_of}: {self.quantity}"
+
+    @classmethod
+    def invalidate(cls, user_id, since):
+        """Drop a tenant's checkpoints from since on, after a change to its history at that time"""
+        cls.objects.filter(user_id=user_id, as_of__gte=since).delete()
@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+def approximate_count(queryset, exact_limit=10000):
+    """Cheap row count: the planner estimate on Postgres, a capped COUNT elsewhere.
+
+    Returns (count, is_exact).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+
+    count = queryset.order_by()[:exact_limit + 1].count()
+    return min(count, exact_limit), count <= exact_limit
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pagination on (ordering_field, id).
+
+    Each page is a single indexed range scan from the cursor, so deep pages cost
+    the same as the first one. Pass include_total=true for an approximate total.
+    """
+    ordering_field = 'added_at'
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    total_query_param = 'include_total'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        field = self.ordering_field
+
+        self.total = None
+        if request.query_params.get(self.total_query_param, '').lower() == 'true':
+            self.total = approximate_count(queryset)
+
+        page = queryset.order_by(f'-{field}', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, pk = cursor
+            page = page.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+
+        rows = list(page[:page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            self.next_cursor = self.encode_cursor(getattr(last, field), last.pk)
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, value, pk):
+        raw = json.dumps([value.isoformat(), pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return datetime.fromisoformat(value), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        body = {
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        }
+        if self.total is not None:
+            body['approximate_total'], body['total_is_exact'] = self.total
+        return Response(body)
+
+
+class BatchPagination(KeysetPagination):
+    ordering_field = 'added_at'
+
+
+class DepletedBatchPagination(KeysetPagination):
+    ordering_field = 'depleted_at'
+    page_size = 20
+
+
+class AlertPagination(KeysetPagination):
+    ordering_field = 'created_at'
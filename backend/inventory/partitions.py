@@ -0,0 +1,123 @@
+from datetime import date
+
+from django.db import connection
+
+# History tables range-partitioned by month on Postgres, and their partition key. Depleted
+# batches stay in one table: depletions and movements hold foreign keys to them.
+PARTITIONED = {
+    'inventory_partialdepletion': 'recorded_at',
+    'inventory_stockmovement': 'recorded_at',
+}
+
+
+def add_months(month, months):
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def _bound(month):
+    # Months are UTC, like the timestamps Django stores
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [table])
+    return cursor.fetchone() is not None
+
+
+def partitions(cursor, table):
+    """{first day of month: partition name} of a table's monthly partitions"""
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = %s::regclass', [table]
+    )
+    prefix = f'{table}_p'
+    months = {}
+    for (name,) in cursor.fetchall():
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            months[date(int(suffix[:4]), int(suffix[4:]), 1)] = name
+    return months
+
+
+def create_partition(cursor, table, column, month):
+    """Attach the table's partition for month, moving in any rows its default partition caught"""
+    q = connection.ops.quote_name
+    name = partition_name(table, month)
+    default = f'{table}_default'
+    low, high = _bound(month), _bound(add_months(month, 1))
+    cursor.execute(f'CREATE TABLE {q(name)} (LIKE {q(table)} INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {q(default)} WHERE {q(column)} >= {low} AND {q(column)} < {high} '
+        f'RETURNING *) INSERT INTO {q(name)} SELECT * FROM moved'
+    )
+    cursor.execute(f'ALTER TABLE {q(table)} ATTACH PARTITION {q(name)} FOR VALUES FROM ({low}) TO ({high})')
+    return name
+
+
+def ensure_partitions(cursor, table, column, first, last):
+    """Create the missing monthly partitions from first to last (both months included)"""
+    existing = partitions(cursor, table)
+    created = []
+    month = first.replace(day=1)
+    while month <= last:
+        if month not in existing:
+            created.append(create_partition(cursor, table, column, month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert(cursor, table, column, partitioned=True, months_ahead=3):
+    """Rebuild a table as monthly range partitions on column, or back into a plain table.
+
+    Rows, indexes, foreign keys and the id sequence carry over. A partitioned
+    table's primary key has to include the partition key, so it becomes
+    (id, column); ids still come from one sequence and stay unique.
+    """
+    q = connection.ops.quote_name
+    cursor.execute(
+        'SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s',
+        [table]
+    )
+    indexes = [definition for name, definition in cursor.fetchall() if name != f'{table}_pkey']
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table]
+    )
+    foreign_keys = cursor.fetchall()
+
+    old = f'{table}_unconverted'
+    cursor.execute(f'ALTER TABLE {q(table)} RENAME TO {q(old)}')
+    if partitioned:
+        cursor.execute(f'CREATE TABLE {q(table)} (LIKE {q(old)} INCLUDING DEFAULTS) PARTITION BY RANGE ({q(column)})')
+        cursor.execute(f'CREATE TABLE {q(table + "_default")} PARTITION OF {q(table)} DEFAULT')
+        cursor.execute(f'SELECT MIN({q(column)}), NOW() FROM {q(old)}')
+        first, now = cursor.fetchone()
+        ensure_partitions(cursor, table, column, (first or now).date(), add_months(now.date().replace(day=1), months_ahead))
+    else:
+        cursor.execute(f'CREATE TABLE {q(table)} (LIKE {q(old)} INCLUDING DEFAULTS)')
+    cursor.execute(f'INSERT INTO {q(table)} SELECT * FROM {q(old)}')
+    # Takes the old sequence and the new table's default on it along, and the old partitions
+    cursor.execute(f'DROP TABLE {q(old)} CASCADE')
+
+    sequence = f'{table}_id_seq'
+    cursor.execute(f'CREATE SEQUENCE {q(sequence)} OWNED BY {q(table)}.id')
+    cursor.execute(f"SELECT setval('{sequence}', COALESCE(MAX(id), 0) + 1, false) FROM {q(table)}")
+    cursor.execute(f"ALTER TABLE {q(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    key = f'id, {q(column)}' if partitioned else 'id'
+    cursor.execute(f'ALTER TABLE {q(table)} ADD CONSTRAINT {q(table + "_pkey")} PRIMARY KEY ({key})')
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {q(table)} ADD CONSTRAINT {q(name)} {definition}')
+
+
+def detach_partition(cursor, table, name, drop=False):
+    q = connection.ops.quote_name
+    cursor.execute(f'ALTER TABLE {q(table)} DETACH PARTITION {q(name)}')
+    if drop:
+        cursor.execute(f'DROP TABLE {q(name)}')
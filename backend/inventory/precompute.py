@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.db import connections
+
+# Nothing here imports models at module level: spawned worker processes import
+# this module to unpickle their task before init_worker has set Django up.
+
+
+def shard(user_ids, workers):
+    """Split tenants over the workers by user id, so a tenant always lands on the same one"""
+    shards = [[user_id for user_id in user_ids if user_id % workers == k] for k in range(workers)]
+    return [ids for ids in shards if ids]
+
+
+def init_worker():
+    # Forked workers inherit a set up Django; spawned ones start from a fresh interpreter
+    if not apps.ready:
+        django.setup()
+
+
+def refresh_shard(user_ids, force=False):
+    from .snapshots import refresh_tenants
+    try:
+        return refresh_tenants(user_ids, force)
+    finally:
+        connections.close_all()
+
+
+def precompute(user_ids, workers=1, force=False):
+    """Refresh the tenants' report snapshots on a pool of worker processes.
+
+    Returns {user_id: names recomputed}. With one worker the tenants are
+    refreshed in this process.
+    """
+    if workers <= 1:
+        from .snapshots import refresh_tenants
+        return refresh_tenants(user_ids, force)
+
+    shards = shard(user_ids, workers)
+    if not shards:
+        return {}
+    # Forked workers must open their own connections rather than share the parent's
+    connections.close_all()
+    results = {}
+    with ProcessPoolExecutor(max_workers=len(shards), initializer=init_worker) as pool:
+        for done in pool.map(refresh_shard, shards, [force] * len(shards)):
+            results.update(done)
+    return results
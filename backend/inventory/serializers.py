@@ -2,6 +2,7 @@ from django.db.models import Sum, Q
 from datetime import timedelta
 from django.utils import timezone
 from rest_framework import serializers
+from decimal import Decimal
 from .models import Product, StockBatch, PartialDepletion, LowStockAlert
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -93,21 +94,79 @@ class PartialDepletionSerializer(serializers.ModelSerializer):
 class LowStockAlertSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     current_stock = serializers.SerializerMethodField()
-    is_triggered = serializers.SerializerMethodField()
     
     class Meta:
         model = LowStockAlert
         fields = ['id', 'product', 'product_name', 'threshold_quantity', 
-                  'is_active', 'current_stock', 'is_triggered', 'created_at']
-        read_only_fields = ['created_at']
+                  'is_active', 'current_stock', 'is_triggered', 'evaluated_at', 'created_at']
+        read_only_fields = ['created_at', 'is_triggered', 'evaluated_at']
     
     def get_current_stock(self, obj):
-        return float(obj.product.current_stock)
-    
-    def get_is_triggered(self, obj):
-        return obj.is_triggered
+        return float(obj.product.current_stock())
     
 
+class BulkStockLineSerializer(serializers.Serializer):
+    """One delivery line: an existing product id or a product name to create"""
+    product = serializers.IntegerField(required=False)
+    product_name = serializers.CharField(max_length=200, required=False)
+    category = serializers.ChoiceField(choices=Product.CATEGORY_CHOICES, required=False, default='other')
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    buy_price_per_unit = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    sell_price_per_unit = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, attrs):
+        if not attrs.get('product') and not attrs.get('product_name', '').strip():
+            raise serializers.ValidationError('Provide either product or product_name')
+        return attrs
+
+
+class BulkStockIntakeSerializer(serializers.Serializer):
+    MAX_LINES = 1000
+
+    batches = BulkStockLineSerializer(many=True, allow_empty=False)
+
+    def validate_batches(self, lines):
+        if len(lines) > self.MAX_LINES:
+            raise serializers.ValidationError(f'At most {self.MAX_LINES} lines per request')
+
+        check_products_owned(self.context['request'].user, lines)
+        return lines
+
+
+class BulkDepletionLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BulkDepletionSerializer(serializers.Serializer):
+    MAX_LINES = 1000
+
+    depletions = BulkDepletionLineSerializer(many=True, allow_empty=False)
+
+    def validate_depletions(self, lines):
+        if len(lines) > self.MAX_LINES:
+            raise serializers.ValidationError(f'At most {self.MAX_LINES} lines per request')
+        check_products_owned(self.context['request'].user, lines)
+        return lines
+
+
+def check_products_owned(user, lines):
+    """Raise per-line errors for product ids the user does not own, using one query"""
+    ids = {line['product'] for line in lines if line.get('product')}
+    owned = set(Product.objects.filter(user=user, pk__in=ids).values_list('pk', flat=True))
+
+    errors = []
+    for line in lines:
+        if line.get('product') and line['product'] not in owned:
+            errors.append({'product': [f"Product {line['product']} does not exist"]})
+        else:
+            errors.append({})
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+
 class DashboardSerializer(serializers.Serializer):
     """Dashboard statistics"""
     daily_profit = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_data_version
+from .events import publish_event, batch_added
+from .models import DailyProfitRollup, Product, ProductStock, StockBatch, PartialDepletion, LowStockAlert, ValuationCheckpoint
+
+
+def tenant_id(instance):
+    """User id owning an inventory row"""
+    try:
+        if isinstance(instance, Product):
+            return instance.user_id
+        if isinstance(instance, (StockBatch, LowStockAlert)):
+            return instance.product.user_id
+        if isinstance(instance, PartialDepletion):
+            return instance.batch.product.user_id
+    except ObjectDoesNotExist:
+        # Cascade deletes: the owning product is already gone and invalidated
+        pass
+    return None
+
+
+def deleted_with(origin, *models):
+    """Whether a delete started from one of these models (an instance or a queryset of them)"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=StockBatch)
+@receiver(post_save, sender=PartialDepletion)
+@receiver(post_save, sender=LowStockAlert)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=StockBatch)
+@receiver(post_delete, sender=PartialDepletion)
+@receiver(post_delete, sender=LowStockAlert)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    user_id = tenant_id(instance)
+    if user_id is not None:
+        bump_data_version(user_id)
+
+
+@receiver(post_save, sender=StockBatch)
+def announce_new_batch(sender, instance, created, **kwargs):
+    if created:
+        publish_event(instance.product.user_id, 'batch.added', batch_added(instance, instance.product.name))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Cached payloads include the user's name, and a new account must not
+    # inherit entries left behind under a reused id
+    bump_data_version(instance.pk)
+
+
+@receiver(post_delete, sender=StockBatch)
+def release_batch_stock(sender, instance, origin=None, **kwargs):
+    # Here rather than in StockBatch.delete, which queryset deletes, the admin's
+    # delete action and cascades never call
+    if deleted_with(origin, User):
+        return
+    if instance.is_depleted:
+        # Rollups are per tenant and category, so they outlive the product
+        DailyProfitRollup.record([instance.rollup_values()], sign=-1)
+    if not deleted_with(origin, Product):
+        # Deleting the product takes its stock summary with it
+        quantity, value, batches = instance.stock_contribution()
+        ProductStock.apply_delta(instance.product_id, -quantity, -value, -batches)
+    ValuationCheckpoint.invalidate(instance.product.user_id, instance.added_at)
@@ -0,0 +1,129 @@
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .cache import data_version, shared_cache
+from .models import ReportSnapshot
+
+# Snapshot name and the function(user) building its payload; dotted, as views imports this module
+REPORTS = {
+    'reports-by-product': 'inventory.views.product_report',
+    'reports-monthly': 'inventory.views.monthly_report',
+    'insights': 'inventory.views.insight_report',
+}
+
+
+def current_version(user_id):
+    version = data_version(user_id)
+    return '' if version is None else str(version)
+
+
+def is_current(snapshot, version):
+    """Computed at the tenant's current data version, today (the reports also depend on the date)"""
+    return (
+        bool(version)
+        and snapshot.data_version == version
+        and timezone.localtime(snapshot.computed_at).date() == timezone.localdate()
+    )
+
+
+def snapshot_state(snapshot, version):
+    """'fresh', 'stale' while within INVENTORY_SNAPSHOT_MAX_STALENESS seconds, or None when unusable"""
+    if is_current(snapshot, version):
+        return 'fresh'
+    max_staleness = getattr(settings, 'INVENTORY_SNAPSHOT_MAX_STALENESS', 0)
+    if max_staleness and timezone.now() - snapshot.computed_at <= timedelta(seconds=max_staleness):
+        return 'stale'
+    return None
+
+
+def refresh_snapshots(user, force=False):
+    """Recompute the tenant's snapshots that are missing or not current; returns the names recomputed"""
+    stored = {snapshot.name: snapshot for snapshot in ReportSnapshot.objects.filter(user=user)}
+    refreshed = []
+    for name, path in REPORTS.items():
+        # Read before computing, so a write during the computation leaves the snapshot behind
+        version = current_version(user.pk)
+        snapshot = stored.get(name)
+        if not force and snapshot is not None and is_current(snapshot, version):
+            continue
+
+        started = time.perf_counter()
+        payload = import_string(path)(user)
+        # One upsert rather than a read and a write, which SQLite cannot upgrade while another worker writes
+        ReportSnapshot.objects.bulk_create([ReportSnapshot(
+            user=user,
+            name=name,
+            # Stored as the API renders it, so serving a snapshot returns the same JSON as a live response
+            data=json.loads(JSONRenderer().render(payload)),
+            data_version=version,
+            computed_at=timezone.now(),
+            duration_ms=round((time.perf_counter() - started) * 1000, 2),
+        )], update_conflicts=True, unique_fields=['user', 'name'],
+            update_fields=['data', 'data_version', 'computed_at', 'duration_ms'])
+        refreshed.append(name)
+    return refreshed
+
+
+def refresh_tenants(user_ids, force=False):
+    """{user_id: names recomputed} for the given tenants"""
+    return {
+        user.pk: refresh_snapshots(user, force)
+        for user in User.objects.filter(pk__in=user_ids).order_by('pk')
+    }
+
+
+def outdated_tenants(user_ids):
+    """Tenants with a snapshot missing or not current, found with one query"""
+    stored = {}
+    for snapshot in ReportSnapshot.objects.filter(user_id__in=user_ids, name__in=REPORTS):
+        stored.setdefault(snapshot.user_id, []).append(snapshot)
+
+    outdated = []
+    for user_id in user_ids:
+        snapshots = stored.get(user_id, [])
+        version = current_version(user_id)
+        if len(snapshots) < len(REPORTS) or not all(is_current(s, version) for s in snapshots):
+            outdated.append(user_id)
+    return outdated
+
+
+def snapshots_enabled():
+    # The worker tells current snapshots apart by the data version, which only a shared cache carries over
+    return getattr(settings, 'INVENTORY_REPORT_SNAPSHOTS', False) and shared_cache()
+
+
+def snapshot_served(name):
+    """Answer from the tenant's precomputed snapshot of this report when there is a usable one.
+
+    Only with INVENTORY_REPORT_SNAPSHOTS and a shared cache, as the lookup costs a query. The
+    response says where it came from in X-Snapshot (fresh, stale or live) and
+    when a snapshot was computed in X-Snapshot-At; without a usable snapshot
+    the view computes the report live.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(viewset, request, *args, **kwargs):
+            if not snapshots_enabled():
+                return view(viewset, request, *args, **kwargs)
+
+            snapshot = ReportSnapshot.objects.filter(user=request.user, name=name).first()
+            state = snapshot_state(snapshot, current_version(request.user.pk)) if snapshot else None
+            if state is None:
+                response = view(viewset, request, *args, **kwargs)
+                response['X-Snapshot'] = 'live'
+                return response
+            return Response(snapshot.data, headers={
+                'X-Snapshot': state,
+                'X-Snapshot-At': snapshot.computed_at.isoformat(),
+            })
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import secrets
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import data_version, get_cache
+from .events import channel_name, get_broker
+
+
+def format_event(kind, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {kind}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+TICKET_SALT = 'inventory.sse.ticket'
+
+
+def ticket_age():
+    return getattr(settings, 'INVENTORY_STREAM_TICKET_AGE', 30)
+
+
+def issue_ticket(user_id, expires_at):
+    """Signed single-use ticket opening one stream, so the access token stays out of URLs and logs.
+
+    expires_at (Unix time) is when the access token it was issued for runs
+    out; the stream ends then.
+    """
+    return signing.dumps(
+        {'user': user_id, 'exp': int(expires_at), 'nonce': secrets.token_urlsafe(12)}, salt=TICKET_SALT
+    )
+
+
+@sync_to_async
+def redeem_ticket(ticket):
+    """(active user, expiry) for a ticket that is recent and not used yet, or (None, None)"""
+    try:
+        claims = signing.loads(ticket, salt=TICKET_SALT, max_age=ticket_age())
+    except signing.BadSignature:
+        return None, None
+    # add() fails once the nonce is taken; across processes that needs a shared cache
+    if not get_cache().add(f"inventory:ticket:{claims['nonce']}", 1, timeout=ticket_age()):
+        return None, None
+    user = User.objects.filter(pk=claims['user'], is_active=True).first()
+    return (user, claims['exp']) if user else (None, None)
+
+
+@sync_to_async
+def authenticate(token):
+    """(active user, expiry) for a JWT access token, or (None, None)"""
+    try:
+        access = AccessToken(token)
+    except TokenError:
+        return None, None
+    user = User.objects.filter(pk=access.get(api_settings.USER_ID_CLAIM), is_active=True).first()
+    return (user, access['exp']) if user else (None, None)
+
+
+async def request_user(scope):
+    """(user, expiry) from a stream ticket in the query string or a bearer token header"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('ticket'):
+        return await redeem_ticket(query['ticket'][0])
+    for name, value in scope.get('headers', []):
+        if name == b'authorization' and value.lower().startswith(b'bearer '):
+            return await authenticate(value[7:].decode())
+    return None, None
+
+
+@sync_to_async
+def is_active(user_id):
+    return User.objects.filter(pk=user_id, is_active=True).exists()
+
+
+def cors_headers(scope):
+    origin = dict(scope.get('headers', [])).get(b'origin')
+    allowed = [o.encode() for o in getattr(settings, 'CORS_ALLOWED_ORIGINS', [])]
+    if origin and (getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or origin in allowed):
+        return [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+    return []
+
+
+class EventStream:
+    """ASGI app streaming a tenant's change events as server-sent events.
+
+    Events: batch.added, batch.updated, batch.depleted, alert.triggered,
+    alert.cleared and profit.updated (per-day deltas). A ready event carrying
+    the tenant's data version opens the stream; comments keep idle
+    connections alive through proxies. Browsers connect with a ticket from
+    POST /api/events/ticket/; tickets are single-use, so clients reconnect
+    with a fresh one instead of relying on EventSource's automatic retry.
+    When the access token behind a ticket expires the stream sends expired
+    and ends, and it ends without one once the user is deactivated (checked
+    at every keepalive).
+    """
+    keepalive = 15
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            await self.reject(send, scope, 405, 'Method not allowed')
+            return
+        user, expires_at = await request_user(scope)
+        if user is None:
+            await self.reject(send, scope, 401, 'Authentication credentials were not provided or are invalid')
+            return
+
+        subscription = get_broker().subscribe(channel_name(user.pk))
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                    *cors_headers(scope),
+                ],
+            })
+            version = await sync_to_async(data_version)(user.pk)
+            await self.write(send, format_event('ready', {'version': version}))
+
+            while True:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    await self.end(send, format_event('expired', {}))
+                    return
+                next_event = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=min(self.keepalive, remaining),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    next_event.cancel()
+                    return
+                if next_event in done:
+                    event = next_event.result()
+                    await self.write(send, format_event(event['type'], event['data'], event['id']))
+                    continue
+                next_event.cancel()
+                if time.time() >= expires_at:
+                    continue
+                if not await is_active(user.pk):
+                    await self.end(send, b'')
+                    return
+                await self.write(send, b': keepalive\n\n')
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def write(self, send, body):
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    async def end(self, send, body):
+        await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    async def reject(self, send, scope, status, message):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), *cors_headers(scope)],
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps({'error': message}).encode()})
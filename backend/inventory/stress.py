@@ -0,0 +1,56 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connection, OperationalError
+
+from .models import PartialDepletion, StockBatch
+
+
+def run_concurrent_depletions(batch_id, threads=8, per_thread=25, quantity=Decimal('1'), max_retries=20):
+    """Record partial depletions against one batch from several threads at once.
+
+    Each thread uses its own database connection. Lock timeouts are retried, since
+    the decrement is rolled back with its transaction. Returns timing and counters
+    so callers can check for lost updates.
+    """
+    barrier = threading.Barrier(threads)
+    lock = threading.Lock()
+    totals = {'recorded': 0, 'retries': 0, 'errors': []}
+
+    def worker():
+        recorded = retries = 0
+        try:
+            barrier.wait()
+            for _ in range(per_thread):
+                for attempt in range(max_retries + 1):
+                    try:
+                        batch = StockBatch.objects.get(pk=batch_id)
+                        PartialDepletion.objects.create(batch=batch, quantity_used=quantity)
+                        recorded += 1
+                        break
+                    except OperationalError:
+                        if attempt == max_retries:
+                            raise
+                        retries += 1
+                        time.sleep(0.005 * (attempt + 1))
+        except Exception as exc:
+            with lock:
+                totals['errors'].append(repr(exc))
+        finally:
+            with lock:
+                totals['recorded'] += recorded
+                totals['retries'] += retries
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    totals['elapsed'] = elapsed
+    totals['throughput'] = totals['recorded'] / elapsed if elapsed else 0
+    return totals
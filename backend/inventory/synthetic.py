@@ -0,0 +1,133 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import create_default_alerts, update_alert_thresholds
+from .cache import bump_data_version
+from .models import DailyProfitRollup, PartialDepletion, Product, ProductStock, StockBatch, StockMovement
+
+CATEGORIES = [value for value, _ in Product.CATEGORY_CHOICES]
+CENT = Decimal('0.01')
+
+
+def tenant_names(users, seed, prefix='bench'):
+    return [f'{prefix}-{seed}-{i}' for i in range(users)]
+
+
+def _money(value):
+    return Decimal(str(value)).quantize(CENT)
+
+
+def _product_profile(rng):
+    """Daily sales rate, buy price and sell price of one product"""
+    rate = rng.lognormvariate(1.0, 0.8)
+    buy_price = _money(rng.choice([20, 35, 50, 80, 120, 250, 600]) * rng.uniform(0.8, 1.2))
+    return rate, buy_price, _money(buy_price * Decimal(str(rng.uniform(1.1, 1.6))))
+
+
+def _product_history(rng, product_id, profile, batches, days, now):
+    """Batches of one product restocked at intervals and sold oldest first at a steady daily rate.
+
+    Returns the batches and the (batch index, quantity, recorded_at) partial
+    depletions of the batch being sold now; batches sold out before now are
+    depleted, later ones untouched.
+    """
+    rate, buy_price, sell_price = profile
+    start = now - timedelta(days=days)
+    step = days / batches
+
+    rows = []
+    depletions = []
+    selling_from = start
+    for i in range(batches):
+        added_at = start + timedelta(days=i * step + rng.uniform(0, step / 2))
+        quantity = Decimal(max(1, round(rate * step * rng.uniform(0.7, 1.4))))
+        begins = max(selling_from, added_at)
+        ends = begins + timedelta(days=float(quantity) / rate)
+        selling_from = ends
+        batch = StockBatch(
+            product_id=product_id,
+            quantity=quantity,
+            remaining_quantity=quantity,
+            buy_price_per_unit=buy_price,
+            sell_price_per_unit=sell_price,
+            added_at=added_at,
+        )
+        if ends <= now:
+            batch.remaining_quantity = Decimal('0')
+            batch.is_depleted = True
+            batch.depleted_at = ends
+        elif begins < now:
+            # Sales so far, logged as a few partial depletions
+            sold = min(quantity - 1, Decimal(int(rate * (now - begins).total_seconds() / 86400)))
+            logged = Decimal('0')
+            entries = rng.randint(1, 3)
+            for n in range(entries):
+                if n == entries - 1:
+                    part = sold - logged
+                else:
+                    part = Decimal(int(sold * Decimal(rng.uniform(0.2, 0.6))))
+                if part <= 0:
+                    continue
+                logged += part
+                depletions.append((i, part, begins + (now - begins) * rng.uniform(0.1, 1.0)))
+            batch.remaining_quantity = quantity - logged
+        rows.append(batch)
+    return rows, depletions
+
+
+@transaction.atomic
+def generate_tenants(users=3, products=50, batches=20, seed=0, days=180, prefix='bench'):
+    """Create users x products x batches with seeded, realistic sales histories.
+
+    The same arguments always produce the same data relative to now. Existing
+    tenants with the same names are replaced. The movement ledger, stock
+    summaries, profit rollups and alerts are rebuilt afterwards, as the bulk
+    import does.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    names = tenant_names(users, seed, prefix)
+    User.objects.filter(username__in=names).delete()
+
+    tenants = []
+    for name in names:
+        user = User.objects.create_user(username=name, password=None)
+        profiles = [_product_profile(rng) for _ in range(products)]
+        catalogue = Product.objects.bulk_create([
+            Product(
+                user=user,
+                name=f'Product {i:04d}',
+                category=rng.choice(CATEGORIES),
+                default_sell_price=profile[2],
+            )
+            for i, profile in enumerate(profiles)
+        ], batch_size=1000)
+
+        stock, depletions, first_quantity = [], [], {}
+        for product, profile in zip(catalogue, profiles):
+            rows, partials = _product_history(rng, product.pk, profile, batches, days, now)
+            depletions.append((len(stock), partials))
+            stock.extend(rows)
+            first_quantity[product.pk] = rows[0].quantity
+        StockBatch.objects.bulk_create(stock, batch_size=1000)
+        PartialDepletion.objects.bulk_create([
+            PartialDepletion(batch=stock[offset + i], quantity_used=used, recorded_at=recorded_at)
+            for offset, partials in depletions
+            for i, used, recorded_at in partials
+        ], batch_size=1000)
+        StockMovement.backfill(StockBatch.objects.filter(product__user=user))
+
+        product_ids = list(first_quantity)
+        ProductStock.rebuild(product_ids)
+        create_default_alerts(first_quantity)
+        update_alert_thresholds(product_ids)
+        bump_data_version(user.pk)
+        tenants.append(user)
+
+    DailyProfitRollup.rebuild([user.pk for user in tenants])
+    return tenants
@@ -1,11 +1,52 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth.models import User
-from .models import Product, StockBatch, PartialDepletion, LowStockAlert
+from .models import Product, StockBatch, PartialDepletion, LowStockAlert, ProductStock, DailyProfitRollup
 from decimal import Decimal
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, modify_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+import numpy as np
+from .cache import cache_stats, data_version, reset_cache_stats, get_cache
+from .stress import run_concurrent_depletions
+from .analytics import product_stats, user_batches
+from .forecast import demand_matrix, fit, project
+from .events import LocalBroker, channel_name, get_broker
+from .sse import EventStream
+from .loadtest import compare
+from .synthetic import generate_tenants
+from .benchmark import ENDPOINTS, regressions, run_benchmark
+from .bulk import bulk_deplete, finish_batches
+from .metrics import QueryBudgetExceeded, QueryRecorder, request_metrics, reset_request_metrics
+from .models import ReportSnapshot, StockMovement, ValuationCheckpoint
+from .management.commands.import_stock import Command as ImportStockCommand
+from .partitions import PARTITIONED, add_months, is_partitioned, partition_name, partitions
+from .precompute import precompute, shard
+from .valuation import build_checkpoints, stock_valuation
+from django.conf import settings
+from django.urls import reverse
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+
+# Response caching, conditional GETs and report snapshots need a cache every process shares
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'stocker-test-cache'),
+    }
+}
+
 # Create your tests here.
 class ProductModelTest(TestCase):
     def setUp(self):
@@ -457,3 +498,2009 @@ class AuthenticationTest(APITestCase):
         self.assertEqual(refresh_response.status_code, status.HTTP_200_OK)
         self.assertIn('access', refresh_response.data)
 
+
+class ProductListQueryTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def add_products(self, count, offset = 0):
+        for i in range(offset, offset + count):
+            product = Product.objects.create(
+                user = self.user,
+                name = f'Product {i}',
+                category = 'food',
+                default_sell_price = Decimal('50')
+            )
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('10'),
+                remaining_quantity = Decimal('4'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50')
+            )
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_constant(self):
+        self.add_products(2)
+        small, _ = self.count_list_queries()
+        self.add_products(10, offset=2)
+        large, response = self.count_list_queries()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data), 12)
+
+    def test_annotated_values(self):
+        self.add_products(1)
+        _, response = self.count_list_queries()
+
+        row = response.data[0]
+        self.assertEqual(row['current_stock'], 4.0)
+        self.assertEqual(row['total_value'], 160.0)
+        self.assertTrue(row['has_alert'] is False)
+
+class ProductStockLedgerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Sugar',
+            category = 'food',
+            default_sell_price = Decimal('150')
+        )
+
+        self.batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('100'),
+            sell_price_per_unit = Decimal('150')
+        )
+
+    def summary(self):
+        return ProductStock.objects.get(product=self.product)
+
+    def test_summary_created_on_intake(self):
+        summary = self.summary()
+        self.assertEqual(summary.on_hand_quantity, Decimal('10'))
+        self.assertEqual(summary.on_hand_value, Decimal('1000'))
+        self.assertEqual(summary.active_batches, 1)
+        self.assertIsNone(summary.last_depleted_at)
+
+    def test_partial_depletion_updates_summary(self):
+        depletion = PartialDepletion.objects.create(batch=self.batch, quantity_used=Decimal('4'))
+
+        summary = self.summary()
+        self.assertEqual(summary.on_hand_quantity, Decimal('6'))
+        self.assertEqual(summary.on_hand_value, Decimal('600'))
+        self.assertEqual(summary.last_depleted_at, depletion.recorded_at)
+
+    def test_mark_depleted_clears_summary(self):
+        self.batch.mark_depleted()
+
+        summary = self.summary()
+        self.assertEqual(summary.on_hand_quantity, Decimal('0'))
+        self.assertEqual(summary.active_batches, 0)
+        self.assertEqual(summary.last_depleted_at, self.batch.depleted_at)
+
+    def test_delete_batch_updates_summary(self):
+        self.batch.delete()
+        self.assertEqual(self.product.current_stock(), Decimal('0'))
+
+    def test_queryset_delete_updates_summary(self):
+        ValuationCheckpoint.objects.create(
+            user = self.user,
+            product = self.product,
+            as_of = self.batch.added_at + timedelta(days = 1),
+            quantity = Decimal('10'),
+            average_cost = Decimal('100')
+        )
+        StockBatch.objects.filter(pk = self.batch.pk).delete()
+
+        summary = self.summary()
+        self.assertEqual(summary.on_hand_quantity, Decimal('0'))
+        self.assertEqual(summary.on_hand_value, Decimal('0'))
+        self.assertEqual(summary.active_batches, 0)
+        self.assertFalse(ValuationCheckpoint.objects.filter(product = self.product).exists())
+        call_command('rebuild_stock_summary', '--verify', stdout=StringIO())
+
+    def test_rebuild_command_repairs_drift(self):
+        ProductStock.objects.filter(product=self.product).update(on_hand_quantity=Decimal('99'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stock_summary', '--verify', stdout=StringIO())
+
+        version = data_version(self.user.pk)
+        call_command('rebuild_stock_summary', stdout=StringIO())
+        self.assertEqual(self.summary().on_hand_quantity, Decimal('10'))
+        self.assertNotEqual(data_version(self.user.pk), version)
+        call_command('rebuild_stock_summary', '--verify', stdout=StringIO())
+
+class StockIndexUsageTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        now = timezone.now()
+        for p in range(20):
+            product = Product.objects.create(
+                user = self.user,
+                name = f'Product {p}',
+                category = 'food',
+                default_sell_price = Decimal('50')
+            )
+            StockBatch.objects.bulk_create([
+                StockBatch(
+                    product = product,
+                    quantity = Decimal('10'),
+                    remaining_quantity = Decimal('0') if i % 2 else Decimal('10'),
+                    buy_price_per_unit = Decimal('40'),
+                    sell_price_per_unit = Decimal('50'),
+                    added_at = now - timedelta(days=i + 3),
+                    is_depleted = bool(i % 2),
+                    depleted_at = now - timedelta(days=i) if i % 2 else None
+                ) for i in range(30)
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if 'inventory_stockbatch' not in sql or not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(explain + sql)
+                plans.append(' '.join(str(col) for row in cursor.fetchall() for col in row))
+        return plans
+
+    def test_dashboard_uses_active_index(self):
+        plans = self.query_plans('/api/dashboard/')
+        self.assertTrue(any('batch_active_fifo_idx' in plan for plan in plans), plans)
+
+    def test_history_uses_depleted_index(self):
+        plans = self.query_plans('/api/reports/history/')
+        self.assertTrue(any('batch_depleted_at_idx' in plan for plan in plans), plans)
+
+class DashboardQueryCountTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def add_history(self, products, offset = 0):
+        now = timezone.now()
+        for p in range(offset, offset + products):
+            product = Product.objects.create(
+                user = self.user,
+                name = f'Product {p}',
+                category = 'food',
+                default_sell_price = Decimal('50')
+            )
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('12'),
+                remaining_quantity = Decimal('0'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50'),
+                added_at = now - timedelta(days=4),
+                depleted_at = now,
+                is_depleted = True
+            )
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('10'),
+                remaining_quantity = Decimal('1'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50')
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_bounded(self):
+        self.add_history(2)
+        small, _ = self.count_queries()
+        self.add_history(15, offset=2)
+        large, _ = self.count_queries()
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 5)
+
+    def test_values_from_summary_tables(self):
+        self.add_history(1)
+        _, response = self.count_queries()
+
+        self.assertEqual(response.data['daily_profit'], Decimal('120'))
+        self.assertEqual(response.data['stock_depleted'], 1)
+        self.assertEqual(response.data['income_this_week'], Decimal('600'))
+        self.assertEqual(response.data['avg_stock_turnover'], 4.0)
+        self.assertEqual(response.data['fast_movers'], [{'product': 'Product 0', 'velocity': 3.0}])
+        self.assertEqual(len(response.data['low_stock_alerts']), 1)
+
+@override_settings(CACHES = SHARED_CACHES)
+class TenantCacheTest(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        reset_cache_stats()
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.other = User.objects.create_user(
+            username = 'otheruser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+
+    def add_batch(self, product):
+        return StockBatch.objects.create(
+            product = product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('40'),
+            sell_price_per_unit = Decimal('50')
+        )
+
+    def test_repeated_reads_served_from_cache(self):
+        first = self.client.get('/api/reports/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/reports/')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+
+    @override_settings(CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_not_used(self):
+        self.client.get('/api/reports/')
+        response = self.client.get('/api/reports/')
+
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(cache_stats()['endpoints'], {})
+
+    def test_write_invalidates_tenant(self):
+        self.client.get('/api/reports/')
+        self.add_batch(self.product)
+
+        response = self.client.get('/api/reports/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['active_batches'], 1)
+
+    def test_other_tenant_write_keeps_cache(self):
+        self.client.get('/api/dashboard/')
+        other_product = Product.objects.create(
+            user = self.other,
+            name = 'Bread',
+            category = 'food',
+            default_sell_price = Decimal('60')
+        )
+        self.add_batch(other_product)
+
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_stats_counters(self):
+        self.client.get('/api/dashboard/')
+        self.client.get('/api/dashboard/')
+
+        stats = cache_stats()
+        self.assertEqual(stats['endpoints']['dashboard'], {'hits': 1, 'misses': 1})
+
+class BulkStockIntakeAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+
+    def line(self, **fields):
+        data = {'quantity': '10', 'buy_price_per_unit': '40', 'sell_price_per_unit': '50'}
+        data.update(fields)
+        return data
+
+    def test_bulk_intake_creates_batches_and_products(self):
+        lines = [self.line(product=self.product.id)]
+        lines += [self.line(product_name=f'Item {i}', category='drink') for i in range(50)]
+        lines.append(self.line(product_name='milk', quantity='5'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/batches/bulk/', {'batches': lines}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 52)
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(Product.objects.filter(user=self.user).count(), 51)
+        self.assertEqual(self.product.current_stock(), Decimal('15'))
+        self.assertEqual(LowStockAlert.objects.get(product=self.product).threshold_quantity, Decimal('2'))
+        self.assertEqual(LowStockAlert.objects.count(), 51)
+
+    def test_bulk_intake_rejects_foreign_product(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        foreign = Product.objects.create(
+            user = other,
+            name = 'Bread',
+            default_sell_price = Decimal('60')
+        )
+        lines = [self.line(product=self.product.id), self.line(product=foreign.id)]
+
+        response = self.client.post('/api/batches/bulk/', {'batches': lines}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('product', response.data['batches'][1])
+        self.assertEqual(StockBatch.objects.count(), 0)
+
+    def test_bulk_intake_rejects_ambiguous_and_deactivated_names(self):
+        Product.objects.create(user = self.user, name = 'MILK', default_sell_price = Decimal('50'))
+        Product.objects.create(user = self.user, name = 'Tea', default_sell_price = Decimal('90'), is_active = False)
+        lines = [self.line(product_name='milk'), self.line(product_name='tea')]
+
+        response = self.client.post('/api/batches/bulk/', {'batches': lines}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['product_names'], [
+            {'product_name': 'milk', 'reason': 'matches several products'},
+            {'product_name': 'tea', 'reason': 'matches only a deactivated product'},
+        ])
+        self.assertEqual(StockBatch.objects.count(), 0)
+
+class BulkDepletionAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+        now = timezone.now()
+        self.old = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('4'),
+            buy_price_per_unit = Decimal('40'),
+            sell_price_per_unit = Decimal('50'),
+            added_at = now - timedelta(days=3)
+        )
+        self.new = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('45'),
+            sell_price_per_unit = Decimal('50'),
+            added_at = now - timedelta(days=1)
+        )
+
+    def test_allocates_fifo_across_batches(self):
+        response = self.client.post('/api/products/deplete_bulk/', {
+            'depletions': [{'product': self.product.id, 'quantity': '6'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertTrue(self.old.is_depleted)
+        self.assertEqual(self.old.remaining_quantity, Decimal('0'))
+        self.assertEqual(self.new.remaining_quantity, Decimal('8'))
+        self.assertEqual(PartialDepletion.objects.count(), 2)
+        self.assertEqual(self.product.current_stock(), Decimal('8'))
+        self.assertEqual(self.product.total_value, Decimal('360'))
+        self.assertEqual(response.data['products'][0]['batches_depleted'], 1)
+
+    def test_insufficient_stock_writes_nothing(self):
+        response = self.client.post('/api/products/deplete_bulk/', {
+            'depletions': [{'product': self.product.id, 'quantity': '20'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['shortfalls'][0]['missing'], Decimal('6'))
+        self.assertEqual(PartialDepletion.objects.count(), 0)
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.remaining_quantity, Decimal('10'))
+
+class ConcurrentDepletionTest(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a database shared between threads; set DB_TEST_NAME for SQLite')
+
+        user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.product = Product.objects.create(
+            user = user,
+            name = 'Soda',
+            default_sell_price = Decimal('40')
+        )
+        self.batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('100'),
+            remaining_quantity = Decimal('100'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+
+    def test_no_lost_updates(self):
+        result = run_concurrent_depletions(self.batch.id, threads=6, per_thread=10)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['recorded'], 60)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.remaining_quantity, Decimal('40'))
+        self.assertEqual(self.product.current_stock(), Decimal('40'))
+        self.assertEqual(PartialDepletion.objects.filter(batch=self.batch).count(), 60)
+
+    def test_concurrent_overdraw_finishes_batch_once(self):
+        result = run_concurrent_depletions(
+            self.batch.id, threads=4, per_thread=1, quantity=Decimal('60')
+        )
+
+        self.batch.refresh_from_db()
+        self.assertTrue(self.batch.is_depleted)
+        self.assertEqual(self.batch.remaining_quantity, Decimal('0'))
+        self.assertEqual(result['recorded'], 2)
+        self.assertEqual(len(result['errors']), 2)
+        self.assertEqual(self.product.current_stock(), Decimal('0'))
+        self.assertEqual(ProductStock.objects.get(product=self.product).active_batches, 0)
+
+class KeysetPaginationAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+        now = timezone.now()
+        # Pairs of batches share a timestamp to exercise the id tie-breaker
+        StockBatch.objects.bulk_create([
+            StockBatch(
+                product = self.product,
+                quantity = Decimal('10'),
+                remaining_quantity = Decimal('0'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50'),
+                added_at = now - timedelta(days=i // 2 + 5),
+                depleted_at = now - timedelta(days=i // 2),
+                is_depleted = True
+            ) for i in range(25)
+        ])
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_batches_pages_cover_everything_once(self):
+        seen = self.walk('/api/batches/?page_size=4')
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        expected = list(StockBatch.objects.order_by('-added_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_history_pages_by_depletion_time(self):
+        seen = self.walk('/api/reports/history/?page_size=7')
+
+        expected = list(StockBatch.objects.order_by('-depleted_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_approximate_total(self):
+        response = self.client.get('/api/batches/?include_total=true')
+
+        self.assertEqual(response.data['approximate_total'], 25)
+        self.assertTrue(response.data['total_is_exact'])
+        self.assertNotIn('approximate_total', self.client.get('/api/batches/').data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/batches/?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class HistoryExportAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        product = Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+        now = timezone.now()
+        for i in range(3):
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('10'),
+                remaining_quantity = Decimal('2'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50'),
+                added_at = now - timedelta(days=10),
+                depleted_at = now - timedelta(days=i),
+                is_depleted = True
+            )
+
+    def test_csv_export(self):
+        response = self.client.get('/api/reports/export/?format=csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        header = lines[0].split(',')
+        first = dict(zip(header, lines[1].split(',')))
+        self.assertEqual(first['sold'], '8.00')
+        self.assertEqual(first['profit'], '80.0000')
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/reports/export/?format=ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['margin'], '25.0')
+        self.assertLess(rows[0]['depleted_at'], rows[-1]['depleted_at'])
+
+class ImportStockCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+
+    def run_import(self, lines, chunk_size = 2):
+        header = 'record,batch_ref,product,category,quantity,buy_price,sell_price,added_at,depleted_at,recorded_at,notes'
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('\n'.join([header] + lines) + '\n')
+        self.addCleanup(os.unlink, handle.name)
+        out = StringIO()
+        call_command('import_stock', handle.name, user='testuser', chunk_size=chunk_size, stdout=out)
+        return out.getvalue()
+
+    def test_import_batches_and_depletions(self):
+        output = self.run_import([
+            'batch,b1,Milk,,10,40,50,2024-01-01,2024-01-05,,',
+            'batch,b2,Milk,,20,40,50,2024-02-01,,,',
+            'batch,b3,Tea,drink,8,100,150,2024-02-03,,,',
+            'depletion,b2,,,5,,,,,2024-02-10,',
+            'depletion,b3,,,8,,,,,2024-02-20,',
+        ])
+
+        self.assertIn('rows/s', output)
+        self.assertEqual(StockBatch.objects.count(), 3)
+        self.assertEqual(PartialDepletion.objects.count(), 2)
+
+        milk = Product.objects.get(name='Milk')
+        tea = Product.objects.get(name='Tea')
+        self.assertEqual(tea.category, 'drink')
+        self.assertEqual(milk.current_stock(), Decimal('15'))
+        self.assertEqual(tea.current_stock(), Decimal('0'))
+
+        finished = StockBatch.objects.get(product=tea)
+        self.assertTrue(finished.is_depleted)
+        self.assertEqual(finished.depleted_at.date().isoformat(), '2024-02-20')
+        self.assertEqual(LowStockAlert.objects.get(product=milk).threshold_quantity, Decimal('3'))
+        call_command('rebuild_stock_summary', '--verify', stdout=StringIO())
+
+    def test_unknown_batch_ref(self):
+        with self.assertRaises(CommandError):
+            self.run_import(['depletion,missing,,,5,,,,,2024-02-10,'])
+        self.assertEqual(PartialDepletion.objects.count(), 0)
+
+    def test_products_match_like_bulk_intake(self):
+        self.run_import(['batch,b1, milk ,,10,40,50,2024-01-01,,,'])
+        self.assertEqual(Product.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Product.objects.get(name='Milk').current_stock(), Decimal('10'))
+
+        Product.objects.create(user = self.user, name = 'Tea', default_sell_price = Decimal('90'), is_active = False)
+        with self.assertRaises(CommandError):
+            self.run_import(['batch,b2,tea,,10,40,50,2024-01-01,,,'])
+
+    def test_batches_added_during_import_are_left_alone(self):
+        finish = ImportStockCommand.finish
+        added = {}
+
+        def add_then_finish(command):
+            # A batch the web app creates while the import runs
+            added['batch'] = StockBatch.objects.create(
+                product = Product.objects.get(name='Milk'),
+                quantity = Decimal('5'),
+                remaining_quantity = Decimal('5'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50')
+            )
+            PartialDepletion.objects.create(batch=added['batch'], quantity_used=Decimal('2'))
+            finish(command)
+
+        with mock.patch.object(ImportStockCommand, 'finish', add_then_finish):
+            self.run_import(['batch,b1,Milk,,10,40,50,2024-01-01,,,'])
+
+        batch = added['batch']
+        batch.refresh_from_db()
+        self.assertEqual(batch.remaining_quantity, Decimal('3'))
+        self.assertEqual(batch.movements.count(), 2)
+        call_command('replay_movements', verify=True, stdout=StringIO())
+
+class DailyProfitRollupTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Milk',
+            category = 'food',
+            default_sell_price = Decimal('50')
+        )
+
+    def add_batch(self, quantity = Decimal('10')):
+        return StockBatch.objects.create(
+            product = self.product,
+            quantity = quantity,
+            remaining_quantity = quantity,
+            buy_price_per_unit = Decimal('40'),
+            sell_price_per_unit = Decimal('50')
+        )
+
+    def rollup(self):
+        return DailyProfitRollup.objects.get(user=self.user, day=timezone.localdate(), category='food')
+
+    def test_mark_depleted_updates_rollup(self):
+        self.add_batch().mark_depleted()
+
+        row = self.rollup()
+        self.assertEqual(row.revenue, Decimal('500'))
+        self.assertEqual(row.cost, Decimal('400'))
+        self.assertEqual(row.profit, Decimal('100'))
+        self.assertEqual(row.batches_depleted, 1)
+
+    def test_partial_depletion_counts_once_batch_is_finished(self):
+        batch = self.add_batch()
+        PartialDepletion.objects.create(batch=batch, quantity_used=Decimal('4'))
+        self.assertFalse(DailyProfitRollup.objects.exists())
+
+        PartialDepletion.objects.create(batch=batch, quantity_used=Decimal('6'))
+        self.assertEqual(self.rollup().profit, Decimal('100'))
+
+    def test_deleting_depleted_batch_removes_its_profit(self):
+        self.add_batch().mark_depleted()
+        batch = self.add_batch(Decimal('5'))
+        batch.mark_depleted()
+        batch.delete()
+
+        row = self.rollup()
+        self.assertEqual(row.profit, Decimal('100'))
+        self.assertEqual(row.batches_depleted, 1)
+
+    def test_deleting_product_removes_its_profit(self):
+        self.add_batch().mark_depleted()
+        self.add_batch(Decimal('5')).mark_depleted()
+        StockBatch.objects.filter(pk = self.add_batch().pk).delete()
+        self.product.delete()
+
+        row = self.rollup()
+        self.assertEqual(row.revenue, Decimal('0'))
+        self.assertEqual(row.profit, Decimal('0'))
+        self.assertEqual(row.batches_depleted, 0)
+        self.assertEqual(self.client.get('/api/reports/').data['total_revenue'], Decimal('0'))
+
+    def test_bulk_depletion_updates_rollup(self):
+        self.add_batch()
+        self.add_batch()
+        response = self.client.post('/api/products/deplete_bulk/', {
+            'depletions': [{'product': self.product.id, 'quantity': '15'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = self.rollup()
+        self.assertEqual(row.profit, Decimal('100'))
+        self.assertEqual(row.batches_depleted, 1)
+
+    def test_reports_read_rollups(self):
+        self.add_batch().mark_depleted()
+
+        report = self.client.get('/api/reports/').data
+        self.assertEqual(report['total_revenue'], Decimal('500'))
+        self.assertEqual(report['total_profit'], Decimal('100'))
+
+        monthly = self.client.get('/api/reports/monthly/')
+        self.assertEqual(monthly.status_code, status.HTTP_200_OK)
+        self.assertEqual(monthly.data[-1]['month_key'], timezone.localdate().strftime('%Y-%m'))
+        self.assertEqual(monthly.data[-1]['profit'], Decimal('100'))
+        self.assertEqual(monthly.data[-1]['margin'], 25.0)
+
+    def test_rebuild_matches_incremental(self):
+        self.add_batch().mark_depleted()
+        batch = self.add_batch(Decimal('4'))
+        PartialDepletion.objects.create(batch=batch, quantity_used=Decimal('4'))
+        incremental = list(DailyProfitRollup.objects.values('day', 'category', 'revenue', 'cost', 'profit', 'batches_depleted'))
+
+        call_command('rebuild_rollups', user=['testuser'], stdout=StringIO())
+        rebuilt = list(DailyProfitRollup.objects.values('day', 'category', 'revenue', 'cost', 'profit', 'batches_depleted'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_rebuild_invalidates_cached_reports(self):
+        self.add_batch().mark_depleted()
+        version = data_version(self.user.pk)
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertNotEqual(data_version(self.user.pk), version)
+
+class ProductAnalyticsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        now = timezone.now()
+        self.products = []
+        for p, days in enumerate([2, 5, 10]):
+            product = Product.objects.create(
+                user = self.user,
+                name = f'Product {p}',
+                category = 'food',
+                default_sell_price = Decimal('50')
+            )
+            self.products.append(product)
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('20'),
+                remaining_quantity = Decimal('0'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50'),
+                added_at = now - timedelta(days=days, hours=3),
+                depleted_at = now,
+                is_depleted = True
+            )
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('10'),
+                remaining_quantity = Decimal('6'),
+                buy_price_per_unit = Decimal('40'),
+                sell_price_per_unit = Decimal('50'),
+                added_at = now - timedelta(days=2)
+            )
+
+    def test_stats_match_model_properties(self):
+        stats = product_stats(user_batches(self.user))
+        index = {int(pid): i for i, pid in enumerate(stats['product_id'])}
+
+        for product in self.products:
+            i = index[product.id]
+            finished = product.batches.get(is_depleted=True)
+            self.assertAlmostEqual(stats['depleted_velocity'][i], finished.velocity)
+            self.assertEqual(stats['turnover_days'][i], finished.days_in_stock)
+            self.assertAlmostEqual(stats['active_velocity'][i], product.average_velocity)
+            self.assertEqual(stats['on_hand'][i], float(product.current_stock()))
+            self.assertEqual(stats['on_hand_value'][i], float(product.total_value))
+
+        ranks = [stats['depleted_velocity_percentile'][index[p.id]] for p in self.products]
+        self.assertEqual([round(r, 1) for r in ranks], [100.0, 66.7, 33.3])
+
+    def test_velocity_endpoint(self):
+        response = self.client.get('/api/insights/velocity/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = response.data[0]
+        self.assertEqual(row['current_stock'], 6.0)
+        self.assertEqual(row['avg_velocity'], 2.0)
+        self.assertEqual(row['days_until_empty'], 3.0)
+        self.assertEqual(row['total_value'], 240.0)
+
+    def test_insight_movers(self):
+        response = self.client.get('/api/insights/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [row['product_name'] for row in response.data['fast_movers']]
+        self.assertEqual(names, ['Product 0', 'Product 1', 'Product 2'])
+        self.assertEqual(response.data['fast_movers'][0]['avg_turnover'], 2)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_analytics', sizes=[500], repeat=1, stdout=out)
+        self.assertIn('500 batches', out.getvalue())
+
+class ForecastAPITest(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Bread',
+            category = 'food',
+            default_sell_price = Decimal('60')
+        )
+        self.batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('1000'),
+            remaining_quantity = Decimal('1000'),
+            buy_price_per_unit = Decimal('40'),
+            sell_price_per_unit = Decimal('60'),
+            added_at = timezone.now() - timedelta(days=60)
+        )
+        # Two units on weekdays, ten at weekends, for eight weeks
+        noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        for days_ago in range(1, 57):
+            moment = noon - timedelta(days=days_ago)
+            PartialDepletion.objects.create(
+                batch = self.batch,
+                quantity_used = Decimal('10') if moment.weekday() >= 5 else Decimal('2'),
+                recorded_at = moment
+            )
+
+    def test_forecast_follows_weekly_pattern(self):
+        response = self.client.get('/api/insights/forecast/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Forecast-Parameters'], 'fitted')
+        row = response.data[0]
+        today = timezone.localdate()
+        for offset, quantity in enumerate(row['forecast']):
+            expected = 10 if (today + timedelta(days=offset)).weekday() >= 5 else 2
+            self.assertAlmostEqual(quantity, expected, delta=1)
+
+        self.assertAlmostEqual(row['daily_demand'], 32 / 7, delta=0.5)
+        self.assertEqual(row['current_stock'], 760.0)
+        self.assertGreater(row['days_until_stockout'], 28)
+        self.assertFalse(row['needs_reorder'])
+        self.assertEqual(row['reorder_quantity'], 0)
+
+    def test_parameters_are_cached(self):
+        self.client.get('/api/insights/forecast/')
+        response = self.client.get('/api/insights/forecast/?lead_time=90&review_days=90')
+
+        self.assertEqual(response['X-Forecast-Parameters'], 'cached')
+        # 180 days of cover at about 4.6 a day is more than the 760 on hand
+        self.assertGreater(response.data[0]['reorder_quantity'], 0)
+
+    def test_depleted_batch_counts_as_demand(self):
+        batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('40'),
+            sell_price_per_unit = Decimal('60')
+        )
+        PartialDepletion.objects.create(batch=batch, quantity_used=Decimal('4'))
+        batch.mark_depleted()
+
+        today = timezone.localdate()
+        series = demand_matrix(self.user, [self.product.id], today, today + timedelta(days=1))
+        self.assertEqual(series.tolist(), [[10.0]])
+
+    def test_stockout_without_stock_or_demand(self):
+        sold_out = Product.objects.create(user = self.user, name = 'Milk', default_sell_price = Decimal('50'))
+        batch = StockBatch.objects.create(
+            product = sold_out,
+            quantity = Decimal('6'),
+            remaining_quantity = Decimal('6'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('50'),
+            added_at = timezone.now() - timedelta(days=10)
+        )
+        for days_ago in (3, 2):
+            PartialDepletion.objects.create(
+                batch = batch,
+                quantity_used = Decimal('3'),
+                recorded_at = timezone.now() - timedelta(days=days_ago)
+            )
+        unsold = Product.objects.create(user = self.user, name = 'Salt', default_sell_price = Decimal('20'))
+        StockBatch.objects.create(
+            product = unsold,
+            quantity = Decimal('5'),
+            remaining_quantity = Decimal('5'),
+            buy_price_per_unit = Decimal('10'),
+            sell_price_per_unit = Decimal('20')
+        )
+
+        response = self.client.get('/api/insights/forecast/')
+
+        rows = {row['product']: row for row in response.data}
+        self.assertEqual(rows['Milk']['current_stock'], 0.0)
+        self.assertEqual(rows['Milk']['days_until_stockout'], 0)
+        self.assertEqual(rows['Milk']['stockout_date'], timezone.localdate().isoformat())
+        self.assertEqual(rows['Salt']['daily_demand'], 0.0)
+        self.assertIsNone(rows['Salt']['days_until_stockout'])
+        self.assertIsNone(rows['Salt']['stockout_date'])
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/insights/forecast/?horizon=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/insights/forecast/?history_days=3')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fit_scales_to_thousands_of_products(self):
+        rng = np.random.default_rng(0)
+        weekly = np.tile([1, 1, 1, 1, 2, 3, 3], 8)
+        series = rng.poisson(weekly * rng.uniform(0.5, 5, (5000, 1))).astype(float)
+
+        started = time.perf_counter()
+        alphas, gammas = fit(series)
+        forecast, _ = project(series, alphas, gammas, 28)
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(forecast.shape, (5000, 28))
+
+class AlertEvaluationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            category = 'drink',
+            default_sell_price = Decimal('40')
+        )
+        self.batch = self.add_batch()
+        self.alert = LowStockAlert.objects.get(product=self.product)
+        self.alert.threshold_quantity = Decimal('5')
+        self.alert.save()
+
+    def add_batch(self, quantity = Decimal('10')):
+        return StockBatch.objects.create(
+            product = self.product,
+            quantity = quantity,
+            remaining_quantity = quantity,
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+
+    def test_state_follows_stock_writes(self):
+        self.assertFalse(self.alert.is_triggered)
+        self.assertEqual(self.alert.last_evaluated_stock, Decimal('10'))
+
+        self.batch.mark_depleted()
+        self.alert.refresh_from_db()
+        self.assertTrue(self.alert.is_triggered)
+        self.assertEqual(self.alert.last_evaluated_stock, Decimal('0'))
+
+        self.add_batch(Decimal('3'))
+        self.alert.refresh_from_db()
+        self.assertTrue(self.alert.is_triggered)
+
+        self.add_batch(Decimal('3'))
+        self.alert.refresh_from_db()
+        self.assertFalse(self.alert.is_triggered)
+
+    def test_threshold_change_reevaluates(self):
+        self.alert.threshold_quantity = Decimal('10')
+        self.alert.save(update_fields=['threshold_quantity'])
+        self.alert.refresh_from_db()
+        self.assertTrue(self.alert.is_triggered)
+
+    def test_bulk_depletion_triggers(self):
+        response = self.client.post('/api/products/deplete_bulk/', {
+            'depletions': [{'product': self.product.id, 'quantity': '10'}]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.alert.refresh_from_db()
+        self.assertTrue(self.alert.is_triggered)
+
+    def test_triggered_listing_is_one_filter(self):
+        self.batch.mark_depleted()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/alerts/triggered/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([a['product'] for a in response.data], [self.product.id])
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+
+        response = self.client.get('/api/products/with_alerts/')
+        self.assertEqual(response.data, [{'id': self.product.id, 'name': 'Soda', 'current_stock': 0.0, 'threshold': 5.0}])
+
+    def test_reconcile_command(self):
+        LowStockAlert.objects.filter(pk=self.alert.pk).update(is_triggered=True, last_evaluated_stock=Decimal('0'))
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_alerts', '--verify', stdout=StringIO())
+
+        version = data_version(self.user.pk)
+        out = StringIO()
+        call_command('reconcile_alerts', stdout=out)
+        self.assertIn('Reconciled 1 of 1 alerts', out.getvalue())
+        self.assertNotEqual(data_version(self.user.pk), version)
+        self.alert.refresh_from_db()
+        self.assertFalse(self.alert.is_triggered)
+        self.assertEqual(self.alert.last_evaluated_stock, Decimal('10'))
+        call_command('reconcile_alerts', '--verify', stdout=StringIO())
+
+class EventStreamTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            category = 'drink',
+            default_sell_price = Decimal('40')
+        )
+        self.batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        self.token = AccessToken.for_user(self.user)
+
+    def connect(self, query, headers = (), keepalive = 15):
+        stream = EventStream()
+        stream.keepalive = keepalive
+        communicator = ApplicationCommunicator(stream, {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/events/',
+            'query_string': query.encode(),
+            'headers': list(headers),
+        })
+        return communicator
+
+    def ticket(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION = f'Bearer {self.token}')
+        response = client.post('/api/events/ticket/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['ticket']
+
+    async def read_events(self, communicator, wanted):
+        seen = {}
+        while not wanted <= set(seen):
+            message = await communicator.receive_output(timeout=2)
+            for block in message['body'].decode().split('\n\n'):
+                fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+                if 'event' in fields:
+                    seen[fields['event']] = json.loads(fields['data'])
+        return seen
+
+    def deplete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.mark_depleted()
+
+    async def test_streams_tenant_changes(self):
+        ticket = await sync_to_async(self.ticket)()
+        communicator = self.connect(f'ticket={ticket}')
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(timeout=2)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        await self.read_events(communicator, {'ready'})
+
+        await sync_to_async(self.deplete)()
+        events = await self.read_events(communicator, {'batch.depleted', 'profit.updated', 'alert.triggered'})
+
+        self.assertEqual(events['batch.depleted'], {'batch_id': self.batch.id, 'product_id': self.product.id})
+        self.assertEqual(Decimal(events['profit.updated']['profit']), Decimal('100'))
+        self.assertEqual(events['alert.triggered']['product'], 'Soda')
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=2)
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+    async def test_rejects_missing_token(self):
+        for query in ('ticket=invalid', f'token={self.token}'):
+            communicator = self.connect(query)
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(timeout=2)
+            self.assertEqual(start['status'], 401)
+
+    async def test_ticket_is_single_use(self):
+        ticket = await sync_to_async(self.ticket)()
+        first = self.connect(f'ticket={ticket}')
+        await first.send_input({'type': 'http.request'})
+        self.assertEqual((await first.receive_output(timeout=2))['status'], 200)
+
+        second = self.connect(f'ticket={ticket}')
+        await second.send_input({'type': 'http.request'})
+        self.assertEqual((await second.receive_output(timeout=2))['status'], 401)
+        await first.send_input({'type': 'http.disconnect'})
+        await first.wait(timeout=2)
+
+    async def test_stream_ends_when_token_expires(self):
+        self.token.set_exp(lifetime = timedelta(seconds = 1))
+        communicator = self.connect('', [(b'authorization', f'Bearer {self.token}'.encode())])
+        await communicator.send_input({'type': 'http.request'})
+        self.assertEqual((await communicator.receive_output(timeout=2))['status'], 200)
+
+        await self.read_events(communicator, {'ready'})
+        message = await communicator.receive_output(timeout=3)
+        self.assertIn(b'event: expired', message['body'])
+        self.assertFalse(message['more_body'])
+
+    async def test_stream_ends_when_user_is_deactivated(self):
+        ticket = await sync_to_async(self.ticket)()
+        communicator = self.connect(f'ticket={ticket}', keepalive = 0.1)
+        await communicator.send_input({'type': 'http.request'})
+        await communicator.receive_output(timeout=2)
+        await self.read_events(communicator, {'ready'})
+
+        await User.objects.filter(pk = self.user.pk).aupdate(is_active = False)
+        message = await communicator.receive_output(timeout=2)
+        while message['more_body']:
+            message = await communicator.receive_output(timeout=2)
+        self.assertEqual(message['body'], b'')
+
+    def test_events_only_reach_their_tenant(self):
+        async def listen():
+            broker = LocalBroker()
+            mine = broker.subscribe(channel_name(self.user.pk))
+            other = broker.subscribe(channel_name(self.user.pk + 1))
+            broker.publish(channel_name(self.user.pk), {'id': 1, 'type': 'batch.added', 'data': {}})
+            return await mine.get(timeout=1), await other.get(timeout=0.05)
+
+        received, missed = async_to_sync(listen)()
+        self.assertEqual(received['type'], 'batch.added')
+        self.assertIsNone(missed)
+
+
+@override_settings(CACHES = SHARED_CACHES, INVENTORY_ASYNC_PARALLEL_QUERIES = False)
+class AsyncViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            category = 'drink',
+            default_sell_price = Decimal('40')
+        )
+        batch = StockBatch.objects.create(
+            product = product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        PartialDepletion.objects.create(batch = batch, quantity_used = Decimal('4'))
+        alert = LowStockAlert.objects.get(product = product)
+        alert.threshold_quantity = Decimal('8')
+        alert.save()
+        self.client.credentials(HTTP_AUTHORIZATION = f'Bearer {AccessToken.for_user(self.user)}')
+        get_cache().clear()
+
+    def test_async_views_match_sync_views(self):
+        for name in ('dashboard', 'reports', 'insights'):
+            sync = self.client.get(f'/api/{name}/')
+            get_cache().clear()
+            response = self.client.get(f'/api/async/{name}/')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(response.json(), json.loads(sync.content))
+
+    def test_async_view_shares_tenant_cache(self):
+        self.client.get('/api/dashboard/')
+
+        response = self.client.get('/api/async/dashboard/')
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_requires_token(self):
+        self.client.credentials()
+
+        response = self.client.get('/api/async/dashboard/')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('error', response.json())
+
+
+class AsyncParallelQueriesTest(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a database shared between threads; set DB_TEST_NAME for SQLite')
+
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            default_sell_price = Decimal('40')
+        )
+        StockBatch.objects.create(
+            product = product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('6'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+
+    def test_parallel_parts_match_sync_view(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION = f'Bearer {AccessToken.for_user(self.user)}')
+        for name in ('dashboard', 'reports', 'insights'):
+            sync = client.get(f'/api/{name}/')
+            get_cache().clear()
+            response = client.get(f'/api/async/{name}/')
+
+            self.assertEqual(response.json(), json.loads(sync.content))
+
+    def test_load_test_compares_both_paths(self):
+        results = compare(self.user, endpoints=('dashboard',), requests=6, concurrency=3)
+
+        for path in ('wsgi', 'asgi'):
+            self.assertEqual(results['dashboard'][path]['errors'], 0)
+            self.assertEqual(results['dashboard'][path]['requests'], 6)
+            self.assertGreater(results['dashboard'][path]['throughput'], 0)
+
+
+@override_settings(INVENTORY_QUERY_BUDGET_STRICT = True)
+@modify_settings(MIDDLEWARE = {'prepend': 'inventory.metrics.QueryMetricsMiddleware'})
+class QueryBudgetTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        for i in range(3):
+            product = Product.objects.create(
+                user = self.user,
+                name = f'Product {i}',
+                category = 'drink' if i % 2 else 'food',
+                default_sell_price = Decimal('40')
+            )
+            for j in range(4):
+                batch = StockBatch.objects.create(
+                    product = product,
+                    quantity = Decimal('10'),
+                    remaining_quantity = Decimal('10'),
+                    buy_price_per_unit = Decimal('30'),
+                    sell_price_per_unit = Decimal('40')
+                )
+                if j == 0:
+                    batch.mark_depleted()
+                elif j == 1:
+                    PartialDepletion.objects.create(batch = batch, quantity_used = Decimal('3'))
+        self.client.credentials(HTTP_AUTHORIZATION = f'Bearer {AccessToken.for_user(self.user)}')
+        reset_request_metrics()
+        get_cache().clear()
+
+    def test_endpoints_within_budget(self):
+        for tag in settings.INVENTORY_QUERY_BUDGETS:
+            with self.subTest(tag = tag):
+                response = self.client.get(reverse(tag))
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(request_metrics()), set(settings.INVENTORY_QUERY_BUDGETS))
+
+    def test_over_budget_fails(self):
+        with override_settings(INVENTORY_QUERY_BUDGETS = {'report-by-product': {'queries': 0}}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'report-by-product over budget: queries'):
+                self.client.get('/api/reports/by_product/')
+
+    def test_response_headers(self):
+        response = self.client.get('/api/reports/by_product/')
+
+        self.assertEqual(response['X-Duplicate-Queries'], '0')
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_recorder_detects_repeated_queries(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for name in ('Product 0', 'Product 0', 'Product 1'):
+                list(Product.objects.filter(name = name))
+
+        sample = recorder.sample(0.01)
+        self.assertEqual(sample['queries'], 3)
+        self.assertEqual(sample['duplicates'], 1)
+        self.assertEqual(sample['similar'], 1)
+        self.assertIn('inventory_product', sample['most_repeated'])
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.client.get('/api/reports/by_product/')
+        self.client.get('/api/reports/by_product/')
+
+        self.assertEqual(self.client.get('/api/_metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/_metrics/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        endpoint = response.data['report-by-product']
+        self.assertEqual(endpoint['requests'], 2)
+        self.assertEqual(sum(endpoint['queries']['buckets'].values()), 2)
+        self.assertIsNotNone(endpoint['wall_ms']['p95'])
+
+
+class SyntheticBenchmarkTest(TestCase):
+    def snapshot(self, users):
+        return list(StockBatch.objects.filter(product__user__in = users).order_by(
+            'product__user__username', 'product__name', 'added_at'
+        ).values_list(
+            'product__user__username', 'product__category', 'quantity', 'remaining_quantity',
+            'buy_price_per_unit', 'sell_price_per_unit', 'is_depleted'
+        ))
+
+    def test_generator_is_seeded(self):
+        first = self.snapshot(generate_tenants(users = 2, products = 3, batches = 4, seed = 7))
+        second = self.snapshot(generate_tenants(users = 2, products = 3, batches = 4, seed = 7))
+        other = self.snapshot(generate_tenants(users = 2, products = 3, batches = 4, seed = 8))
+
+        self.assertEqual(len(first), 24)
+        self.assertEqual(first, second)
+        self.assertNotEqual([row[1:] for row in first], [row[1:] for row in other])
+        self.assertEqual(User.objects.filter(username__startswith = 'bench-7-').count(), 2)
+
+    def test_generated_history_is_consistent(self):
+        users = generate_tenants(users = 1, products = 5, batches = 6, seed = 1)
+        batches = StockBatch.objects.filter(product__user = users[0])
+
+        self.assertTrue(batches.filter(is_depleted = True).exists())
+        self.assertTrue(batches.filter(is_depleted = False).exists())
+        for batch in batches.filter(is_depleted = False):
+            used = sum(d.quantity_used for d in batch.depletions.all())
+            self.assertEqual(batch.remaining_quantity, batch.quantity - used)
+        for product in Product.objects.filter(user = users[0]):
+            self.assertEqual(product.stock_summary.on_hand_quantity, product.current_stock())
+        call_command('reconcile_alerts', '--verify', stdout = StringIO())
+
+    def test_runner_times_every_endpoint(self):
+        users = generate_tenants(users = 1, products = 3, batches = 4, seed = 2)
+
+        results = run_benchmark(users, repeat = 2, warmup = 0)
+
+        self.assertEqual(set(results), set(ENDPOINTS))
+        for name, result in results.items():
+            self.assertEqual(result['requests'], 2)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['min_ms'], result['p50_ms'])
+
+    def test_regressions_flag_queries_and_slowdowns(self):
+        before = {'endpoints': {
+            'a': {'queries': 3, 'p50_ms': 10.0, 'min_ms': 9.0},
+            'b': {'queries': 3, 'p50_ms': 10.0, 'min_ms': 9.0},
+        }}
+        after = {'endpoints': {
+            'a': {'queries': 4, 'p50_ms': 11.0, 'min_ms': 9.5},
+            'b': {'queries': 3, 'p50_ms': 30.0, 'min_ms': 25.0},
+            'c': {'queries': 9, 'p50_ms': 99.0, 'min_ms': 90.0},
+        }}
+
+        self.assertEqual(regressions(before, after), ['a: 3 -> 4 queries', 'b: p50 10.0 -> 30.0 ms'])
+
+
+@override_settings(CACHES = SHARED_CACHES)
+class ConditionalGetTest(APITestCase):
+    paths = [
+        '/api/products/', '/api/batches/', '/api/batches/active/', '/api/alerts/', '/api/dashboard/',
+        '/api/reports/', '/api/reports/by_product/', '/api/reports/monthly/', '/api/insights/',
+    ]
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            default_sell_price = Decimal('40')
+        )
+        StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        self.client.force_authenticate(user = self.user)
+
+    def test_unchanged_data_answers_304_without_queries(self):
+        for path in self.paths:
+            with self.subTest(path = path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+                with self.assertNumQueries(0):
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH = response['ETag'])
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(response.content, b'')
+
+    def test_per_process_cache_sends_no_validators(self):
+        with override_settings(CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            response = self.client.get('/api/reports/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('Last-Modified', response)
+            with self.assertRaises(CommandError):
+                call_command('precompute_reports', workers = 1, stdout = StringIO())
+
+    def test_write_changes_etag(self):
+        etag = self.client.get('/api/reports/')['ETag']
+
+        StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('5'),
+            remaining_quantity = Decimal('5'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        response = self.client.get('/api/reports/', HTTP_IF_NONE_MATCH = etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        get_cache().set(f'inventory:modified:{self.user.pk}', time.time() - 5, timeout = None)
+        modified = self.client.get('/api/products/')['Last-Modified']
+
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE = modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('5'),
+            remaining_quantity = Decimal('5'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE = modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_is_per_tenant(self):
+        etag = self.client.get('/api/dashboard/')['ETag']
+        other = User.objects.create_user(username = 'other', password = 'testpass123')
+        self.client.force_authenticate(user = other)
+
+        response = self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH = etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(INVENTORY_ASYNC_PARALLEL_QUERIES = False)
+    def test_async_view_shares_etag(self):
+        etag = self.client.get('/api/dashboard/')['ETag']
+        self.client.force_authenticate(user = None)
+        self.client.credentials(HTTP_AUTHORIZATION = f'Bearer {AccessToken.for_user(self.user)}')
+
+        response = self.client.get('/api/async/dashboard/', HTTP_IF_NONE_MATCH = etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username = 'admin',
+            password = 'adminpass123'
+        )
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.batches = []
+        for i in range(12):
+            product = Product.objects.create(
+                user = self.user,
+                name = f'Product {i}',
+                category = 'drink',
+                default_sell_price = Decimal('40')
+            )
+            self.batches.append(StockBatch.objects.create(
+                product = product,
+                quantity = Decimal(10 + i),
+                remaining_quantity = Decimal(10 + i),
+                buy_price_per_unit = Decimal('30'),
+                sell_price_per_unit = Decimal('40')
+            ))
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for url in ['/admin/inventory/product/', '/admin/inventory/stockbatch/',
+                    '/admin/inventory/lowstockalert/', '/admin/inventory/partialdepletion/']:
+            with self.subTest(url = url):
+                before, _ = self.changelist_queries(url)
+                product = Product.objects.create(
+                    user = self.user, name = f'Extra {url}', category = 'food', default_sell_price = Decimal('5')
+                )
+                batch = StockBatch.objects.create(
+                    product = product,
+                    quantity = Decimal('10'),
+                    remaining_quantity = Decimal('10'),
+                    buy_price_per_unit = Decimal('3'),
+                    sell_price_per_unit = Decimal('5')
+                )
+                PartialDepletion.objects.create(batch = batch, quantity_used = Decimal('1'))
+                after, _ = self.changelist_queries(url)
+
+                self.assertEqual(after, before)
+
+    def test_products_sort_by_annotated_stock(self):
+        # Column 4 of list_display is current_stock
+        _, response = self.changelist_queries('/admin/inventory/product/?o=-4')
+
+        stock = [p.stock_total for p in response.context['cl'].result_list]
+        self.assertEqual(stock, sorted(stock, reverse = True))
+        self.assertEqual(stock[0], Decimal('21'))
+
+    def test_finish_action_updates_ledger_rollups_and_alerts(self):
+        selected = self.batches[:5]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/admin/inventory/stockbatch/', {
+                'action': 'finish_selected',
+                '_selected_action': [b.pk for b in selected],
+            })
+        self.assertEqual(response.status_code, 302)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "inventory_stockbatch"')]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(StockBatch.objects.filter(is_depleted = True).count(), 5)
+        for batch in selected:
+            self.assertEqual(batch.product.current_stock(), Decimal('0'))
+            self.assertTrue(LowStockAlert.objects.get(product = batch.product).is_triggered)
+        rollup = DailyProfitRollup.objects.get(user = self.user)
+        self.assertEqual(rollup.batches_depleted, 5)
+        self.assertEqual(rollup.units, Decimal('60'))
+        self.assertEqual(rollup.profit, Decimal('600'))
+        call_command('reconcile_alerts', '--verify', stdout = StringIO())
+
+    def test_finish_action_on_changelist_filtered_to_open_batches(self):
+        batch = self.batches[0]
+        version = data_version(self.user.pk)
+        response = self.client.post('/admin/inventory/stockbatch/?is_depleted__exact=0', {
+            'action': 'finish_selected',
+            '_selected_action': [batch.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+
+        summary = ProductStock.objects.get(product = batch.product)
+        self.assertEqual(summary.on_hand_quantity, Decimal('0'))
+        self.assertEqual(summary.active_batches, 0)
+        self.assertEqual(DailyProfitRollup.objects.get(user = self.user).batches_depleted, 1)
+        self.assertNotEqual(data_version(self.user.pk), version)
+
+    def test_reset_thresholds_action(self):
+        batch = self.batches[0]
+        PartialDepletion.objects.create(batch = batch, quantity_used = Decimal('5'))
+        alert = LowStockAlert.objects.get(product = batch.product)
+        LowStockAlert.objects.filter(pk = alert.pk).update(threshold_quantity = Decimal('50'))
+
+        self.client.post('/admin/inventory/lowstockalert/', {
+            'action': 'reset_thresholds',
+            '_selected_action': [alert.pk],
+        })
+
+        alert.refresh_from_db()
+        self.assertEqual(alert.threshold_quantity, Decimal('1'))
+        self.assertFalse(alert.is_triggered)
+
+
+@override_settings(INVENTORY_REPORT_SNAPSHOTS = True, CACHES = SHARED_CACHES)
+class ReportSnapshotTest(APITestCase):
+    paths = ['/api/reports/by_product/', '/api/reports/monthly/', '/api/insights/']
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            default_sell_price = Decimal('40')
+        )
+        StockBatch.objects.create(
+            product = product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('4'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        ).mark_depleted()
+        self.batch = StockBatch.objects.create(
+            product = product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        self.client.force_authenticate(user = self.user)
+
+    def test_snapshots_serve_the_live_payload(self):
+        live = {}
+        for path in self.paths:
+            response = self.client.get(path)
+            self.assertEqual(response['X-Snapshot'], 'live')
+            live[path] = json.loads(response.content)
+
+        out = StringIO()
+        call_command('precompute_reports', workers = 1, stdout = out)
+        self.assertIn('Refreshed 3 snapshots of 1 tenants', out.getvalue())
+
+        for path in self.paths:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+            self.assertEqual(response['X-Snapshot'], 'fresh')
+            self.assertIn('X-Snapshot-At', response)
+            self.assertEqual(json.loads(response.content), live[path])
+            self.assertEqual(len(queries), 1)
+
+    def test_write_makes_snapshots_stale(self):
+        precompute([self.user.pk])
+        self.batch.mark_depleted()
+
+        response = self.client.get('/api/reports/by_product/')
+        self.assertEqual(response['X-Snapshot'], 'live')
+        self.assertEqual(response.data[0]['batches_sold'], 2)
+
+        with override_settings(INVENTORY_SNAPSHOT_MAX_STALENESS = 60):
+            response = self.client.get('/api/reports/by_product/')
+        self.assertEqual(response['X-Snapshot'], 'stale')
+        self.assertEqual(response.json()[0]['batches_sold'], 1)
+
+    def test_only_outdated_tenants_are_recomputed(self):
+        precompute([self.user.pk])
+        computed_at = ReportSnapshot.objects.get(user = self.user, name = 'insights').computed_at
+
+        out = StringIO()
+        call_command('precompute_reports', workers = 1, stdout = out)
+        self.assertIn('Refreshed 0 snapshots of 0 tenants', out.getvalue())
+
+        self.batch.mark_depleted()
+        call_command('precompute_reports', workers = 1, stdout = out)
+        snapshot = ReportSnapshot.objects.get(user = self.user, name = 'insights')
+        self.assertGreater(snapshot.computed_at, computed_at)
+        self.assertEqual(self.client.get('/api/insights/')['X-Snapshot'], 'fresh')
+
+    def test_disabled_snapshots_are_not_looked_up(self):
+        precompute([self.user.pk])
+        with override_settings(INVENTORY_REPORT_SNAPSHOTS = False):
+            response = self.client.get('/api/reports/monthly/')
+        self.assertNotIn('X-Snapshot', response)
+
+    def test_shards_keep_a_tenant_on_one_worker(self):
+        self.assertEqual(shard([1, 2, 3, 4, 5], 2), [[2, 4], [1, 3, 5]])
+        self.assertEqual(shard([3], 4), [[3]])
+
+
+@override_settings(CACHES = SHARED_CACHES)
+class ReportSnapshotWorkerTest(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a database shared between processes; set DB_TEST_NAME for SQLite')
+
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username = f'tenant{i}', password = 'testpass123')
+            product = Product.objects.create(user = user, name = 'Soda', default_sell_price = Decimal('40'))
+            StockBatch.objects.create(
+                product = product,
+                quantity = Decimal('10'),
+                remaining_quantity = Decimal('10'),
+                buy_price_per_unit = Decimal('30'),
+                sell_price_per_unit = Decimal('40')
+            ).mark_depleted()
+            self.users.append(user)
+
+    def test_worker_processes_fill_every_tenant(self):
+        results = precompute([user.pk for user in self.users], workers = 2)
+
+        self.assertEqual(sorted(results), [user.pk for user in self.users])
+        self.assertEqual(ReportSnapshot.objects.count(), 9)
+
+
+class StockValuationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            default_sell_price = Decimal('40')
+        )
+        now = timezone.now()
+        self.days_ago = lambda days: now - timedelta(days = days)
+        # 10 at 20 and 10 at 30, then 4 used from the first batch and the rest finished today
+        self.first = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('20'),
+            sell_price_per_unit = Decimal('40'),
+            added_at = self.days_ago(90)
+        )
+        StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40'),
+            added_at = self.days_ago(60)
+        )
+        PartialDepletion.objects.create(batch = self.first, quantity_used = Decimal('4'), recorded_at = self.days_ago(45))
+        self.first.refresh_from_db()
+        self.first.mark_depleted()
+        self.client.force_authenticate(user = self.user)
+
+    def test_values_past_dates_at_fifo_and_average_cost(self):
+        before = stock_valuation(self.user, self.days_ago(75))
+        self.assertEqual(before['total_quantity'], Decimal('10'))
+        self.assertEqual(before['fifo_value'], Decimal('200.00'))
+
+        both = stock_valuation(self.user, self.days_ago(40))
+        self.assertEqual(both['total_quantity'], Decimal('16'))
+        # FIFO keeps the newest units: 10 at 30 and 6 at 20
+        self.assertEqual(both['fifo_value'], Decimal('420.00'))
+        # The moving average after the second intake was 25
+        self.assertEqual(both['average_value'], Decimal('400.00'))
+
+        self.assertEqual(stock_valuation(self.user, self.days_ago(100))['products'], [])
+
+    def test_current_valuation_matches_the_stock_ledger(self):
+        response = self.client.get('/api/reports/valuation/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(str(response.data['fifo_value'])), Decimal('300.00'))
+        self.assertEqual(
+            Decimal(str(response.data['fifo_value'])),
+            self.client.get('/api/reports/').data['active_stock_value']
+        )
+
+    def test_checkpoints_give_the_same_answer(self):
+        as_of = [self.days_ago(days) for days in (80, 50, 35, 10)]
+        replayed = [stock_valuation(self.user, moment) for moment in as_of]
+
+        self.assertGreater(build_checkpoints(self.user), 0)
+        for moment, expected in zip(as_of, replayed):
+            valuation = stock_valuation(self.user, moment)
+            self.assertEqual(valuation['products'], expected['products'])
+        self.assertIsNotNone(valuation['checkpoint'])
+
+    def test_backdated_write_drops_later_checkpoints(self):
+        build_checkpoints(self.user)
+        StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('5'),
+            remaining_quantity = Decimal('5'),
+            buy_price_per_unit = Decimal('10'),
+            sell_price_per_unit = Decimal('40'),
+            added_at = self.days_ago(70)
+        )
+
+        self.assertFalse(ValuationCheckpoint.objects.filter(as_of__gte = self.days_ago(70)).exists())
+        self.assertEqual(stock_valuation(self.user, self.days_ago(40))['total_quantity'], Decimal('21'))
+
+    def test_as_of_accepts_dates_only(self):
+        day = self.days_ago(40).date().isoformat()
+        response = self.client.get('/api/reports/valuation/', {'as_of': day})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get('/api/reports/valuation/', {'as_of': 'last week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+
+class StockMovementLedgerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username = 'testuser',
+            password = 'testpass123'
+        )
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Soda',
+            default_sell_price = Decimal('40')
+        )
+        self.batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+
+    def movements(self, batch):
+        return list(batch.movements.values_list('kind', 'quantity'))
+
+    def test_every_change_appends_a_movement(self):
+        PartialDepletion.objects.create(batch = self.batch, quantity_used = Decimal('3'))
+        self.batch.refresh_from_db()
+        self.batch.mark_depleted()
+
+        self.assertEqual(self.movements(self.batch), [
+            (StockMovement.INTAKE, Decimal('10')),
+            (StockMovement.USE, Decimal('-3')),
+            (StockMovement.FINISH, Decimal('-7')),
+        ])
+        finish = self.batch.movements.get(kind = StockMovement.FINISH)
+        self.assertEqual(finish.recorded_at, self.batch.depleted_at)
+
+    def test_overused_partial_depletion_records_what_was_left(self):
+        PartialDepletion.objects.create(batch = self.batch, quantity_used = Decimal('12'))
+
+        self.assertEqual(self.movements(self.batch), [
+            (StockMovement.INTAKE, Decimal('10')),
+            (StockMovement.USE, Decimal('-10')),
+            (StockMovement.FINISH, Decimal('0')),
+        ])
+
+    def test_bulk_paths_keep_the_ledger_in_step(self):
+        other = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('5'),
+            remaining_quantity = Decimal('5'),
+            buy_price_per_unit = Decimal('30'),
+            sell_price_per_unit = Decimal('40')
+        )
+        bulk_deplete(self.user, [{'product': self.product.pk, 'quantity': Decimal('12')}])
+        finish_batches(StockBatch.objects.filter(product = self.product))
+
+        out = StringIO()
+        call_command('replay_movements', verify = True, stdout = out)
+        self.assertIn('All 2 batches match the ledger', out.getvalue())
+        self.assertEqual(sum(q for _, q in self.movements(other)), Decimal('0'))
+
+    def test_movements_are_append_only(self):
+        movement = self.batch.movements.get()
+        with self.assertRaises(ValueError):
+            movement.save()
+        with self.assertRaises(ValueError):
+            movement.delete()
+
+    def test_replay_restores_batches_from_the_ledger(self):
+        PartialDepletion.objects.create(batch = self.batch, quantity_used = Decimal('4'))
+        StockBatch.objects.filter(pk = self.batch.pk).update(remaining_quantity = Decimal('9'))
+        ProductStock.rebuild([self.product.pk])
+
+        with self.assertRaises(CommandError):
+            call_command('replay_movements', verify = True, stdout = StringIO())
+        call_command('replay_movements', stdout = StringIO())
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.remaining_quantity, Decimal('6'))
+        self.assertEqual(ProductStock.objects.get(product = self.product).on_hand_quantity, Decimal('6'))
+
+
+class HistoryPartitionTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username = 'partitioned', password = 'pass')
+        self.product = Product.objects.create(
+            user = self.user,
+            name = 'Sugar',
+            default_sell_price = Decimal('120')
+        )
+
+    def test_months_and_names(self):
+        self.assertEqual(add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(
+            partition_name('inventory_stockmovement', date(2026, 3, 1)),
+            'inventory_stockmovement_p202603'
+        )
+
+    def test_commands_refuse_without_postgres(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('Partitioning runs on Postgres')
+        with self.assertRaises(CommandError):
+            call_command('create_partitions', stdout = StringIO())
+        with self.assertRaises(CommandError):
+            call_command('archive_partitions', before = '2020-01', stdout = StringIO())
+
+    def test_partitioned_history_keeps_working(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Partitioning needs Postgres')
+        call_command('create_partitions', convert = True, months = 1, stdout = StringIO())
+        with connection.cursor() as cursor:
+            for table in PARTITIONED:
+                self.assertTrue(is_partitioned(cursor, table))
+                self.assertIn(timezone.now().date().replace(day = 1), partitions(cursor, table))
+
+        batch = StockBatch.objects.create(
+            product = self.product,
+            quantity = Decimal('10'),
+            remaining_quantity = Decimal('10'),
+            buy_price_per_unit = Decimal('100'),
+            sell_price_per_unit = Decimal('120')
+        )
+        PartialDepletion.objects.create(batch = batch, quantity_used = Decimal('4'))
+        batch.refresh_from_db()
+        self.assertEqual(batch.remaining_quantity, Decimal('6'))
+        self.assertEqual(sum(m.quantity for m in batch.movements.all()), Decimal('6'))
+
+        out = StringIO()
+        call_command('replay_movements', verify = True, stdout = out)
+        self.assertIn('match the ledger', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('archive_partitions', before = timezone.now().strftime('%Y-%m'), stdout = StringIO())
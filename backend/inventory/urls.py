@@ -1,6 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewset, DashboardViewSet, LowStockAlertViewSet, StockBatchViewset, ReportViewSet, InsightViewSet
+from . import async_views
+from .views import (
+    ProductViewset, DashboardViewSet, LowStockAlertViewSet, StockBatchViewset, ReportViewSet, InsightViewSet,
+    CacheStatsView, EventTicketView, RequestMetricsView
+)
 
 router = DefaultRouter()
 router.register(r'products', ProductViewset, basename='product')
@@ -11,5 +15,11 @@ router.register(r'reports', ReportViewSet, basename='report')
 router.register(r'insights', InsightViewSet, basename='insight')
 
 urlpatterns = [
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('_metrics/', RequestMetricsView.as_view(), name='request-metrics'),
+    path('events/ticket/', EventTicketView.as_view(), name='event-ticket'),
+    path('async/dashboard/', async_views.dashboard, name='async-dashboard'),
+    path('async/reports/', async_views.reports, name='async-reports'),
+    path('async/insights/', async_views.insights, name='async-insights'),
     path('', include(router.urls))
 ]
\ No newline at end of file
@@ -0,0 +1,188 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Min, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Product, StockBatch, StockMovement, ValuationCheckpoint
+
+CENT = Decimal('0.01')
+COST = Decimal('0.0001')
+MOVEMENT_FIELDS = ('product_id', 'kind', 'quantity', 'unit_cost')
+
+
+def movements(user, start, end):
+    """(product_id, kind, quantity, unit cost) of the tenant's stock movements in (start, end], in order.
+
+    A plain range on recorded_at, so with partitioned history Postgres only
+    scans the months in the window.
+    """
+    window = StockMovement.objects.filter(user=user, recorded_at__lte=end)
+    if start is not None:
+        window = window.filter(recorded_at__gt=start)
+    return window.order_by('recorded_at', 'id').values_list(*MOVEMENT_FIELDS)
+
+
+def empty_position():
+    return {'quantity': Decimal('0'), 'average_cost': Decimal('0'), 'layers': []}
+
+
+def replay(positions, rows):
+    """Apply movements to {product_id: position} in order, keeping a moving average cost and FIFO layers"""
+    for product_id, kind, delta, unit_cost in rows:
+        position = positions.setdefault(product_id, empty_position())
+        # Stock coming in, whether delivered or found, adds a cost layer
+        if delta > 0 and kind in (StockMovement.INTAKE, StockMovement.ADJUSTMENT):
+            held = max(position['quantity'], Decimal('0'))
+            position['average_cost'] = (
+                (held * position['average_cost'] + delta * unit_cost) / (held + delta)
+            ).quantize(COST)
+            position['layers'].append([delta, unit_cost])
+        position['quantity'] += delta
+    return positions
+
+
+def fifo_layers(layers, quantity):
+    """The newest layers covering quantity, oldest first: what FIFO leaves on hand"""
+    kept = []
+    need = quantity
+    for layer_quantity, unit_cost in reversed(layers):
+        if need <= 0:
+            break
+        take = min(layer_quantity, need)
+        kept.append([take, unit_cost])
+        need -= take
+    kept.reverse()
+    return kept
+
+
+def checkpoint_positions(user, as_of):
+    """Positions at the tenant's latest checkpoint at or before as_of and its time, or ({}, None)"""
+    latest = ValuationCheckpoint.objects.filter(
+        user=user, as_of__lte=as_of
+    ).order_by('-as_of').values('as_of')[:1]
+    positions = {}
+    start = None
+    for checkpoint in ValuationCheckpoint.objects.filter(user=user, as_of=Subquery(latest)):
+        start = checkpoint.as_of
+        positions[checkpoint.product_id] = {
+            'quantity': checkpoint.quantity,
+            'average_cost': checkpoint.average_cost,
+            'layers': [[Decimal(q), Decimal(c)] for q, c in checkpoint.layers],
+        }
+    return positions, start
+
+
+def positions_at(user, as_of):
+    positions, start = checkpoint_positions(user, as_of)
+    return replay(positions, movements(user, start, as_of)), start
+
+
+def parse_as_of(value):
+    """A date means the end of that day; raises ValueError for anything but a date or ISO 8601 datetime"""
+    moment = parse_datetime(value)
+    if moment is not None:
+        return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return timezone.make_aware(datetime.combine(day, time.max))
+
+
+def stock_valuation(user, as_of=None):
+    """On-hand quantity and value per product at as_of (default now), at FIFO and moving average cost"""
+    as_of = as_of or timezone.now()
+    positions, checkpoint = positions_at(user, as_of)
+    products = Product.objects.filter(user=user, pk__in=list(positions)).values('id', 'name', 'category')
+
+    rows = []
+    total_quantity = total_fifo = total_average = Decimal('0')
+    for product in products:
+        position = positions[product['id']]
+        quantity = max(position['quantity'], Decimal('0'))
+        if not quantity:
+            continue
+        fifo_value = sum((q * c for q, c in fifo_layers(position['layers'], quantity)), Decimal('0'))
+        average_value = quantity * position['average_cost']
+        total_quantity += quantity
+        total_fifo += fifo_value
+        total_average += average_value
+        rows.append({
+            'product_id': product['id'],
+            'name': product['name'],
+            'category': product['category'],
+            'quantity': quantity,
+            'fifo_value': fifo_value.quantize(CENT),
+            'fifo_unit_cost': (fifo_value / quantity).quantize(COST),
+            'average_value': average_value.quantize(CENT),
+            'average_unit_cost': position['average_cost'],
+        })
+    rows.sort(key=lambda row: row['fifo_value'], reverse=True)
+
+    return {
+        'as_of': as_of,
+        'checkpoint': checkpoint,
+        'total_quantity': total_quantity,
+        'fifo_value': total_fifo.quantize(CENT),
+        'average_value': total_average.quantize(CENT),
+        'products': rows,
+    }
+
+
+def month_starts(after, until):
+    """Local midnights on the first of each month in (after, until]"""
+    day = timezone.localtime(after).date().replace(day=1)
+    starts = []
+    while True:
+        day = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        moment = timezone.make_aware(datetime.combine(day, time.min))
+        if moment > until:
+            return starts
+        if moment > after:
+            starts.append(moment)
+
+
+def build_checkpoints(user, until=None):
+    """Write the tenant's missing month-start checkpoints up to until (default now) with one scan.
+
+    Continues from the latest checkpoint, or from the first intake. Returns
+    the number of month starts written.
+    """
+    until = until or timezone.now()
+    positions, start = checkpoint_positions(user, until)
+    first = start or StockBatch.objects.filter(product__user=user).aggregate(first=Min('added_at'))['first']
+    if first is None:
+        return 0
+    boundaries = month_starts(first, until)
+    if not boundaries:
+        return 0
+
+    checkpoints = []
+
+    def snapshot(moment):
+        for product_id, position in positions.items():
+            # Only the layers still on hand matter from here on
+            position['layers'] = fifo_layers(position['layers'], max(position['quantity'], Decimal('0')))
+            checkpoints.append(ValuationCheckpoint(
+                user=user,
+                product_id=product_id,
+                as_of=moment,
+                quantity=position['quantity'],
+                average_cost=position['average_cost'],
+                layers=[[str(q), str(c)] for q, c in position['layers']],
+            ))
+
+    pending = iter(boundaries)
+    boundary = next(pending)
+    for row in movements(user, start, boundaries[-1]).values_list('recorded_at', *MOVEMENT_FIELDS):
+        while boundary is not None and row[0] > boundary:
+            snapshot(boundary)
+            boundary = next(pending, None)
+        replay(positions, [row[1:]])
+    while boundary is not None:
+        snapshot(boundary)
+        boundary = next(pending, None)
+
+    ValuationCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+    return len(boundaries)
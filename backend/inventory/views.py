@@ -1,18 +1,107 @@
+import csv
+import json
+import numpy as np
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Q, Avg, F, Count, ExpressionWrapper, DecimalField
+from rest_framework.renderers import BaseRenderer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from django.db.models import Sum, Q, Avg, F, Count, ExpressionWrapper, DecimalField, Value
 from django.utils import timezone
-from datetime import timedelta
-from .models import Product, StockBatch, PartialDepletion, LowStockAlert
-from django.db.models.functions import TruncDate, TruncMonth
+from datetime import datetime, time, timedelta
+from .models import Product, StockBatch, PartialDepletion, LowStockAlert, DailyProfitRollup, ProductStock
+from django.db.models.functions import TruncDate, TruncMonth, Coalesce
+from .analytics import user_batches, product_stats, ranked_movers
+from .forecast import forecast_products
+from .cache import tenant_cached, tenant_conditional, cache_stats
+from .metrics import request_metrics, reset_request_metrics
+from .snapshots import snapshot_served
+from .sse import issue_ticket, ticket_age
+from .valuation import parse_as_of, stock_valuation
 from decimal import Decimal
 from .serializers import (
     ProductSerializer, StockBatchSerializer, PartialDepletionSerializer,
-    LowStockAlertSerializer, DashboardSerializer
+    LowStockAlertSerializer, DashboardSerializer, BulkStockIntakeSerializer, BulkDepletionSerializer
 )
+from .bulk import bulk_intake, bulk_deplete, InsufficientStock, ProductNameConflict
+from .pagination import BatchPagination, DepletedBatchPagination, AlertPagination
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def run_parts(parts):
+    """Run a view's independent queries one after another (async_views overlaps them)"""
+    return {name: query() for name, query in parts.items()}
+
+
+def triggered_alerts(user):
+    """Active alerts on active products whose on-hand stock is at or below the threshold"""
+    return LowStockAlert.objects.filter(
+        product__user = user,
+        product__is_active = True,
+        is_active = True,
+        is_triggered = True
+    ).order_by('-product__created_at')
+
+HISTORY_FIELDS = [
+    'id', 'product', 'category', 'quantity', 'sold', 'buy_price', 'sell_price',
+    'revenue', 'cost', 'profit', 'margin', 'added_at', 'depleted_at', 'days_in_stock', 'notes'
+]
+
+
+def history_row(b):
+    """Revenue, cost, profit and margin of a depleted batch"""
+    sold = b.quantity - b.remaining_quantity
+    revenue = sold * b.sell_price_per_unit
+    cost = sold * b.buy_price_per_unit
+    profit = revenue - cost
+    margin = round((profit / cost) * 100, 1) if cost > 0 else 0
+    return {
+        'id': b.id,
+        'product': b.product.name,
+        'category': b.product.category,
+        'quantity': b.quantity,
+        'sold': sold,
+        'buy_price': b.buy_price_per_unit,
+        'sell_price': b.sell_price_per_unit,
+        'revenue': revenue,
+        'cost': cost,
+        'profit': profit,
+        'margin': margin,
+        'added_at': b.added_at.isoformat(),
+        'depleted_at': b.depleted_at.isoformat(),
+        'days_in_stock': b.days_in_stock,
+        'notes': b.notes
+    }
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
 
 # Views
 class ProductViewset(viewsets.ModelViewSet):
@@ -20,26 +109,30 @@ class ProductViewset(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Product.objects.filter(user=self.request.user, is_active=True)
+        return Product.objects.filter(
+            user=self.request.user, is_active=True
+        ).with_stock_summary()
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @tenant_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     @action(detail=False, methods=['get'])
+    @tenant_conditional
     def with_alerts(self, request):
-        products = self.get_queryset()
-        alerted = []
-        for product in products:
-            try:
-                if product.alert.is_active and product.alert.is_triggered:
-                    alerted.append({
-                        'id': product.id,
-                        'name': product.name,
-                        'current_stock': float(product.current_stock),
-                        'threshold': float(product.alert.threshold_quantity)
-                    })
-            except LowStockAlert.DoesNotExist:
-                pass
+        alerted = [{
+            'id': alert.product_id,
+            'name': alert.product.name,
+            'current_stock': float(alert.last_evaluated_stock),
+            'threshold': float(alert.threshold_quantity)
+        } for alert in LowStockAlert.objects.filter(
+            product__user = request.user,
+            is_active = True,
+            is_triggered = True
+        ).select_related('product').order_by('-product__created_at')]
 
         return Response(alerted)
     
@@ -61,19 +154,42 @@ class ProductViewset(viewsets.ModelViewSet):
         if status == 'finished':
             batch.mark_depleted('finished')
         elif status == 'partly_used':
-            PartialDepletion.objects.create(
-                batch=batch,
-                quantity_used=quantity_used or batch.remaining_quantity,
-                notes = request.data.get('notes', '')
-            )
+            try:
+                PartialDepletion.objects.create(
+                    batch=batch,
+                    quantity_used=quantity_used or batch.remaining_quantity,
+                    notes = request.data.get('notes', '')
+                )
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=409)
         return Response({'success': True, 'batch_id': batch.id})
 
+    @action(detail=False, methods=['post'])
+    def deplete_bulk(self, request):
+        serializer = BulkDepletionSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        try:
+            summary = bulk_deplete(request.user, serializer.validated_data['depletions'])
+        except InsufficientStock as exc:
+            return Response({
+                'error': 'Insufficient stock',
+                'shortfalls': [
+                    {'product': product_id, 'missing': missing}
+                    for product_id, missing in exc.shortfalls.items()
+                ]
+            }, status=400)
+        return Response({
+            'success': True,
+            'products': [{'product': product_id, **row} for product_id, row in summary.items()]
+        })
+
 class StockBatchViewset(viewsets.ModelViewSet):
     serializer_class = StockBatchSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BatchPagination
 
     def get_queryset(self):
-        qs = StockBatch.objects.filter(product__user = self.request.user)
+        qs = StockBatch.objects.filter(product__user = self.request.user).select_related('product')
         product_id = self.request.query_params.get('product')
         is_depleted = self.request.query_params.get('is_depleted')
         if product_id:
@@ -81,6 +197,10 @@ class StockBatchViewset(viewsets.ModelViewSet):
         if is_depleted is not None:
             qs = qs.filter(is_depleted=is_depleted.lower() == 'true')
         return qs
+
+    @tenant_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['post'])
     def mark_depleted(self, request, pk=None):
@@ -91,16 +211,39 @@ class StockBatchViewset(viewsets.ModelViewSet):
             batch.mark_depleted('finished')
         elif depletion_status == 'partly_used':
             quantity_used = request.data.get('quantity_used', batch.remaining_quantity)
-            PartialDepletion.objects.create(
-                batch = batch,
-                quantity_used = quantity_used,
-                notes = request.data.get('notes', '')
-            )
+            try:
+                PartialDepletion.objects.create(
+                    batch = batch,
+                    quantity_used = quantity_used,
+                    notes = request.data.get('notes', '')
+                )
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
         serializer = self.get_serializer(batch)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = BulkStockIntakeSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        try:
+            batches = bulk_intake(request.user, serializer.validated_data['batches'])
+        except ProductNameConflict as exc:
+            return Response({
+                'error': 'Ambiguous product names',
+                'product_names': [
+                    {'product_name': name, 'reason': reason} for name, reason in exc.conflicts.items()
+                ]
+            }, status=400)
+        return Response({
+            'created': len(batches),
+            'batch_ids': [b.id for b in batches],
+            'products': sorted({b.product_id for b in batches})
+        }, status=status.HTTP_201_CREATED)
         
 
     @action(detail=False, methods=['get'])
+    @tenant_conditional
     def active(self, request):
         batches = self.get_queryset().filter(remaining_quantity__gt = 0
         ).values('product__id', 'product__name').annotate(
@@ -109,464 +252,496 @@ class StockBatchViewset(viewsets.ModelViewSet):
         return Response(list(batches))
 
     @action(detail=False, methods=['get'])
+    @tenant_conditional
     def depleted_today(self, request):
         today = timezone.now().date()
         batches = self.get_queryset().filter(
             is_depleted = True,
-            depleted_at__date = today
+            depleted_at__gte = start_of_day(today),
+            depleted_at__lt = start_of_day(today + timedelta(days=1))
         )
         return Response({'count': batches.count()})
 
 class LowStockAlertViewSet(viewsets.ModelViewSet):
     serializer_class = LowStockAlertSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AlertPagination
 
     def get_queryset(self):
-        return LowStockAlert.objects.filter(product__user = self.request.user)
+        return LowStockAlert.objects.filter(
+            product__user = self.request.user
+        ).select_related('product__stock_summary')
+
+    @tenant_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=False, methods=['get'])
+    @tenant_conditional
     def triggered(self, request):
-        alerts = self.get_queryset().filter(is_active=True)
-        triggered = [alert for alert in alerts if alert.is_triggered]
+        triggered = self.get_queryset().filter(is_active=True, is_triggered=True)
         serializer = self.get_serializer(triggered, many=True)
         return Response(serializer.data)
     
 
-class ReportViewSet(viewsets.ViewSet):
-    permission_classes = [IsAuthenticated]
-    
-    def profit_expr(self):
-        return ExpressionWrapper(
-            (F('quantity') - F('remaining_quantity')) * (F('buy_price_per_unit') - F('sell_price_per_unit')),
+def report_parts(user):
+    """The report totals' independent queries"""
+    all_batches = StockBatch.objects.filter(product__user = user)
+    return {
+        'totals': lambda: DailyProfitRollup.objects.filter(user = user).aggregate(
+            revenue = Sum('revenue'), cost = Sum('cost')
+        ),
+        'active_value': lambda: ProductStock.objects.filter(product__user = user).aggregate(
+            value = Coalesce(Sum('on_hand_value'), Value(Decimal('0')))
+        )['value'],
+        'total_batches': lambda: all_batches.count(),
+        'depleted_batches': lambda: all_batches.filter(is_depleted=True).count(),
+    }
+
+
+def report_payload(parts):
+    total_revenue = parts['totals']['revenue'] or Decimal('0')
+    total_cost = parts['totals']['cost'] or Decimal('0')
+    total_profit = total_revenue - total_cost
+    overall_margin = round((total_profit / total_cost) * 100, 1) if total_cost > 0 else 0
+
+    return {
+        'total_revenue': total_revenue,
+        'total_cost': total_cost,
+        'total_profit': total_profit,
+        'overall_margin': overall_margin,
+        'active_stock_value': parts['active_value'],
+        'total_batches': parts['total_batches'],
+        'depleted_batches': parts['depleted_batches'],
+        'active_batches': parts['total_batches'] - parts['depleted_batches']
+    }
+
+
+def profit_expr():
+    return ExpressionWrapper(
+        (F('quantity') - F('remaining_quantity')) * (F('buy_price_per_unit') - F('sell_price_per_unit')),
+        output_field=DecimalField(max_digits=20, decimal_places=2)
+    )
+
+
+def revenue_expr():
+    return ExpressionWrapper(
+        (F('quantity') - F('remaining_quantity')) * (F('sell_price_per_unit')),
+        output_field=DecimalField(max_digits=20, decimal_places=2)
+    )
+
+
+def cost_expr():
+    return ExpressionWrapper(
+        (F('quantity') - F('remaining_quantity')) * (F('buy_price_per_unit')),
+        output_field=DecimalField(max_digits=20, decimal_places=2)
+    )
+
+
+def product_report(user):
+    """Revenue, cost and profit per product from the depleted batches"""
+    depleted = StockBatch.objects.filter(product__user = user, is_depleted = True)
+    rows = depleted.values(
+        'product__id', 'product__name', 'product__category'
+    ).annotate(
+        revenue=Sum(revenue_expr()),
+        cost = Sum(cost_expr()),
+        profit = Sum(profit_expr()),
+        batches_sold = Count('id'),
+        units_sold = Sum(ExpressionWrapper(
+            F('quantity') - F('remaining_quantity'),
             output_field=DecimalField(max_digits=20, decimal_places=2)
-        )
+        ))
+    ).order_by('-profit')
+
+    result = []
+    for r in rows:
+        cost = r['cost'] or Decimal('0')
+        profit = r['profit'] or Decimal('0')
+        margin = round((profit / cost) * 100, 1) if cost > 0 else 0
+
+        result.append({
+            'product_id': r['product__id'],
+            '': r['product__name'],
+            'category': r['product__category'],
+            'revenue': r['revenue'],
+            'cost': cost,
+            'profit': profit,
+            'margin': margin,
+            'batches_sold': r['batches_sold'],
+            'units_sold': r['units_sold']
+        })
+    return result
+
+
+def monthly_report(user):
+    """Revenue, cost and profit per month for the last year, from the daily rollups"""
+    year_ago = timezone.localdate() - timedelta(days=365)
+    rows = DailyProfitRollup.objects.filter(
+        user = user,
+        day__gte = year_ago
+    ).annotate(
+        month = TruncMonth('day')
+    ).values('month').annotate(
+        revenue = Sum('revenue'),
+        cost = Sum('cost'),
+        profit = Sum('profit'),
+    ).order_by('month')
+
+    result = []
+    for r in rows:
+        revenue = r['revenue'] or 0
+        cost = r['cost'] or 0
+        profit = r['profit'] or 0
+        result.append({
+            'month': r['month'].strftime('%b %Y'),
+            'month_key': r['month'].strftime('%Y-%m'),
+            'revenue': revenue,
+            'cost': cost,
+            'profit': profit,
+            'margin': round((profit / cost) * 100, 1) if cost > 0 else 0
+        })
+    return result
 
-    def revenue_expr(self):
-        return ExpressionWrapper(
-            (F('quantity') - F('remaining_quantity')) * (F('sell_price_per_unit')),
-            output_field=DecimalField(max_digits=20, decimal_places=2)
-        )
-    
 
-    def cost_expr(self):
-        return ExpressionWrapper(
-            (F('quantity') - F('remaining_quantity')) * (F('buy_price_per_unit')),
-            output_field=DecimalField(max_digits=20, decimal_places=2)
-        )
+class ReportViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
     
+    @tenant_conditional
+    @tenant_cached('reports')
     def list(self, request):
-        user = request.user
-        all_batches = StockBatch.objects.filter(product__user = user)
-        depleted = all_batches.filter(is_depleted=True)
-
-        total_revenue = depleted.aggregate(v=Sum(self.revenue_expr()))['v'] or Decimal('0')
-        total_cost = depleted.aggregate(v=Sum(self.cost_expr()))['v'] or Decimal('0')
-        total_profit = total_revenue - total_cost
-        overall_margin = round((total_profit / total_cost) * 100, 1) if total_cost > 0 else 0
-
-        active_value = sum(
-            b.remaining_quantity * b.buy_price_per_unit
-            for b in all_batches.filter(is_depleted = False)
-        )
-
-        total_batches = all_batches.count()
-        depleted_batches = depleted.count()
-        active_batches = total_batches- depleted_batches
-
-        return Response({
-            'total_revenue': total_revenue,
-            'total_cost': total_cost,
-            'total_profit': total_profit,
-            'overall_margin': overall_margin,
-            'active_stock_value': active_value,
-            'total_batches': total_batches,
-            'depleted_batches': depleted_batches,
-            'active_batches': active_batches
-        })
+        return Response(report_payload(run_parts(report_parts(request.user))))
 
     @action(detail = False, methods=['get'])
+    @tenant_conditional
+    @snapshot_served('reports-by-product')
+    @tenant_cached('reports-by-product')
     def by_product(self, request):
-        user = request.user
-        depleted = StockBatch.objects.filter(product__user = user, is_depleted = True)
-        rows = depleted.values(
-            'product__id', 'product__name', 'product__category'
-        ).annotate(
-            revenue=Sum(self.revenue_expr()),
-            cost = Sum(self.cost_expr()),
-            profit = Sum(self.profit_expr()),
-            batches_sold = Count('id'),
-            units_sold = Sum(ExpressionWrapper(
-                F('quantity') - F('remaining_quantity'),
-                output_field=DecimalField(max_digits=20, decimal_places=2)
-            ))
-        ).order_by('-profit')
-
-        result = []
-        for r in rows:
-            cost = r['cost'] or Decimal('0')
-            profit = r['profit'] or Decimal('0')
-            margin = round((profit / cost) * 100, 1) if cost > 0 else 0
-
-            result.append({
-                'product_id': r['product__id'],
-                '': r['product__name'],
-                'category': r['product__category'],
-                'revenue': r['revenue'],
-                'cost': cost,
-                'profit': profit,
-                'margin': margin,
-                'batches_sold': r['batches_sold'],
-                'units_sold': r['units_sold']
-            })
-        return Response(result)
+        return Response(product_report(request.user))
     
     
     @action(detail=False, methods=['get'])
+    @tenant_conditional
     def history(self, request):
         user = request.user
         qs = StockBatch.objects.filter(
-            product__user = user, is_depleted = True
-        ).select_related('product').order_by('-depleted_at')
+            product__user = user, is_depleted = True, depleted_at__isnull = False
+        ).select_related('product')
         
         product_id = request.query_params.get('product')
         if product_id:
             qs = qs.filter(product__id = product_id)
 
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 20))
-        total = qs.count()
-        batches = qs[(page - 1) * page_size : page * page_size]
-
-        data = []
-        for b in batches:
-            sold = b['quantity'] - b['remaining_quantity']
-            revenue = sold * b['sell_price_per_unit']
-            cost = sold * b['buy_price_per_unit']
-            profit = revenue - cost
-            margin = round((profit / cost) * 100, 1) if cost > 0 else 0
-            data.append({
-                'id': b.id,
-                'product': b.product.name,
-                'category': b.product.category,
-                'quantity': b.quantity,
-                'sold': sold,
-                'buy_price': b.buy_price_per_unit,
-                'sell_price': b.sell_price_per_unit,
-                'revenue': revenue,
-                'cost': cost,
-                'profit': profit,
-                'margin': margin,
-                'added_at': b.added_at.isoformat(),
-                'depleted_at': b.depleted_at.isoformat(),
-                'days_in_stock': b.days_in_stock,
-                'notes': b.notes
-            })
-        return Response({
-            'results': data,
-            'total': total,
-            'page': page,
-            'page_size': page_size,
-            'total_pages': (total + page_size-1) // page_size
-        })
-    
-    def monthly(self, request):
-        user = request.user
-        year_ago = timezone.now() - timedelta(days=365)
-        rows = StockBatch.objects.filter(
-            product__user = user,
-            is_depleted = True,
-            depleted_at__gte = year_ago
-        ).annotate(
-            month = TruncMonth('depleted_at')
-        ).values('month').annotate(
-            revenue = Sum(self.revenue_expr()),
-            cost = Sum(self.cost_expr()),
-            profit = Sum(self.profit_expr()),
-        ).order_by('month')
+        paginator = DepletedBatchPagination()
+        batches = paginator.paginate_queryset(qs, request, view=self)
 
-        result = []
-        for r in rows:
-            revenue = r['revenue'] or 0
-            cost = r['cost'] or 0
-            profit = r['profit'] or 0
-            result.append({
-                'month': r['month'].strftime('%b %Y'),
-                'month_key': r['month'].strftime('%Y-%m'),
-                'revenue': revenue,
-                'cost': cost,
-                'profit': profit,
-                'margin': round((profit / cost) * 100, 1) if cost > 0 else 0
-            })
-        return Response(result)
-    
-class InsightViewSet(viewsets.ViewSet):
-    permission_classes = [IsAuthenticated]
-    def list(self, request):
-        user = request.user
-        products = Product.objects.filter(user = user, is_active=True).prefetch_related('batches')
-        depleted = StockBatch.objects.filter(product__user = user, is_depleted = True)
-
-        product_velocity = {}
-        product_turnover = {}
-        for b in depleted.select_related('products'):
-            delta = b.depleted_at - b.added_at
-            days = max(delta.days, 1)
-            sold = b.quantity - b.remaining_quantity
-            vel = sold / days
-            key = (b.product.id, b.product.name)
-            if key not in product_velocity:
-                product_velocity[key] = []
-                product_turnover[key] = []
-            product_velocity[key].append(vel)
-            product_turnover[key].append(days)
-
-        velocity_summary = []
-        for (pid, name), vels in product_velocity.items():
-            avg_vel = sum(vels) / len(vels)
-            avg_turn = sum(product_turnover[(pid, name)]) / len(product_turnover[(pid, name)])
-            velocity_summary.append({
-                'product_id': pid,
-                'product_name': name,
-                'avg_velocity': round(avg_vel),
-                'avg_turnover': round(avg_turn, 2),
-                'batches_counted': len(vels)
-            })
-            velocity_summary.sort(key=lambda x: x['avg_velocity'], reverse=True)
+        data = [history_row(b) for b in batches]
+        return paginator.get_paginated_response(data)
 
-            fast_movers = velocity_summary[:5]
-            slow_movers = list(reversed(velocity_summary[:-5])) if len(velocity_summary) > 5 else []
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    @tenant_conditional
+    def export(self, request):
+        qs = StockBatch.objects.filter(
+            product__user = request.user, is_depleted = True, depleted_at__isnull = False
+        ).select_related('product').order_by('depleted_at', 'id')
 
-        alerts = []
-        for product in products:
-            try:
-                if product.alert.is_active and product.alert.is_triggered:
-                    stock = product.current_stock()
-                    threshold = product.alert.threshold_quantity
-                    alerts.append({
-                        'product_id': product.id,
-                        'product': product.name,
-                        'current_stock': stock,
-                        'threshold': threshold,
-                        'pct_remaining': round((stock / threshold) * 100 ) if threshold > 0 else 0,
-                    })
-            except LowStockAlert.DoesNotExist:
-                pass
-
-        month_ago = timezone.now() - timedelta(days=30)
-        active_b = StockBatch.objects.filter(
-            product__user = user,
-            remaining_quantity__gte = 0,
-            
-            is_depleted = False,
-        )
+        product_id = request.query_params.get('product')
+        if product_id:
+            qs = qs.filter(product__id = product_id)
 
-        stale = active_b.filter(
-            added_at__lte = month_ago,
-        ).select_related('product')
-        
-        stale_stock = [{
-            'product_id': b.product.id,
-            'product': b.product.name,
-            'remaining': b.remaining_quantity,
-            'days_in_stock': b.days_in_stock,
-            'added_at': b.added_at.strftime('%d %b %Y')
-        } for b in stale]
-
-        profit_expr = ExpressionWrapper(
-            (F('quantity') - F('remaining_quantity')) * (F('sell_price_per_unit') - F('buy_price_per_unit')),
-            output_field=DecimalField(max_digits=20, decimal_places=2)
-        )
+        # A server-side cursor keeps memory flat however long the history is
+        rows = (history_row(b) for b in qs.iterator(chunk_size=2000))
 
-        category_rows = depleted.values('product__category').annotate(
-            profit = Sum(profit_expr),
-            batches = Count('id')
-        ).order_by('-profit')
+        if request.accepted_renderer.format == 'ndjson':
+            lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+            response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+            extension = 'ndjson'
+        else:
+            writer = csv.writer(Echo())
 
-        category = [{
-            'category': r['product__category'],
-            'profit': r['profit'] or 0,
-            'batches': r['batches']
-        } for r in category_rows]
+            def csv_lines():
+                yield writer.writerow(HISTORY_FIELDS)
+                for row in rows:
+                    yield writer.writerow([row[field] for field in HISTORY_FIELDS])
 
-        return Response({
-            'fast_movers': fast_movers,
-            'slow_movers': slow_movers,
-            'low_stock_alerts': alerts,
-            'stale_stock': stale_stock,
-            'category_breakdown': category,
-            'total_products': products.count(),
-            'total_active_batches': active_b.count()
-        })
+            response = StreamingHttpResponse(csv_lines(), content_type='text/csv')
+            extension = 'csv'
+
+        response['Content-Disposition'] = f'attachment; filename="stock-history.{extension}"'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    @tenant_conditional
+    def valuation(self, request):
+        as_of = request.query_params.get('as_of')
+        try:
+            as_of = parse_as_of(as_of) if as_of else None
+        except ValueError:
+            return Response(
+                {'error': 'as_of must be a date (YYYY-MM-DD) or an ISO 8601 datetime'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(stock_valuation(request.user, as_of))
+
+    @action(detail=False, methods=['get'])
+    @tenant_conditional
+    @snapshot_served('reports-monthly')
+    def monthly(self, request):
+        return Response(monthly_report(request.user))
+    
+def insight_parts(user):
+    """The insights' independent queries"""
+    month_ago = timezone.now() - timedelta(days=30)
+    active_b = StockBatch.objects.filter(
+        product__user = user,
+        remaining_quantity__gte = 0,
+        is_depleted = False,
+    )
+    return {
+        'names': lambda: dict(Product.objects.filter(user = user).values_list('id', 'name')),
+        'batches': lambda: user_batches(user),
+        'alerts': lambda: list(triggered_alerts(user).select_related('product')),
+        'stale': lambda: list(active_b.filter(added_at__lte = month_ago).select_related('product')),
+        'categories': lambda: list(DailyProfitRollup.objects.filter(user = user).values('category').annotate(
+            profit = Sum('profit'),
+            batches = Sum('batches_depleted')
+        ).order_by('-profit')),
+        'total_products': lambda: Product.objects.filter(user = user, is_active=True).count(),
+        'total_active_batches': lambda: active_b.count(),
+    }
+
+
+def insight_payload(parts):
+    velocity_summary = [{
+        'product_id': r['product_id'],
+        'product_name': r['product_name'],
+        'avg_velocity': round(r['velocity']),
+        'avg_turnover': round(r['turnover'], 2),
+        'velocity_percentile': round(r['percentile'], 1),
+        'batches_counted': r['batches']
+    } for r in ranked_movers(product_stats(parts['batches']), parts['names'])]
+
+    fast_movers = velocity_summary[:5]
+    slow_movers = list(reversed(velocity_summary[-5:])) if len(velocity_summary) > 5 else []
+
+    alerts = [{
+        'product_id': alert.product_id,
+        'product': alert.product.name,
+        'current_stock': alert.last_evaluated_stock,
+        'threshold': alert.threshold_quantity,
+        'pct_remaining': round((alert.last_evaluated_stock / alert.threshold_quantity) * 100) if alert.threshold_quantity > 0 else 0,
+    } for alert in parts['alerts']]
+
+    stale_stock = [{
+        'product_id': b.product.id,
+        'product': b.product.name,
+        'remaining': b.remaining_quantity,
+        'days_in_stock': b.days_in_stock,
+        'added_at': b.added_at.strftime('%d %b %Y')
+    } for b in parts['stale']]
+
+    category = [{
+        'category': r['category'],
+        'profit': r['profit'] or 0,
+        'batches': r['batches']
+    } for r in parts['categories']]
+
+    return {
+        'fast_movers': fast_movers,
+        'slow_movers': slow_movers,
+        'low_stock_alerts': alerts,
+        'stale_stock': stale_stock,
+        'category_breakdown': category,
+        'total_products': parts['total_products'],
+        'total_active_batches': parts['total_active_batches']
+    }
+
+
+def insight_report(user):
+    return insight_payload(run_parts(insight_parts(user)))
+
+
+class InsightViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @tenant_conditional
+    @snapshot_served('insights')
+    @tenant_cached('insights')
+    def list(self, request):
+        return Response(insight_report(request.user))
     
     @action(detail=False, methods=['get'])
+    @tenant_conditional
     def velocity(self, request):
         user = request.user
-        products = Product.objects.filter(user=user, is_depleted=False)
+        products = Product.objects.filter(user = user, is_active = True).values('id', 'name', 'category')
+        stats = product_stats(user_batches(user))
+        index = {int(pid): i for i, pid in enumerate(stats['product_id'])}
+
         result = []
         for product in products:
-            stock = product.current_stock()
-            avg_vel = product.average_velocity
-            days_left = round(stock / avg_vel, 1) if avg_vel > 0 else None
+            i = index.get(product['id'])
+            if i is None:
+                stock = value = velocity = 0.0
+                days_left = percentile = None
+            else:
+                stock = float(stats['on_hand'][i])
+                value = float(stats['on_hand_value'][i])
+                velocity = float(stats['active_velocity'][i])
+                days_left = stats['days_until_empty'][i]
+                days_left = None if np.isnan(days_left) else round(float(days_left), 1)
+                percentile = stats['active_velocity_percentile'][i]
+                percentile = None if np.isnan(percentile) else round(float(percentile), 1)
             result.append({
-                'product_id': product.id,
-                'product': product.name,
-                'category': product.category,
-                'current_stock': stock,
-                'avg_velocity': round(avg_vel, 2),
+                'product_id': product['id'],
+                'product': product['name'],
+                'category': product['category'],
+                'current_stock': round(stock, 2),
+                'avg_velocity': round(velocity, 2),
+                'velocity_percentile': percentile,
                 'days_until_empty': days_left,
-                'total_value': product.total_value
+                'total_value': round(value, 2)
             })
         result.sort(key= lambda x: x['avg_velocity'], reverse=True)
         return Response(result)
 
+    @action(detail=False, methods=['get'])
+    @tenant_conditional
+    def forecast(self, request):
+        limits = {
+            'history_days': (56, 14, 365),
+            'horizon': (28, 1, 90),
+            'lead_time': (7, 0, 90),
+            'review_days': (14, 1, 90),
+        }
+        options = {}
+        for name, (default, low, high) in limits.items():
+            try:
+                options[name] = int(request.query_params.get(name, default))
+            except ValueError:
+                return Response({'error': f'{name} must be a whole number of days'}, status=status.HTTP_400_BAD_REQUEST)
+            if not low <= options[name] <= high:
+                return Response({'error': f'{name} must be between {low} and {high}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = list(Product.objects.filter(user = request.user, is_active = True).values('id', 'name'))
+        result, cached = forecast_products(request.user, products, **options)
+        result.sort(key=lambda x: (x['days_until_stockout'] is None, x['days_until_stockout'] or 0, x['product']))
+        return Response(result, headers={'X-Forecast-Parameters': 'cached' if cached else 'fitted'})
+
+
+
+def dashboard_parts(user):
+    """The dashboard's independent queries; each callable can run on its own connection"""
+    week_ago = timezone.localdate() - timedelta(days=7)
+    return {
+        # Daily and weekly totals come from the rollups, one row per day
+        'profit_by_day': lambda: list(DailyProfitRollup.objects.filter(
+            user = user,
+            day__gte = week_ago
+        ).values('day').annotate(
+            profit = Sum('profit'),
+            revenue = Sum('revenue'),
+            batches = Sum('batches_depleted')
+        ).order_by()),
+        'alerts': lambda: list(triggered_alerts(user).values(
+            'product__name', 'last_evaluated_stock', 'threshold_quantity'
+        )),
+        'names': lambda: dict(Product.objects.filter(user = user).values_list('id', 'name')),
+        'batches': lambda: user_batches(user),
+        'active_batches': lambda: list(StockBatch.objects.filter(
+            product__user = user,
+            is_depleted = False,
+            remaining_quantity__gt = 0).values('id', 'remaining_quantity', 'product__name')),
+    }
+
+
+def dashboard_payload(user, parts):
+    today = timezone.localdate()
+    week_ago = today - timedelta(days=7)
+    week_days = [week_ago + timedelta(days=i) for i in range(7)]
+
+    by_day = {row['day']: row for row in parts['profit_by_day']}
+    this_week = list(by_day.values())
+    today_row = by_day.get(today, {})
+
+    weekly_data = [{
+        'day': day.strftime('%a'),
+        'profit': by_day[day]['profit'] if day in by_day else Decimal('0')
+    } for day in week_days]
+
+    # Low stock alerts
+    alerts = [{
+        'product': row['product__name'],
+        'remaining': float(row['last_evaluated_stock']),
+        'threshold': float(row['threshold_quantity'])
+    } for row in parts['alerts']]
+
+    # Fast and slow movers by average batch velocity, and average turnover
+    movers = ranked_movers(product_stats(parts['batches']), parts['names'])
+    fast_movers = [
+        {'product': r['product_name'], 'velocity': round(r['velocity'], 2)}
+        for r in movers[:3]
+    ]
+    slow_movers = [
+        {'product': r['product_name'], 'velocity': round(r['velocity'], 2)}
+        for r in movers[-3:]
+    ]
+    depleted_count = sum(r['batches'] for r in movers)
+    avg_turnover = sum(r['turnover'] * r['batches'] for r in movers) / depleted_count if depleted_count else 0
+
+    return {
+        'user': {
+            'first_name': user.first_name,
+            'username': user.username
+        },
+        'daily_profit': today_row.get('profit') or 0,
+        'stock_depleted': today_row.get('batches') or 0,
+        'low_stock_alerts': alerts,
+        'income_this_week': sum((row['revenue'] for row in this_week), Decimal('0')),
+        'fast_movers': fast_movers,
+        'slow_movers': slow_movers,
+        'weekly_summary': weekly_data,
+        'total_profit_week': sum((row['profit'] for row in this_week), Decimal('0')),
+        'avg_stock_turnover': round(avg_turnover, 1),
+        'active_batches': parts['active_batches']
+    }
 
 
 class DashboardViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
+    @tenant_conditional
+    @tenant_cached('dashboard')
     def list(self, request):
         user = request.user
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-
-        profit_expr = ExpressionWrapper(
-            (F('quantity') - F('remaining_quantity')) *
-            (F('sell_price_per_unit') - F('buy_price_per_unit')),
-            output_field=DecimalField(max_digits=20, decimal_places=2)
-        )
-
-        depleted_qs = StockBatch.objects.filter(
-            product__user = user,
-            is_depleted = True
-        )
+        return Response(dashboard_payload(user, run_parts(dashboard_parts(user))))
 
-        # Daily profit from stock depleted today
-        daily_profit = depleted_qs.filter(
-            depleted_at__date = today
-        ).aggregate(
-            total = Sum(profit_expr)
-        )['total'] or 0
 
-        # Stock depleted count today
-        depleted_count = depleted_qs.filter(
-            depleted_at__date = today
-        ).count()
-
-        
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        return Response(cache_stats())
 
-        # Low stock alerts
-        alerts = []
-        products = Product.objects.filter(user = user, is_active = True)
-        for product in products:
-            try:
-                if product.alert.is_active and product.alert.is_triggered:
-                    alerts.append({
-                        'product': product.name,
-                        'remaining': float(product.current_stock()),
-                        'threshold': float(product.alert.threshold_quantity)
-                    })
-            except LowStockAlert.DoesNotExist:
-                pass
-
-        # Weekly income
-        weekly_income = depleted_qs.filter(
-            depleted_at__date__gte = week_ago
-        ).aggregate(
-            total = Sum(F('quantity') * F('sell_price_per_unit'))
-        )['total'] or 0
-
-        # Weekly profit
-        weekly_profit = depleted_qs.filter(
-            depleted_at__date__gte = week_ago
-        ).aggregate(
-            total = Sum(profit_expr)
-            )['total'] or 0
-        
 
-        # weekly summary
-        daily_rows = depleted_qs.filter(
-            depleted_at__date__gte = week_ago
-        ).annotate(
-            day = TruncDate('depleted_at')
-        ).values('day').annotate(
-            profit=Sum(profit_expr)
-        ).order_by('day')
-
-        profit_by_day ={row['day']: row['profit'] for row in daily_rows}
-        weekly_data = []
-        for i in range(7):
-            day = week_ago + timedelta(days=i)
-            weekly_data.append({
-                'day': day.strftime('%a'),
-                'profit': profit_by_day.get(day, Decimal('0'))
-            })
-
-        velocity_rows = depleted_qs.values(
-            'product__name', 'added_at', 'depleted_at'
-        ).annotate(
-            sold=ExpressionWrapper(
-                F('quantity') - F('remaining_quantity'),
-                output_field=DecimalField(max_digits=20, decimal_places=2)
-            )
-        )
-
-        product_velocity_map = {}
-        turnover_days = []
-
-        for row in velocity_rows:
-            delta = row['depleted_at'] - row['added_at']
-            days = max(delta.days, 1)
-            turnover_days.append(days)
-            vel = float(row['sold']) / days
-            name = row['product__name']
-            if name not in product_velocity_map:
-                product_velocity_map[name] = []
-            product_velocity_map[name].append(vel)
-
-        
-        avg_turnover = sum(turnover_days) / len(turnover_days) if turnover_days else 0
-        avg_velocities = {
-            name: sum(vels) / len(vels)
-            for name, vels in product_velocity_map.items()
-        }
-
-        sorted_products = sorted(avg_velocities.items(), key=lambda x: x[1], reverse=True)
-        fast_movers = [
-            {'product': name, 'velocity': round(vel, 2)}
-            for name, vel in sorted_products[:3]
-        ]
-
-        slow_movers = [
-            {'product': name, 'velocity': round(vel, 2)}
-            for name, vel in sorted_products[-3:]
-        ]
+class EventTicketView(APIView):
+    permission_classes = [IsAuthenticated]
 
+    def post(self, request):
+        # The stream ends when the access token this request came with expires
+        if isinstance(request.auth, AccessToken):
+            expires_at = request.auth['exp']
+        else:
+            expires_at = timezone.now().timestamp() + jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+        return Response({'ticket': issue_ticket(request.user.pk, expires_at), 'expires_in': ticket_age()})
 
 
-        # Active batches
-        active_batches = StockBatch.objects.filter(
-            product__user = user,
-            is_depleted = False,
-            remaining_quantity__gt = 0).values('id', 'remaining_quantity', 'product__name')
-
-
-        data = {
-            'user': {
-                'first_name': user.first_name,
-                'username': user.username
-            },
-            'daily_profit': daily_profit,
-            'stock_depleted': depleted_count,
-            'low_stock_alerts': alerts,
-            'income_this_week': weekly_income,
-            'fast_movers': fast_movers,
-            'slow_movers': slow_movers,
-            'weekly_summary': weekly_data,
-            'total_profit_week': weekly_profit,
-            'avg_stock_turnover': round(avg_turnover, 1),
-            'active_batches': list(active_batches)
-        }
+class RequestMetricsView(APIView):
+    permission_classes = [IsAdminUser]
 
-        return Response(data)
+    def get(self, request):
+        return Response(request_metrics())
 
+    def delete(self, request):
+        reset_request_metrics()
+        return Response(status=status.HTTP_204_NO_CONTENT)
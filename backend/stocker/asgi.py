@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stocker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; the event stream is served outside the
+# request/response cycle so a long-lived connection does not hold a worker thread
+from inventory.sse import EventStream  # noqa: E402
+
+EVENT_STREAM_PATH = '/api/events/'
+event_stream = EventStream()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == EVENT_STREAM_PATH:
+        await event_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
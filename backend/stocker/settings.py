@@ -75,10 +75,70 @@ DATABASES = {
         'PASSWORD': os.getenv("DB_PASSWORD", ""),
         'HOST': os.getenv("DB_HOST", ""),
         'PORT': os.getenv("DB_PORT", ""),
-        
+        # A file-based test database lets the threaded depletion stress test run on SQLite
+        'TEST': {
+            'NAME': os.getenv("DB_TEST_NAME") or None,
+        },
+    }
+}
+
+
+# Cache
+# Dashboard, report and insight payloads are cached per tenant once
+# CACHE_BACKEND points at a backend every worker shares, e.g.
+# django.core.cache.backends.redis.RedisCache. The tenant data versions live
+# there too, so response caching, ETags and report snapshots are all off with
+# the per-process default.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': os.getenv("CACHE_LOCATION", "stocker"),
     }
 }
 
+INVENTORY_CACHE_ALIAS = 'default'
+INVENTORY_CACHE_TIMEOUT = int(os.getenv("INVENTORY_CACHE_TIMEOUT", "300"))
+INVENTORY_FORECAST_TIMEOUT = int(os.getenv("INVENTORY_FORECAST_TIMEOUT", "86400"))
+# Dotted path of the broker fanning change events out to /api/events/ streams. LocalBroker only
+# reaches streams served by the process that made the change: with more than one worker, clients
+# miss events unless this points at a broker every worker shares
+INVENTORY_EVENT_BROKER = os.getenv("INVENTORY_EVENT_BROKER", "inventory.events.LocalBroker")
+# Seconds a stream ticket from POST /api/events/ticket/ may wait before it opens /api/events/
+INVENTORY_STREAM_TICKET_AGE = int(os.getenv("INVENTORY_STREAM_TICKET_AGE", "30"))
+# Let the async views run their independent queries on separate connections at once
+INVENTORY_ASYNC_PARALLEL_QUERIES = os.getenv("INVENTORY_ASYNC_PARALLEL_QUERIES", "true").lower() == "true"
+# Serve the by-product, monthly and insight reports from the snapshots the precompute_reports
+# worker writes; one outdated by at most INVENTORY_SNAPSHOT_MAX_STALENESS seconds is still served
+INVENTORY_REPORT_SNAPSHOTS = os.getenv("INVENTORY_REPORT_SNAPSHOTS", "false").lower() == "true"
+INVENTORY_SNAPSHOT_MAX_STALENESS = int(os.getenv("INVENTORY_SNAPSHOT_MAX_STALENESS", "0"))
+# Range-partition the depletion and movement history by month on Postgres (migration 0009, or
+# create_partitions --convert later); create_partitions must then run monthly to add partitions ahead
+INVENTORY_PARTITION_HISTORY = os.getenv("INVENTORY_PARTITION_HISTORY", "false").lower() == "true"
+
+# Per-request query count, DB time and latency, served at /api/_metrics/; wraps every query, so opt in
+INVENTORY_REQUEST_METRICS = os.getenv("INVENTORY_REQUEST_METRICS", "false").lower() == "true"
+if INVENTORY_REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'inventory.metrics.QueryMetricsMiddleware')
+# Most queries a request to each route may run, whatever the tenant's size; over budget logs a
+# warning, or raises QueryBudgetExceeded with INVENTORY_QUERY_BUDGET_STRICT (QueryBudgetTest does)
+INVENTORY_QUERY_BUDGETS = {
+    'product-list': {'queries': 3, 'duplicates': 0},
+    'batch-list': {'queries': 2, 'duplicates': 0},
+    'batch-active': {'queries': 2, 'duplicates': 0},
+    'dashboard-list': {'queries': 6, 'duplicates': 0},
+    'report-list': {'queries': 5, 'duplicates': 0},
+    'report-by-product': {'queries': 2, 'duplicates': 0},
+    'report-monthly': {'queries': 2, 'duplicates': 0},
+    'report-history': {'queries': 2, 'duplicates': 0},
+    'report-valuation': {'queries': 4, 'duplicates': 0},
+    'insight-list': {'queries': 8, 'duplicates': 0},
+    'insight-velocity': {'queries': 3, 'duplicates': 0},
+    'insight-forecast': {'queries': 5, 'duplicates': 0},
+    'alert-list': {'queries': 2, 'duplicates': 0},
+    'alert-triggered': {'queries': 2, 'duplicates': 0},
+}
+INVENTORY_QUERY_BUDGET_STRICT = False
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
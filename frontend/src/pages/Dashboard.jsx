@@ -1,7 +1,7 @@
 import { Package, AlertTriangle, Plus } from "lucide-react";
 import React, { useState, useEffect} from "react";
 import { ResponsiveContainer, BarChart, Bar, XAxis, YAxis, Tooltip } from "recharts";
-import api from "../services/api";
+import api, { subscribeToEvents } from "../services/api";
 import AddStockModal from "../components/AddStockModal";
 import DepletionModal from "../components/DepletionModal";
 
@@ -16,6 +16,57 @@ const Dashboard = () => {
         fetchDashboard();
     }, [])
 
+    // Patch the dashboard from live change events instead of re-fetching it
+    useEffect(() => {
+        let connected = false;
+        const today = new Date().toLocaleDateString('en-CA');
+        const patch = (update) => setDashData((data) => data && { ...data, ...update(data) });
+
+        return subscribeToEvents({
+            // A reconnect may have missed events, so resync once
+            ready: () => {
+                if (connected) fetchDashboard();
+                connected = true;
+            },
+            'batch.added': (e) => patch((data) => ({
+                active_batches: [...(data.active_batches || []), {
+                    id: e.batch_id, remaining_quantity: e.remaining_quantity, product__name: e.product
+                }]
+            })),
+            'batch.updated': (e) => patch((data) => ({
+                active_batches: (data.active_batches || []).map((b) =>
+                    b.id === e.batch_id ? { ...b, remaining_quantity: e.remaining_quantity } : b)
+            })),
+            'batch.depleted': (e) => patch((data) => ({
+                active_batches: (data.active_batches || []).filter((b) => b.id !== e.batch_id)
+            })),
+            'alert.triggered': (e) => patch((data) => ({
+                low_stock_alerts: [
+                    { product: e.product, remaining: Number(e.remaining), threshold: Number(e.threshold) },
+                    ...(data.low_stock_alerts || []).filter((a) => a.product !== e.product)
+                ]
+            })),
+            'alert.cleared': (e) => patch((data) => ({
+                low_stock_alerts: (data.low_stock_alerts || []).filter((a) => a.product !== e.product)
+            })),
+            'profit.updated': (e) => patch((data) => {
+                const date = new Date(`${e.day}T00:00:00`);
+                const weekday = date.toLocaleDateString('en-US', { weekday: 'short' });
+                const isToday = e.day === today;
+                // Edits to older history do not move this week's figures
+                if (Date.now() - date.getTime() > 8 * 24 * 60 * 60 * 1000) return {};
+                return {
+                    daily_profit: Number(data.daily_profit || 0) + (isToday ? Number(e.profit) : 0),
+                    stock_depleted: (data.stock_depleted || 0) + (isToday ? e.batches : 0),
+                    income_this_week: Number(data.income_this_week || 0) + Number(e.revenue),
+                    total_profit_week: Number(data.total_profit_week || 0) + Number(e.profit),
+                    weekly_summary: (data.weekly_summary || []).map((d) =>
+                        d.day === weekday ? { ...d, profit: Number(d.profit) + Number(e.profit) } : d)
+                };
+            })
+        });
+    }, [])
+
     const fetchDashboard = async () => {
         try {
             const response = await api.get('/dashboard/');
@@ -1,6 +1,6 @@
 import { useState ,useEffect, useCallback } from "react";
 import { Plus, Search, Filter, Package, TrendingDown, CheckCircle, Clock, ChevronDown } from 'lucide-react';
-import api from "../services/api";
+import api, { fetchAllPages } from "../services/api";
 import AddStockModal from "../components/AddStockModal";
 import DepletionModal from "../components/DepletionModal";
 
@@ -67,13 +67,13 @@ const Stock = () => {
             if (filterStatus === "depleted") params.is_depleted = "true";
 
 
-        const [batchRes, productRes, reportRes] = await Promise.all([
-            api.get("/batches/", {params}),
+        const [batchRows, productRes, reportRes] = await Promise.all([
+            fetchAllPages("/batches/", params),
             api.get("/products/"),
             api.get("/reports/"),
         ]);
 
-        setBatches(batchRes.data.results || batchRes.data);
+        setBatches(batchRows);
         setProducts(productRes.data.results || productRes.data);
         setStats(reportRes.data)
     } catch (error) {
@@ -66,9 +66,62 @@ export const login = async (username, password) => {
     return response.data;
 };
 
+// Follow cursor pagination and return every row
+export const fetchAllPages = async (url, params = {}) => {
+    const rows = [];
+    let response = await api.get(url, { params: { ...params, page_size: 500 } });
+    rows.push(...(response.data.results || response.data));
+    while (response.data.next) {
+        response = await api.get(response.data.next);
+        rows.push(...response.data.results);
+    }
+    return rows;
+};
+
 export const logout = () => {
     localStorage.removeItem('access_token');
     localStorage.removeItem('refresh_token');
 };
 
-export default api
\ No newline at end of file
+// Stream the tenant's change events (server-sent events); returns a function that closes the stream.
+// EventSource cannot send the token header, so each connection uses a short-lived single-use ticket,
+// and the server ends the stream with an expired event when the access token runs out
+export const subscribeToEvents = (handlers) => {
+    let source = null;
+    let closed = false;
+    let delay = 1000;
+
+    // Tickets are single-use, so every reconnect needs a new one; the
+    // browser's own retry would replay the spent ticket and get a 401.
+    const reconnect = (wait) => {
+        if (source) source.close();
+        if (closed) return;
+        setTimeout(() => connect().catch(retry), wait);
+    };
+    const retry = () => {
+        reconnect(delay);
+        delay = Math.min(delay * 2, 30000);
+    };
+
+    const connect = async () => {
+        const response = await api.post('/events/ticket/');
+        if (closed) return;
+        source = new EventSource(`${API_BASE_URL}/events/?ticket=${encodeURIComponent(response.data.ticket)}`);
+        Object.entries(handlers).forEach(([type, handler]) => {
+            source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+        });
+        source.addEventListener('ready', () => {
+            delay = 1000;
+        });
+        source.addEventListener('expired', () => reconnect(0));
+        source.addEventListener('error', retry);
+    };
+
+    connect().catch(retry);
+    return () => {
+        closed = true;
+        if (source) source.close();
+    };
+};
+
+export default api